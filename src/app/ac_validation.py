@@ -1,5 +1,5 @@
-from pydantic import ConfigDict, BaseModel, field_validator
-from typing import Literal, Dict
+from pydantic import ConfigDict, BaseModel, Discriminator, Tag, field_validator
+from typing import Annotated, Any, Literal, Dict, Union
 from app.security import decode_access_token
 
 
@@ -42,6 +42,34 @@ class ACIdentityPolicy(ACPolicy):
     statements: Dict[str, ACIdentityStatement] = {}
 
 
+def policy_kind(policy: dict | BaseModel) -> str:
+    """
+    The two kinds of policies have the same fields but the principal of the statements, which is implicit in identity
+    policies: a policy is a resource policy when one of its statements names a principal
+    :param policy:
+    :return:
+    """
+    if isinstance(policy, BaseModel):
+        policy = policy.model_dump()
+    statements = policy.get("statements", None) or {}
+    if any(
+        isinstance(statement, dict) and "principal" in statement
+        for statement in statements.values()
+    ):
+        return "resource"
+    return "identity"
+
+
+# A smart union would take every identity policy for a resource policy, since the principal has a default
+PolicyTransaction = Annotated[
+    Union[
+        Annotated[ACResourcePolicy, Tag("resource")],
+        Annotated[ACIdentityPolicy, Tag("identity")],
+    ],
+    Discriminator(policy_kind),
+]
+
+
 class Transaction(BaseModel):
     model_config = ConfigDict(extra="forbid")
     data: list[str | bytes | int] | str
@@ -64,12 +92,52 @@ class Client(BaseModel):
     port: str
 
 
+class InputBlockBody(BaseModel):
+    resource_policies: dict[str, dict]
+    identity_policies: dict[str, dict[str, dict]]
+    contract_header: dict
+    events: dict
+
+
 class InputBlock(BaseModel):
-    transactions: list[Transaction]
     index: int
-    timestamp: str
+    timestamp: str | float
+    previous_hash: str
+    proof: int
+    target: int | None = None
+    signer: str | None = None
+    signature: str | None = None
+    merkle_root: str | None = None
+    body_hash: str | None = None
+    body: InputBlockBody
+
+
+class CompactBlock(BaseModel):
+    index: int
+    timestamp: str | float
     previous_hash: str
     proof: int
+    target: int | None = None
+    signer: str | None = None
+    signature: str | None = None
+    merkle_root: str | None = None
+    body_hash: str | None = None
+    hash: str
+    resource_policies: list[tuple[str, str]]  # (policy key, short id)
+    identity_policies: list[tuple[str, str, str]]  # (user id, policy key, short id)
+    contract_header: dict
+    events: dict
+    # short id -> policy, for the ones a peer was missing
+    transactions: dict[str, dict] = {}
+
+
+class StreamFrame(BaseModel):
+    type: str
+    id: int
+    payload: Any = None
+    # How many nodes the transactions have gone through, and the first height of the headers asked for
+    hops: int = 0
+    start: int = 0
 
 
 class ChallengeRequest(BaseModel):
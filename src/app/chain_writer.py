@@ -0,0 +1,256 @@
+"""This module contains the single writer of the chain. Every change to the chain, to the mem pool entries it confirms
+and to the cache of the policies goes through a queue of commands run one at a time, so that a change that spans an
+await, such as mining a block while the proof of work is computed in a worker thread, is never interleaved with
+another one.
+The readers do not go through the queue: after each command that changed something the writer publishes an
+immutable snapshot of the chain and of the policies, read-copy-update style, and the readers use the last one
+published. Reads never wait for a write, and they never see a write half applied.
+Commands must not hold the queue for long: slow work, such as a proof of work, is done before submitting the command
+that applies its result.
+"""
+
+import asyncio
+import inspect
+from collections.abc import Sequence
+from logging import Logger
+from types import MappingProxyType
+from typing import Awaitable, Callable, TypeVar
+
+from blockchain.ac_block import ACBlock
+from blockchain.ac_blockchain import ACBlockchain
+
+T = TypeVar("T")
+
+
+class ChainView(Sequence):
+    """
+    The first length blocks of a list that is only ever appended to, so that the snapshots of a growing chain share
+    their blocks instead of copying them
+    """
+
+    def __init__(self, blocks: list[ACBlock], length: int):
+        self.blocks = blocks
+        self.length = length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.blocks[i] for i in range(*index.indices(self.length))]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        return self.blocks[index]
+
+    def __len__(self) -> int:
+        return self.length
+
+
+class ChainSnapshot:
+    """
+    The chain and the policies as they were after a command. The blocks and the policies are shared with the writer,
+    which never changes them in place once they are published: blocks are not modified once appended and the policies
+    are replaced, not updated, by the cache.
+    """
+
+    def __init__(
+        self,
+        chain: ChainView,
+        blockchain: ACBlockchain,
+        resource_policies: MappingProxyType,
+        identity_policies: MappingProxyType,
+        version: int,
+    ):
+        self.version = version
+        self.chain = chain
+        self.difficulty = blockchain.difficulty
+        self.consensus = blockchain.consensus.to_dict()
+        self.work = blockchain.cumulative_work()
+        self.resource_policies = resource_policies
+        self.identity_policies = identity_policies
+
+    @property
+    def tip(self) -> ACBlock:
+        return self.chain[-1]
+
+
+class ChainWriter:
+    """
+    The commands wait in a queue of at most max_pending commands, the callers submitting past it wait for room. The
+    task that runs them is started on the first command, in the event loop of the caller.
+    A snapshot costs only the blocks added since the previous one, and the policies are copied only when they have
+    changed, which the cache reports through policies_changed.
+    """
+
+    def __init__(
+        self,
+        get_blockchain: Callable[[], ACBlockchain],
+        resource_policies: dict,
+        identity_policies: dict,
+        logger: Logger,
+        max_pending: int = 1000,
+    ):
+        """
+        :param get_blockchain: Returns the chain, which may be swapped by consensus
+        :param resource_policies: The cache of the resource policies the commands keep in step with the chain
+        :param identity_policies: The cache of the identity policies
+        """
+        self.get_blockchain = get_blockchain
+        self.resource_policies = resource_policies
+        self.identity_policies = identity_policies
+        self.logger = logger
+        self.max_pending = max_pending
+        self.queue: asyncio.Queue | None = None
+        self.task: asyncio.Task | None = None
+        self.snapshot: ChainSnapshot | None = None
+        self.version = 0
+        # The blocks shared by the published views, and whether the policies changed since they were copied
+        self._blocks: list[ACBlock] = []
+        self._policies_changed = True
+        self._stats = {"commands": 0, "failures": 0}
+        # Notified after each publish, created in the loop of the first reader that waits for a change
+        self._changed: asyncio.Condition | None = None
+        self._changed_loop: asyncio.AbstractEventLoop | None = None
+
+    def policies_changed(self, height: int | None = None) -> None:
+        self._policies_changed = True
+
+    def _chain_view(self, chain: list[ACBlock]) -> ChainView:
+        blocks = self._blocks
+        common = min(len(blocks), len(chain))
+        while common and blocks[common - 1] is not chain[common - 1]:
+            common -= 1
+        if len(chain) > common:
+            if common < len(blocks):
+                # The blocks past the fork are still read through the older views, the new ones get a list of their own
+                blocks = blocks[:common]
+            blocks.extend(chain[common:])
+            self._blocks = blocks
+        return ChainView(blocks, len(chain))
+
+    def publish(self) -> ChainSnapshot:
+        """
+        Publishes the snapshot of the current state, the readers pick it up with their next request. Nothing is
+        published when neither the chain nor the policies have changed.
+        :return:
+        """
+        blockchain = self.get_blockchain()
+        previous = self.snapshot
+        if (
+            previous is not None
+            and not self._policies_changed
+            and len(previous.chain) == len(blockchain.chain)
+            and previous.tip is blockchain.chain[-1]
+        ):
+            return previous
+        if previous is None or self._policies_changed:
+            resource_policies = MappingProxyType(dict(self.resource_policies))
+            identity_policies = MappingProxyType(
+                {
+                    user_id: MappingProxyType(dict(policies))
+                    for user_id, policies in self.identity_policies.items()
+                }
+            )
+            self._policies_changed = False
+        else:
+            resource_policies = previous.resource_policies
+            identity_policies = previous.identity_policies
+        self.version += 1
+        self.snapshot = ChainSnapshot(
+            self._chain_view(blockchain.chain),
+            blockchain,
+            resource_policies,
+            identity_policies,
+            self.version,
+        )
+        self._notify_changed()
+        return self.snapshot
+
+    def _notify_changed(self) -> None:
+        condition, loop = self._changed, self._changed_loop
+        if condition is None or loop.is_closed():
+            return
+
+        async def notify():
+            async with condition:
+                condition.notify_all()
+
+        asyncio.run_coroutine_threadsafe(notify(), loop)
+
+    async def wait_for_change(self, version: int, timeout: float) -> ChainSnapshot:
+        """
+        Waits until a snapshot newer than the given version is published, without polling the writer
+        :param version: The version of the last snapshot the caller has read
+        :param timeout: How long to wait at most, in seconds
+        :return: The last snapshot published, which is the same one on timeout
+        """
+        loop = asyncio.get_running_loop()
+        if self._changed is None or self._changed_loop is not loop:
+            self._changed = asyncio.Condition()
+            self._changed_loop = loop
+        condition = self._changed
+        async with condition:
+            try:
+                await asyncio.wait_for(
+                    condition.wait_for(lambda: self.read().version > version),
+                    max(timeout, 0.0),
+                )
+            except TimeoutError:
+                pass
+        return self.read()
+
+    def read(self) -> ChainSnapshot:
+        if self.snapshot is None:
+            return self.publish()
+        return self.snapshot
+
+    async def submit(self, command: Callable[..., T | Awaitable[T]], *args) -> T:
+        """
+        Runs a command once the ones submitted before it have been run
+        :param command: A function or a coroutine function that changes the state
+        :param args: The arguments of the command
+        :return: What the command returns, or raises what it raises
+        """
+        if self.task is None or self.task.done() or not self._owned_by_running_loop():
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((command, args, future))
+        return await future
+
+    def _owned_by_running_loop(self) -> bool:
+        return self.task.get_loop() is asyncio.get_running_loop()
+
+    def start(self) -> None:
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+        self.task = asyncio.get_running_loop().create_task(self._run(self.queue))
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        while True:
+            command, args, future = await queue.get()
+            if future.cancelled():
+                continue
+            try:
+                result = command(*args)
+                if inspect.isawaitable(result):
+                    result = await result
+            except Exception as e:
+                self._stats["failures"] += 1
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            finally:
+                self._stats["commands"] += 1
+                self.publish()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.task is not None and not self.task.done(),
+            "pending": 0 if self.queue is None else self.queue.qsize(),
+            "version": self.version,
+            **self._stats,
+        }
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
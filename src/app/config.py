@@ -3,6 +3,7 @@ This file will contain all the settings of the application that will be validate
 """
 
 from enum import StrEnum
+from typing import Literal
 from pydantic_settings import BaseSettings
 from pydantic import Field, field_validator
 import os
@@ -17,7 +18,58 @@ class Settings(BaseSettings):
     node_role: str
     port: int = Field(ge=8000, lt=9000)
     chain_difficulty: int = Field(lt=10)
+    retarget_interval: int | None = Field(gt=0, default=None)
+    block_interval_s: float = Field(gt=0, default=10.0)
+    block_max_drift_s: float = Field(gt=0, default=120.0)
+    consensus: Literal["pow", "poa"] = "pow"
+    poa_authorities: list[str] | str = None
+    max_reorg_depth: int = Field(gt=0, default=100)
+    checkpoint_keys: list[str] | str = None
+    checkpoint_confirmations: int = Field(ge=0, default=6)
     peers: list[str] | str = None
+    validation_workers: int = Field(ge=1, default=1)
+    mempool_max_count: int | None = Field(gt=0, default=None)
+    mempool_max_bytes: int | None = Field(gt=0, default=None)
+    mempool_eviction: Literal["oldest", "reject"] = "oldest"
+    max_policy_batch: int = Field(gt=0, default=10000)
+    gossip_fanout: int | None = Field(gt=0, default=None)
+    gossip_max_hops: int = Field(ge=0, default=3)
+    gossip_seen_ttl_s: float = Field(gt=0, default=300)
+    gossip_seen_max_entries: int = Field(gt=0, default=100000)
+    gossip_use_bloom: bool = False
+    outbound_max_pending: int = Field(gt=0, default=1000)
+    outbound_max_pending_blocks: int = Field(gt=0, default=16)
+    outbound_batch_size: int = Field(gt=0, default=500)
+    outbound_timeout_s: float = Field(gt=0, default=1.0)
+    outbound_resync_timeout_s: float = Field(gt=0, default=30.0)
+    outbound_max_failures: int = Field(gt=0, default=5)
+    peer_streaming: bool = False
+    peer_ping_interval_s: float | None = Field(gt=0, default=20.0)
+    peer_min_timeout_s: float = Field(gt=0, default=0.2)
+    peer_max_timeout_s: float = Field(gt=0, default=2.5)
+    peer_backoff_base_s: float = Field(gt=0, default=1.0)
+    peer_backoff_max_s: float = Field(gt=0, default=60.0)
+    block_max_count: int | None = Field(gt=0, default=1000)
+    block_max_bytes: int | None = Field(gt=0, default=1000000)
+    auto_mine: bool = False
+    auto_mine_max_count: int | None = Field(gt=0, default=100)
+    auto_mine_max_bytes: int | None = Field(gt=0, default=1000000)
+    auto_mine_max_age_s: float | None = Field(gt=0, default=10.0)
+    replica_max_lag_s: float = Field(ge=0, default=5.0)
+    replica_max_lag_blocks: int = Field(ge=0, default=0)
+    replica_wait_s: float = Field(ge=0, le=30, default=10.0)
+    policy_deltas_max_blocks: int = Field(gt=0, default=100)
+    forwarder_strategy: Literal["round_robin", "least_load"] = "least_load"
+    forwarder_batch_size: int = Field(gt=0, default=500)
+    forwarder_linger_s: float = Field(ge=0, default=0.05)
+    forwarder_max_pending: int = Field(gt=0, default=10000)
+    forwarder_max_wait_s: float = Field(ge=0, default=1.0)
+    forwarder_max_attempts: int = Field(gt=0, default=3)
+    idempotency_ttl_s: float = Field(gt=0, default=300)
+    idempotency_max_entries: int = Field(gt=0, default=10000)
+    policy_snapshot_path: str | None = None
+    snapshot_reader: bool = False
+    chain_writer_max_pending: int = Field(gt=0, default=1000)
 
     @field_validator("node_role")
     def check_role_is_valid(cls, v):
@@ -26,8 +78,8 @@ class Settings(BaseSettings):
             return v
         raise ValueError(f"This role is not valid! Allowed roles are: {roles}")
 
-    @field_validator("peers", mode="after")
-    def make_peer_list(cls, v):
+    @field_validator("peers", "poa_authorities", "checkpoint_keys", mode="after")
+    def make_list(cls, v):
         if v:
             return v.replace('"', "").split(sep=",")
         else:
@@ -38,5 +90,56 @@ settings = Settings(
     node_role=os.environ.get("NODE_ROLE", "publisher"),
     port=os.environ.get("PORT", 8000),
     chain_difficulty=os.environ.get("CHAIN_DIFFICULTY", 3),
+    retarget_interval=os.environ.get("RETARGET_INTERVAL", None),
+    block_interval_s=os.environ.get("BLOCK_INTERVAL_S", 10.0),
+    block_max_drift_s=os.environ.get("BLOCK_MAX_DRIFT_S", 120.0),
+    consensus=os.environ.get("CONSENSUS", "pow"),
+    poa_authorities=os.environ.get("POA_AUTHORITIES", ""),
+    max_reorg_depth=os.environ.get("MAX_REORG_DEPTH", 100),
+    checkpoint_keys=os.environ.get("CHECKPOINT_KEYS", ""),
+    checkpoint_confirmations=os.environ.get("CHECKPOINT_CONFIRMATIONS", 6),
     peers=os.environ.get("PEERS", ""),
+    validation_workers=os.environ.get("VALIDATION_WORKERS", 1),
+    mempool_max_count=os.environ.get("MEMPOOL_MAX_COUNT", None),
+    mempool_max_bytes=os.environ.get("MEMPOOL_MAX_BYTES", None),
+    mempool_eviction=os.environ.get("MEMPOOL_EVICTION", "oldest"),
+    max_policy_batch=os.environ.get("MAX_POLICY_BATCH", 10000),
+    gossip_fanout=os.environ.get("GOSSIP_FANOUT", None),
+    gossip_max_hops=os.environ.get("GOSSIP_MAX_HOPS", 3),
+    gossip_seen_ttl_s=os.environ.get("GOSSIP_SEEN_TTL_S", 300),
+    gossip_seen_max_entries=os.environ.get("GOSSIP_SEEN_MAX_ENTRIES", 100000),
+    gossip_use_bloom=os.environ.get("GOSSIP_USE_BLOOM", False),
+    outbound_max_pending=os.environ.get("OUTBOUND_MAX_PENDING", 1000),
+    outbound_max_pending_blocks=os.environ.get("OUTBOUND_MAX_PENDING_BLOCKS", 16),
+    outbound_batch_size=os.environ.get("OUTBOUND_BATCH_SIZE", 500),
+    outbound_timeout_s=os.environ.get("OUTBOUND_TIMEOUT_S", 1.0),
+    outbound_resync_timeout_s=os.environ.get("OUTBOUND_RESYNC_TIMEOUT_S", 30.0),
+    outbound_max_failures=os.environ.get("OUTBOUND_MAX_FAILURES", 5),
+    peer_streaming=os.environ.get("PEER_STREAMING", False),
+    peer_ping_interval_s=os.environ.get("PEER_PING_INTERVAL_S", 20.0),
+    peer_min_timeout_s=os.environ.get("PEER_MIN_TIMEOUT_S", 0.2),
+    peer_max_timeout_s=os.environ.get("PEER_MAX_TIMEOUT_S", 2.5),
+    peer_backoff_base_s=os.environ.get("PEER_BACKOFF_BASE_S", 1.0),
+    peer_backoff_max_s=os.environ.get("PEER_BACKOFF_MAX_S", 60.0),
+    block_max_count=os.environ.get("BLOCK_MAX_COUNT", 1000),
+    block_max_bytes=os.environ.get("BLOCK_MAX_BYTES", 1000000),
+    auto_mine=os.environ.get("AUTO_MINE", False),
+    auto_mine_max_count=os.environ.get("AUTO_MINE_MAX_COUNT", 100),
+    auto_mine_max_bytes=os.environ.get("AUTO_MINE_MAX_BYTES", 1000000),
+    auto_mine_max_age_s=os.environ.get("AUTO_MINE_MAX_AGE_S", 10.0),
+    replica_max_lag_s=os.environ.get("REPLICA_MAX_LAG_S", 5.0),
+    replica_max_lag_blocks=os.environ.get("REPLICA_MAX_LAG_BLOCKS", 0),
+    replica_wait_s=os.environ.get("REPLICA_WAIT_S", 10.0),
+    policy_deltas_max_blocks=os.environ.get("POLICY_DELTAS_MAX_BLOCKS", 100),
+    forwarder_strategy=os.environ.get("FORWARDER_STRATEGY", "least_load"),
+    forwarder_batch_size=os.environ.get("FORWARDER_BATCH_SIZE", 500),
+    forwarder_linger_s=os.environ.get("FORWARDER_LINGER_S", 0.05),
+    forwarder_max_pending=os.environ.get("FORWARDER_MAX_PENDING", 10000),
+    forwarder_max_wait_s=os.environ.get("FORWARDER_MAX_WAIT_S", 1.0),
+    forwarder_max_attempts=os.environ.get("FORWARDER_MAX_ATTEMPTS", 3),
+    idempotency_ttl_s=os.environ.get("IDEMPOTENCY_TTL_S", 300),
+    idempotency_max_entries=os.environ.get("IDEMPOTENCY_MAX_ENTRIES", 10000),
+    policy_snapshot_path=os.environ.get("POLICY_SNAPSHOT_PATH", None),
+    snapshot_reader=os.environ.get("SNAPSHOT_READER", False),
+    chain_writer_max_pending=os.environ.get("CHAIN_WRITER_MAX_PENDING", 1000),
 )
@@ -4,16 +4,63 @@ This file contains global dependencies that are shared across all endpoints and
 """
 
 from blockchain.ac_blockchain import ACBlockchain
-from app.config import settings
+from blockchain.consensus import ConsensusEngine, ProofOfAuthority, ProofOfWork
+from blockchain.mempool import Mempool
+from blockchain.policy_journal import PolicyJournal
+from app.chain_writer import ChainWriter
+from app.config import NodeRole, settings
+from app.forwarder import IdempotencyCache, TransactionForwarder
+from app.gossip import SeenCache
+from app.miner import AutoMiner
+from app.outbound import OutboundScheduler
+from app.peers import PeerTable
+from app.replica import PolicyReplica
+from app.snapshot import PolicySnapshotReader, PolicySnapshotWriter
+from app.security import serialize_pk_hex, sign_message, verify_user_message
+from node import LightNode
 import logging
 from pathlib import Path
 
-blockchain = ACBlockchain(difficulty=settings.chain_difficulty)
 
-if not settings.peers:
-    peers = set(settings.peers)
-else:
-    peers = set()
+def create_mempool() -> Mempool:
+    return Mempool(
+        max_count=settings.mempool_max_count,
+        max_bytes=settings.mempool_max_bytes,
+        eviction=settings.mempool_eviction,
+    )
+
+
+def create_consensus() -> ConsensusEngine:
+    if settings.consensus == "poa":
+        # Without a configured set of authorities the node is the only one, which is handy for a single publisher
+        return ProofOfAuthority(
+            authorities=settings.poa_authorities or [serialize_pk_hex()],
+            verify=verify_user_message,
+            signer=serialize_pk_hex(),
+            sign=sign_message,
+        )
+    return ProofOfWork(
+        difficulty=settings.chain_difficulty,
+        retarget_interval=settings.retarget_interval,
+        block_interval_s=settings.block_interval_s,
+        max_drift_s=settings.block_max_drift_s,
+    )
+
+
+blockchain = ACBlockchain(
+    difficulty=settings.chain_difficulty,
+    mempool=create_mempool(),
+    consensus=create_consensus(),
+    max_reorg_depth=settings.max_reorg_depth,
+)
+
+peers = PeerTable(
+    settings.peers or (),
+    min_timeout_s=settings.peer_min_timeout_s,
+    max_timeout_s=settings.peer_max_timeout_s,
+    backoff_base_s=settings.peer_backoff_base_s,
+    backoff_max_s=settings.peer_backoff_max_s,
+)
 
 # assuming loglevel is bound to the string value obtained from the
 # command line argument. Convert to upper case to allow the user to
@@ -22,6 +69,8 @@ logger = logging.getLogger("logger")
 current_file = Path(__file__).resolve()
 project_root = current_file.parent
 log_file = project_root / "log" / "node.log"
+# The log directory is not part of the repository, it is created on the first run
+log_file.parent.mkdir(parents=True, exist_ok=True)
 # Clearing log file
 open(log_file, "w+").close()
 logging.basicConfig(
@@ -36,15 +85,173 @@ policies_cache = {}
 
 identity_policies_cache = {}
 
+# Hashes of the transactions already received through gossip
+seen_cache = SeenCache(
+    ttl_s=settings.gossip_seen_ttl_s,
+    max_entries=settings.gossip_seen_max_entries,
+    use_bloom=settings.gossip_use_bloom,
+)
+
+
+# The worker processes that only serve /authZ read the policies from the snapshot written by the process that owns
+# them, see snapshot.py
+snapshot_reader = (
+    PolicySnapshotReader(settings.policy_snapshot_path)
+    if settings.snapshot_reader and settings.policy_snapshot_path
+    else None
+)
+
 
 def get_identity_policies_cache():
+    if snapshot_reader is not None:
+        return snapshot_reader.table("identity_policies")
+    if settings.node_role == NodeRole.PUBLISHER:
+        # As for the resource policies, /authZ reads the ones the chain writer last published
+        return chain_writer.read().identity_policies
     return identity_policies_cache
 
 
 def get_policies_cache():
+    if snapshot_reader is not None:
+        return snapshot_reader.table("resource_policies")
+    if settings.node_role == NodeRole.PUBLISHER:
+        # The cache is changed by the chain writer, /authZ reads the policies it last published
+        return chain_writer.read().resource_policies
     return policies_cache
 
 
+# Light nodes serve /authZ from a replica of the policies of the full nodes
+policy_replica = PolicyReplica(
+    settings.peers or [],
+    policies_cache,
+    identity_policies_cache,
+    logger,
+    max_lag_s=settings.replica_max_lag_s,
+    max_lag_blocks=settings.replica_max_lag_blocks,
+    wait_s=settings.replica_wait_s,
+    timeout_s=settings.peer_max_timeout_s,
+)
+
+
+def get_policy_replica() -> PolicyReplica | None:
+    if settings.node_role == NodeRole.LIGHT and snapshot_reader is None:
+        return policy_replica
+    return None
+
+
+# Keeps the cache of the policies in step with the chain across reorganizations
+policy_journal = PolicyJournal(policies_cache, max_depth=settings.max_reorg_depth)
+
+if settings.policy_snapshot_path and snapshot_reader is None:
+    snapshot_writer = PolicySnapshotWriter(
+        settings.policy_snapshot_path, policies_cache, identity_policies_cache
+    )
+    policy_journal.listeners.append(snapshot_writer.publish)
+    policy_replica.listeners.append(snapshot_writer.publish)
+else:
+    snapshot_writer = None
+
+
+def get_snapshot_writer() -> PolicySnapshotWriter | None:
+    return snapshot_writer
+
+
+def get_policy_journal():
+    return policy_journal
+
+
+# Every change to the chain and to the cache of the policies is made by the writer, one at a time
+chain_writer = ChainWriter(
+    lambda: blockchain,
+    policies_cache,
+    identity_policies_cache,
+    logger,
+    max_pending=settings.chain_writer_max_pending,
+)
+# The writer copies the policies into its snapshots only after a sync has changed them
+policy_journal.listeners.append(chain_writer.policies_changed)
+
+
+def get_chain_writer():
+    return chain_writer
+
+
+# Queues of the messages to be sent to each peer
+outbound = OutboundScheduler(
+    logger,
+    max_pending=settings.outbound_max_pending,
+    max_pending_blocks=settings.outbound_max_pending_blocks,
+    batch_size=settings.outbound_batch_size,
+    timeout_s=settings.outbound_timeout_s,
+    resync_timeout_s=settings.outbound_resync_timeout_s,
+    max_failures=settings.outbound_max_failures,
+    streaming=settings.peer_streaming,
+    ping_interval_s=settings.peer_ping_interval_s,
+    peer_table=peers,
+)
+
+
+# Seals blocks in the background when enough transactions are pending
+miner = AutoMiner(
+    logger,
+    max_count=settings.auto_mine_max_count,
+    max_bytes=settings.auto_mine_max_bytes,
+    max_age_s=settings.auto_mine_max_age_s,
+)
+
+
+# The headers of the chain, as a light node keeps them
+light_node = LightNode(
+    set(settings.peers or ()),
+    create_consensus(),
+    window=settings.max_reorg_depth,
+    timeout_s=settings.peer_max_timeout_s,
+)
+
+
+def get_light_node():
+    return light_node
+
+
+# The answers to the batches received with an idempotency key
+idempotency_cache = IdempotencyCache(
+    ttl_s=settings.idempotency_ttl_s, max_entries=settings.idempotency_max_entries
+)
+
+
+def get_idempotency_cache():
+    return idempotency_cache
+
+
+# Batches the transactions a light node hands to the publishers
+forwarder = TransactionForwarder(
+    peers,
+    logger,
+    strategy=settings.forwarder_strategy,
+    batch_size=settings.forwarder_batch_size,
+    linger_s=settings.forwarder_linger_s,
+    max_pending=settings.forwarder_max_pending,
+    max_wait_s=settings.forwarder_max_wait_s,
+    max_attempts=settings.forwarder_max_attempts,
+)
+
+
+def get_forwarder():
+    return forwarder
+
+
+def get_miner():
+    return miner
+
+
+def get_outbound():
+    return outbound
+
+
+def get_seen_cache():
+    return seen_cache
+
+
 def get_logger():
     return logger
 
@@ -63,4 +270,9 @@ def set_global_chain(new_chain: ACBlockchain) -> None:
 
 
 def create_blockchain():
-    return ACBlockchain(difficulty=settings.chain_difficulty)
+    return ACBlockchain(
+        difficulty=settings.chain_difficulty,
+        mempool=create_mempool(),
+        consensus=create_consensus(),
+        max_reorg_depth=settings.max_reorg_depth,
+    )
@@ -0,0 +1,260 @@
+"""This module contains the forwarder a light node hands its transactions to. Instead of sending each submission to a
+full node as it arrives, the submissions are buffered and sent in batches to the publisher picked by the forwarder,
+so that many light nodes submitting policies do not flood the publishers with small requests. Each batch carries an
+idempotency key, which lets it be retried, on the same publisher or on another one, without being applied twice.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from functools import partial
+from logging import Logger
+from typing import Literal
+
+import requests
+from anyio import to_thread
+
+from .peers import PeerTable
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+
+class ForwarderFull(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class IdempotencyCache:
+    """
+    The answers a full node gave to the batches it accepted, by idempotency key, so that a retried batch gets the same
+    answer instead of being applied again. Entries expire after ttl_s seconds and the cache never holds more than
+    max_entries of them, the oldest being dropped first.
+    """
+
+    def __init__(self, ttl_s: float = 300, max_entries: int = 10_000):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    def get(self, key: str) -> dict | None:
+        now = time.monotonic()
+        while self._entries and next(iter(self._entries.values()))[0] <= now:
+            self._entries.popitem(last=False)
+        entry = self._entries.get(key, None)
+        return None if entry is None else entry[1]
+
+    def put(self, key: str, answer: dict) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_s, answer)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TransactionForwarder:
+    """
+    The submissions wait in the buffer until batch_size policies are pending or the oldest one has waited linger_s
+    seconds, and then they are sent as a single batch. A submission is never split across batches. When the buffer
+    holds max_pending policies the callers wait for it to drain, for at most max_wait_s seconds, after which their
+    submission is refused: the backpressure reaches the clients instead of piling up in memory.
+    A batch goes to a publisher that is not backing off, in turn with round_robin, or with least_load to the one with
+    the fewest batches in flight and then the fastest one. A publisher that fails is backed off by the peer table and
+    the batch is retried on the next one, with the same idempotency key, up to max_attempts times.
+    """
+
+    def __init__(
+        self,
+        publishers: PeerTable,
+        logger: Logger,
+        strategy: Literal["round_robin", "least_load"] = "least_load",
+        batch_size: int = 500,
+        linger_s: float = 0.05,
+        max_pending: int = 10_000,
+        max_wait_s: float = 1.0,
+        max_attempts: int = 3,
+        max_in_flight: int = 4,
+    ):
+        self.publishers = publishers
+        self.logger = logger
+        self.strategy = strategy
+        self.batch_size = batch_size
+        self.linger_s = linger_s
+        self.max_pending = max_pending
+        self.max_wait_s = max_wait_s
+        self.max_attempts = max_attempts
+        self.max_in_flight = max_in_flight
+        self.buffer: list[tuple[list[dict], asyncio.Future, float]] = []
+        self.pending = 0
+        self.in_flight: dict[str, int] = {}
+        self.turn = 0
+        self.wakeup = asyncio.Event()
+        self.drained = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.sending: set[asyncio.Task] = set()
+        self._stats = {
+            "submitted": 0,
+            "refused": 0,
+            "batches": 0,
+            "retries": 0,
+            "failed_batches": 0,
+        }
+
+    async def submit(self, policies: list[dict]) -> dict:
+        """
+        Buffers a submission and waits until the batch it is sent with has been accepted
+        :param policies: The policies, as accepted by /add-policies
+        :return: The publisher that accepted the batch, its idempotency key and how many policies it held
+        """
+        if len(policies) > self.max_pending:
+            raise ForwarderFull(
+                f"A submission can contain at most {self.max_pending} policies"
+            )
+        deadline = time.monotonic() + self.max_wait_s
+        while self.pending + len(policies) > self.max_pending:
+            self.drained.clear()
+            try:
+                async with asyncio.timeout(max(0.0, deadline - time.monotonic())):
+                    await self.drained.wait()
+            except TimeoutError:
+                self._stats["refused"] += 1
+                raise ForwarderFull("The forwarder buffer is full, retry later")
+        future = asyncio.get_running_loop().create_future()
+        self.buffer.append((policies, future, time.monotonic()))
+        self.pending += len(policies)
+        self._stats["submitted"] += len(policies)
+        self.wakeup.set()
+        return await future
+
+    def pick(self) -> str | None:
+        """
+        Returns the publisher the next batch goes to, None if all of them are backing off
+        :return:
+        """
+        available = self.publishers.available()
+        if not available:
+            return None
+        if self.strategy == "round_robin":
+            available.sort()
+            self.turn += 1
+            return available[self.turn % len(available)]
+        # available() lists the healthiest first, and min keeps the first of the least loaded ones
+        return min(available, key=lambda peer: self.in_flight.get(peer, 0))
+
+    def take_batch(self) -> list[tuple[list[dict], asyncio.Future, float]]:
+        count = 0
+        taken = 0
+        while taken < len(self.buffer) and (
+            taken == 0 or count + len(self.buffer[taken][0]) <= self.batch_size
+        ):
+            count += len(self.buffer[taken][0])
+            taken += 1
+        batch, self.buffer = self.buffer[:taken], self.buffer[taken:]
+        self.pending -= count
+        self.drained.set()
+        return batch
+
+    def start(self) -> None:
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            if not self.buffer:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            linger = self.buffer[0][2] + self.linger_s - time.monotonic()
+            if self.pending < self.batch_size and linger > 0:
+                self.wakeup.clear()
+                try:
+                    async with asyncio.timeout(linger):
+                        await self.wakeup.wait()
+                except TimeoutError:
+                    pass
+                continue
+            while len(self.sending) >= self.max_in_flight:
+                await asyncio.wait(self.sending, return_when=asyncio.FIRST_COMPLETED)
+            task = asyncio.get_running_loop().create_task(self._send(self.take_batch()))
+            self.sending.add(task)
+            task.add_done_callback(self.sending.discard)
+
+    async def _send(self, batch: list[tuple[list[dict], asyncio.Future, float]]):
+        policies = [policy for submission, _, _ in batch for policy in submission]
+        key = uuid.uuid4().hex
+        self._stats["batches"] += 1
+        error = "no publisher is available"
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self._stats["retries"] += 1
+            publisher = self.pick()
+            if publisher is None:
+                await asyncio.sleep(self.publishers.backoff_base_s)
+                continue
+            try:
+                status_code, content = await self._post(publisher, policies, key)
+            except requests.exceptions.RequestException as e:
+                self.publishers.record_failure(publisher)
+                error = f"{publisher}: {e!r}"
+                continue
+            if status_code == 201:
+                answer = {
+                    "publisher": publisher,
+                    "idempotency_key": key,
+                    "batch_policies": len(policies),
+                    **content,
+                }
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_result(answer)
+                return
+            if status_code < 500:
+                # The batch itself is refused, sending it elsewhere would not help
+                error = f"{publisher} refused the batch: {status_code} {content}"
+                break
+            # The publisher is overloaded, for instance because its mem pool is full
+            self.publishers.record_failure(publisher)
+            error = f"{publisher}: {status_code} {content}"
+        self._stats["failed_batches"] += 1
+        self.logger.warning(f"A batch of {len(policies)} policies was lost: {error}")
+        for _, future, _ in batch:
+            if not future.done():
+                future.set_exception(ConnectionError(error))
+
+    async def _post(self, publisher: str, policies: list[dict], key: str):
+        self.in_flight[publisher] = self.in_flight.get(publisher, 0) + 1
+        started = time.monotonic()
+        try:
+            response = await to_thread.run_sync(
+                partial(
+                    requests.post,
+                    url=f"http://{publisher}/add-policies",
+                    json=policies,
+                    headers={IDEMPOTENCY_HEADER: key},
+                    timeout=(
+                        self.publishers.timeout(publisher),
+                        self.publishers.max_timeout_s,
+                    ),
+                )
+            )
+        finally:
+            self.in_flight[publisher] -= 1
+        if response.status_code == 201:
+            self.publishers.record_success(publisher, time.monotonic() - started)
+        return response.status_code, response.json()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.task is not None and not self.task.done(),
+            "strategy": self.strategy,
+            "buffered": self.pending,
+            "in_flight": dict(self.in_flight),
+            **self._stats,
+        }
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, *self.sending, return_exceptions=True)
+            self.task = None
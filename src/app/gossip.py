@@ -0,0 +1,113 @@
+"""This module contains the helpers used by the gossip protocol to avoid flooding the network: a cache of the messages
+a node has already seen, and the random selection of the peers a message is forwarded to
+"""
+
+import hashlib
+import math
+import random
+import time
+from collections import OrderedDict
+
+
+class BloomFilter:
+    """
+    A fixed size Bloom filter over hex digests. Since the keys are already uniformly distributed hashes, the bit
+    positions are derived by re-hashing the key with a different salt for each of the k functions.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        for salt in range(self.hash_count):
+            digest = hashlib.blake2b(key.encode(), digest_size=8, salt=bytes([salt]))
+            yield int.from_bytes(digest.digest(), "big") % self.size
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[position // 8] & (1 << (position % 8))
+            for position in self._positions(key)
+        )
+
+
+class SeenCache:
+    """
+    This cache remembers the hashes of the transactions a node has already received, so that the same message is
+    neither applied nor forwarded twice. Entries expire after ttl_s seconds and the cache never holds more than
+    max_entries of them, the oldest being dropped first.
+    When use_bloom is set, the hashes are kept in two generations of Bloom filters that are rotated every ttl_s
+    seconds instead: memory is fixed, at the price of a small rate of false positives.
+    """
+
+    def __init__(
+        self, ttl_s: float = 300, max_entries: int = 100_000, use_bloom: bool = False
+    ):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.use_bloom = use_bloom
+        self._entries: OrderedDict[str, float] = OrderedDict()
+        self._current = BloomFilter(max_entries) if use_bloom else None
+        self._previous = BloomFilter(max_entries) if use_bloom else None
+        self._rotated_at = time.monotonic()
+
+    def __contains__(self, key: str) -> bool:
+        now = time.monotonic()
+        if self.use_bloom:
+            self._rotate(now)
+            return key in self._current or key in self._previous
+        self._expire(now)
+        return key in self._entries
+
+    def add(self, key: str) -> bool:
+        """
+        Records a key as seen
+        :param key:
+        :return: False if the key had already been seen
+        """
+        if key in self:
+            return False
+        if self.use_bloom:
+            self._current.add(key)
+            return True
+        self._entries[key] = time.monotonic() + self.ttl_s
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return True
+
+    def _expire(self, now: float) -> None:
+        # Since the ttl is the same for every entry, the insertion order is also the expiration order
+        while self._entries:
+            key, expiration = next(iter(self._entries.items()))
+            if expiration > now:
+                break
+            del self._entries[key]
+
+    def _rotate(self, now: float) -> None:
+        if now - self._rotated_at < self.ttl_s:
+            return
+        self._previous = self._current
+        self._current = BloomFilter(self.max_entries)
+        self._rotated_at = now
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def select_peers(peers: set[str], fanout: int | None) -> list[str]:
+    """
+    Picks the peers a message is forwarded to. With no fanout the message goes to every peer, otherwise to a random
+    subset of at most fanout peers
+    :param peers:
+    :param fanout:
+    :return:
+    """
+    peers = list(peers)
+    if fanout is None or fanout >= len(peers):
+        return peers
+    return random.sample(peers, fanout)  # nosec B311: this is not used for security
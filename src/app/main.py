@@ -4,14 +4,30 @@ from app.config import NodeRole, settings
 from contextlib import asynccontextmanager
 
 from app.onstartup_contracts import load_contracts
+from app.security import get_security_pool, get_security_settings
 from app.policy_util import load_policies
-from app.dependency import set_global_chain, get_blockchain, get_logger
+from app.dependency import (
+    set_global_chain,
+    get_blockchain,
+    get_logger,
+    create_consensus,
+    create_mempool,
+    get_outbound,
+    get_peers,
+    get_miner,
+    get_policy_journal,
+    get_light_node,
+    get_policy_replica,
+    get_forwarder,
+    get_chain_writer,
+    get_snapshot_writer,
+)
 
 from blockchain.ac_blockchain import ACBlock, ACBlockchain
 from blockchain.ac_transaction import ACPolicy
 import pandas as pd
 import time
-from anyio import fail_after
+from anyio import fail_after, to_thread
 
 logger = get_logger()
 
@@ -23,21 +39,28 @@ async def lifespan(app: FastAPI):
     BEFORE the application is launched while the code after the yield is run AFTER the app execution. The code
     is run only once.
     """
-    failure = False
-    # We fetch from other admin
-    if (
-        not isinstance(settings.peers, list)
-        and settings.node_role == NodeRole.PUBLISHER
-    ):
+    if settings.snapshot_reader:
+        # The chain is owned by another process, this one only serves /authZ from the snapshot it writes
+        yield
+        return
+    replaced = False
+    # If there are peers we trigger consensus so that we get the longest valid chain
+    if settings.peers and settings.node_role == NodeRole.PUBLISHER:
         try:
             with fail_after(5):
-                await full_node.consensus(settings.peers, get_blockchain(), logger)
+                response = await full_node.consensus(
+                    get_peers(),
+                    get_blockchain(),
+                    get_policy_journal(),
+                    get_chain_writer(),
+                    logger,
+                )
+            replaced = response["replaced"]
         except TimeoutError:
             logger.warning(
                 "Consensus during startup failed, node will init with a local chain"
             )
-            failure = True
-    elif failure or settings.node_role == NodeRole.PUBLISHER:
+    if not replaced and settings.node_role == NodeRole.PUBLISHER:
         logger.debug("Node starting with a local chain")
         contract_header: pd.DataFrame = load_contracts()
         policies: list[ACPolicy] = load_policies()
@@ -45,26 +68,80 @@ async def lifespan(app: FastAPI):
         genesis = ACBlock(
             index=0,
             contract_header=contract_header,
-            policies=policies,
+            resource_policies=policies,
             timestamp=time.time(),
             previous_hash="0",
         )
         set_global_chain(
-            ACBlockchain(difficulty=settings.chain_difficulty, genesis_block=genesis)
+            ACBlockchain(
+                difficulty=settings.chain_difficulty,
+                genesis_block=genesis,
+                mempool=create_mempool(),
+                consensus=create_consensus(),
+                max_reorg_depth=settings.max_reorg_depth,
+            )
+        )
+    if settings.peers and settings.node_role == NodeRole.LIGHT:
+        try:
+            with fail_after(5):
+                await to_thread.run_sync(get_light_node().sync)
+        except (TimeoutError, ConnectionError):
+            logger.warning(
+                "Header sync during startup failed, it will be retried on demand"
+            )
+        get_policy_replica().start()
+    # The light node routes are served by publishers too
+    get_forwarder().start()
+    if settings.node_role == NodeRole.PUBLISHER:
+        # The cache of the policies starts from the ones of the chain the node starts with
+        get_policy_journal().sync(get_blockchain().chain)
+        # The readers start from the chain the node starts with
+        get_chain_writer().publish()
+    miner = get_miner()
+    if settings.auto_mine and settings.node_role == NodeRole.PUBLISHER:
+        # The chain is looked up each time, since consensus may swap it
+        miner.start(
+            lambda: get_blockchain().unconfirmed_transactions,
+            lambda: full_node.mine_block(
+                get_blockchain(),
+                get_peers(),
+                get_outbound(),
+                get_policy_journal(),
+                get_chain_writer(),
+                logger,
+            ),
         )
-    # If there are peers we trigger consensus so that we get the longest valid chain
     yield
+    await get_forwarder().stop()
+    if get_policy_replica() is not None:
+        await get_policy_replica().stop()
+    await miner.stop()
+    await get_chain_writer().stop()
+    if get_snapshot_writer() is not None:
+        await get_snapshot_writer().stop()
+    get_security_pool().shutdown()
+    await get_outbound().stop()
 
 
 app = FastAPI(lifespan=lifespan)
 
-if settings.node_role == NodeRole.PUBLISHER:
+if settings.snapshot_reader:
+    app.include_router(authorization.router)
+elif settings.node_role == NodeRole.PUBLISHER:
+    if get_security_settings().workers > 1:
+        # The answered challenges are remembered by the process that checked them, another worker would accept them
+        # once more
+        raise RuntimeError(
+            "A publisher serves /auth and must run a single worker process, set WEB_CONCURRENCY to 1"
+        )
     app.include_router(full_node.router)
     app.include_router(light_node.router)
     app.include_router(authentication.router)
     app.include_router(authorization.router)
 else:
     app.include_router(light_node.router)
+    # The policies are replicated from the full nodes, see replica.py
+    app.include_router(authorization.router)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,121 @@
+"""This module contains the miner that runs in the background of a node, sealing a block as soon as enough
+transactions are pending instead of waiting for someone to call /mine.
+"""
+
+import asyncio
+from logging import Logger
+from typing import Awaitable, Callable
+
+from blockchain.mempool import Mempool
+
+
+class AutoMiner:
+    """
+    A block is sealed when the mem pool holds at least max_count transactions or max_bytes bytes, or when its oldest
+    transaction has been waiting for max_age_s seconds. Waiting for a batch makes each proof of work cover as many
+    transactions as possible, while the age bound keeps the commit latency of a lone transaction bounded.
+    The miner sleeps until the age bound expires, and it is woken up by notify whenever new transactions arrive.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        max_count: int | None = 100,
+        max_bytes: int | None = 1_000_000,
+        max_age_s: float | None = 10.0,
+        retry_s: float = 5.0,
+    ):
+        self.logger = logger
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.retry_s = retry_s
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self._stats = {
+            "mined": 0,
+            "failures": 0,
+            "by_count": 0,
+            "by_bytes": 0,
+            "by_age": 0,
+        }
+
+    def trigger(self, mempool: Mempool) -> str | None:
+        """
+        Returns which bound the mem pool has reached, if any
+        :param mempool:
+        :return: "count", "bytes", "age" or None
+        """
+        if not mempool:
+            return None
+        if self.max_count is not None and len(mempool) >= self.max_count:
+            return "count"
+        if self.max_bytes is not None and mempool.total_bytes >= self.max_bytes:
+            return "bytes"
+        if self.max_age_s is not None and mempool.oldest_age() >= self.max_age_s:
+            return "age"
+        return None
+
+    def notify(self) -> None:
+        self.wakeup.set()
+
+    def start(
+        self, get_mempool: Callable[[], Mempool], mine: Callable[[], Awaitable]
+    ) -> None:
+        """
+        Starts the miner
+        :param get_mempool: Returns the mem pool of the current chain, since the chain may be swapped by consensus
+        :param mine: Mines a block out of the pending transactions and announces it
+        :return:
+        """
+        self.task = asyncio.get_running_loop().create_task(self._run(get_mempool, mine))
+
+    async def _run(
+        self, get_mempool: Callable[[], Mempool], mine: Callable[[], Awaitable]
+    ) -> None:
+        while True:
+            mempool = get_mempool()
+            reason = self.trigger(mempool)
+            if reason is None:
+                await self._wait(mempool)
+                continue
+            self.logger.info(
+                "Mining a block of %d transactions, %s bound reached",
+                len(mempool),
+                reason,
+            )
+            try:
+                await mine()
+            except Exception as e:
+                self._stats["failures"] += 1
+                self.logger.error(f"Background mining failed: {e!r}")
+                await asyncio.sleep(self.retry_s)
+                continue
+            self._stats["mined"] += 1
+            self._stats[f"by_{reason}"] += 1
+
+    async def _wait(self, mempool: Mempool) -> None:
+        self.wakeup.clear()
+        timeout = None
+        if mempool and self.max_age_s is not None:
+            timeout = max(0.0, self.max_age_s - mempool.oldest_age())
+        try:
+            async with asyncio.timeout(timeout):
+                await self.wakeup.wait()
+        except TimeoutError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "running": self.task is not None and not self.task.done(),
+            "max_count": self.max_count,
+            "max_bytes": self.max_bytes,
+            "max_age_s": self.max_age_s,
+            **self._stats,
+        }
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
@@ -1,6 +1,8 @@
 import json
 import time
 
+import jwt
+
 from fastapi import APIRouter, Depends
 from starlette.responses import JSONResponse
 
@@ -11,27 +13,32 @@ from ..ac_validation import (
     UserSignedRequestAccess,
 )
 from typing import Annotated
-from ..security import get_mem_nonce, get_security_settings, SecuritySettings
+from ..replay import ReplayCache, ReplayCacheFull
+from ..security import get_replay_cache, get_security_settings, SecuritySettings
 from ..security import (
-    verify_user_message,
-    create_access_token,
+    issue_nonce,
+    verify_nonce,
+    verify_user_message_async,
+    create_access_token_async,
     decode_access_token,
-    decode_and_verify_jwt_signature,
+    decode_and_verify_jwt_signature_async,
+    get_security_pool,
 )
-import secrets
+from ..security_pool import SecurityPool, SecurityPoolFull
 from cryptography.exceptions import InvalidSignature
 
 router = APIRouter(
     dependencies=[
         Depends(get_peers),
         Depends(get_blockchain),
-        Depends(get_mem_nonce),
+        Depends(get_replay_cache),
         Depends(get_security_settings),
     ]
 )
 peers_dependency = Annotated[set, Depends(get_peers)]
-nonce_dependency = Annotated[dict, Depends(get_mem_nonce)]
+replay_dependency = Annotated[ReplayCache, Depends(get_replay_cache)]
 security_settings_dep = Annotated[SecuritySettings, Depends(get_security_settings)]
+security_pool_dep = Annotated[SecurityPool, Depends(get_security_pool)]
 
 
 @router.head(path="/auth", status_code=200)
@@ -41,18 +48,23 @@ async def is_alive():
 
 @router.post(path="/auth", response_model=ChallengeResponse | dict, status_code=200)
 async def challenge(
-    mem_nonces: nonce_dependency,
+    replay_cache: replay_dependency,
     settings: security_settings_dep,
     client: (
         ChallengeRequest | UserSignedRequestAccess | None
     ) = None,  # This means that an empty body might be sent ( it is the case of MinIO POST)
     token: str | None = None,
 ):
+    """
+    The challenges are not stored: their nonce is bound to the client and to the expiration by an HMAC, so any worker
+    sharing the secret can check the answer. Only the nonces that have been answered are remembered, until they
+    expire, so that an answer cannot be replayed.
+    The signatures are verified and the tokens signed in the security pool, off the event loop.
+    """
     if isinstance(client, ChallengeRequest) and token is None:
         client_challenge_info: dict = client.model_dump()
         expiration = time.time() + settings.nonce_exp_min * 60 + settings.nonce_exp_s
-        nonce = secrets.token_hex(settings.nonce_size)
-        mem_nonces.update({client_challenge_info["client_pk"]: (nonce, expiration)})
+        nonce = issue_nonce(client_challenge_info["client_pk"], expiration)
         return JSONResponse(
             status_code=200,
             content={
@@ -63,21 +75,18 @@ async def challenge(
         )
     elif isinstance(client, UserSignedRequestAccess) and token is None:
         client_signed_message: dict = client.model_dump()
-        mem_data = mem_nonces.get(client_signed_message["client_pk"], None)
-        if mem_data is None:
+        nonce = client_signed_message["message"]["nonce"]
+        expiration = client_signed_message["message"]["expire"]
+        if not verify_nonce(nonce, client_signed_message["client_pk"], expiration):
             return JSONResponse(
                 status_code=403, content="No challenge has been issued for this client!"
             )
-        assigned_nonce, expiration = mem_data
-        if (
-            assigned_nonce != client_signed_message["message"]["nonce"]
-            or time.time() > expiration
-        ):
+        if time.time() > expiration or nonce in replay_cache:
             return JSONResponse(status_code=403, content="Invalid or expired nonce!")
 
         # Signature Verification
         try:
-            verify_user_message(
+            await verify_user_message_async(
                 json.dumps(client_signed_message["message"])
                 .replace(": ", ":")
                 .replace(', "', ',"')
@@ -92,20 +101,37 @@ async def challenge(
             )
         except InvalidSignature:
             return JSONResponse(status_code=403, content="Invalid signature!")
-        # Remove saved nonce for the client
-        del mem_nonces[client_signed_message["client_pk"]]
+        except SecurityPoolFull as e:
+            return JSONResponse(status_code=503, content=str(e))
+        # The nonce is spent, it is only recorded once the signature is valid so that forged answers do not fill the
+        # cache
+        try:
+            if not replay_cache.add(nonce, expiration):
+                return JSONResponse(
+                    status_code=403, content="Invalid or expired nonce!"
+                )
+        except ReplayCacheFull as e:
+            return JSONResponse(status_code=503, content=str(e))
         # Issue JWT
         payload = {
             "sub": client_signed_message["client_pk"],
             "client_id": client_signed_message["client_id"],
             "role": "user",
         }
-        return JSONResponse(status_code=201, content=create_access_token(payload))
+        try:
+            access_token = await create_access_token_async(payload)
+        except SecurityPoolFull as e:
+            return JSONResponse(status_code=503, content=str(e))
+        return JSONResponse(status_code=201, content=access_token)
     elif token:
-        # TODO: A check should be done here to see if the iss is a known and authorized node in the network
+        # The issuer must be a trusted node, see IssuerRegistry
         try:
-            decoded_token = decode_and_verify_jwt_signature(token)
-        except InvalidSignature:
+            decoded_token = await decode_and_verify_jwt_signature_async(token)
+        except SecurityPoolFull as e:
+            return JSONResponse(status_code=503, content={"reason": str(e)})
+        except jwt.InvalidIssuerError as e:
+            return JSONResponse(status_code=403, content={"reason": str(e)})
+        except (InvalidSignature, ValueError, jwt.InvalidTokenError):
             return JSONResponse(
                 status_code=403, content={"reason": "Invalid signature"}
             )
@@ -123,4 +149,9 @@ async def challenge(
         return JSONResponse(status_code=200, content="")
 
 
+@router.get(path="/security-pool", status_code=200)
+async def security_pool_stats(pool: security_pool_dep) -> dict:
+    return pool.stats()
+
+
 # TODO: Define automatic scheduling procedure that when a JWT expiration triggers a mining operation
@@ -3,7 +3,13 @@ from starlette.responses import JSONResponse
 from starlette.requests import Request
 
 from ..ac_validation import ACResourcePolicy, ACIdentityPolicy
-from ..dependency import get_peers, get_policies_cache, get_identity_policies_cache
+from ..dependency import (
+    get_peers,
+    get_policies_cache,
+    get_identity_policies_cache,
+    get_policy_replica,
+)
+from ..replica import PolicyReplica
 from typing import Annotated
 
 router = APIRouter(
@@ -17,6 +23,7 @@ router = APIRouter(
 peers_dependency = Annotated[set, Depends(get_peers)]
 resource_policy_dependency = Annotated[dict, Depends(get_policies_cache)]
 identity_dependency = Annotated[dict, Depends(get_identity_policies_cache)]
+replica_dependency = Annotated[PolicyReplica | None, Depends(get_policy_replica)]
 
 
 def extract_user_data(auth_request: dict) -> dict:
@@ -76,7 +83,12 @@ async def authorization(
     peers: peers_dependency,
     resource_policies: resource_policy_dependency,
     identity_policies: identity_dependency,
+    replica: replica_dependency,
 ):
+    # On a light node the caches are a replica, which is not trusted while it lags behind the full nodes
+    if replica is not None and replica.is_lagging():
+        status_code, content = await replica.proxy(await request.body())
+        return JSONResponse(status_code=status_code, content=content)
     dict_body = await request.json()
     user_data = extract_user_data(dict_body)
     # 1. Fetch all the policies associated with that user identity
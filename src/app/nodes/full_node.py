@@ -1,15 +1,48 @@
+import asyncio
 import json
-from typing import Annotated
+import time
+from functools import partial
+from typing import Annotated, Sequence
 
 import requests
-from fastapi import APIRouter, Depends
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from pydantic import TypeAdapter, ValidationError
 from starlette.requests import Request
 from starlette.responses import JSONResponse
 
 from blockchain.ac_blockchain import ACBlockchain
-from blockchain.errors import NoTransactionsFound, InvalidChain
-from blockchain.ac_block import ACBlock
-from ..ac_validation import ACPolicy, RegisterNode, InputBlock
+from blockchain.errors import NoTransactionsFound, InvalidChain, MempoolFull
+from blockchain import ac_transaction, compact_block
+from blockchain.ac_block import ACBlock, ACBlockBody
+from blockchain.block_template import BlockTemplate
+from blockchain.checkpoint import Checkpoint, policy_state_digest
+from blockchain.mempool import Mempool
+from blockchain.policy_journal import PolicyJournal
+from ..ac_validation import (
+    ACResourcePolicy,
+    ACIdentityPolicy,
+    PolicyTransaction,
+    RegisterNode,
+    InputBlock,
+    CompactBlock,
+    StreamFrame,
+)
+from ..chain_writer import ChainWriter
+from ..config import settings
+from ..forwarder import IdempotencyCache
+from ..gossip import SeenCache, select_peers
+from ..miner import AutoMiner
+from ..outbound import OutboundScheduler
+from ..peers import PeerTable
+from ..security import serialize_pk_hex, sign_message, verify_user_message
+from ..stream import STREAM_PATH, make_frame, make_reply
 
 from ..dependency import (
     get_peers,
@@ -17,10 +50,16 @@ from ..dependency import (
     create_blockchain,
     get_logger,
     get_policies_cache,
+    get_seen_cache,
+    get_outbound,
+    get_miner,
+    get_policy_journal,
+    get_idempotency_cache,
+    get_chain_writer,
 )
 
 from logging import Logger
-from anyio import move_on_after, fail_after
+from anyio import create_task_group, to_thread
 
 router = APIRouter(
     dependencies=[
@@ -31,24 +70,80 @@ router = APIRouter(
     ]
 )
 
-peers_dependency = Annotated[set, Depends(get_peers)]
+peers_dependency = Annotated[PeerTable, Depends(get_peers)]
 logger_dep = Annotated[Logger, Depends(get_logger)]
 policies_dep = Annotated[dict, Depends(get_policies_cache)]
 blockchain_dependency = Annotated[ACBlockchain, Depends(get_blockchain)]
+seen_dependency = Annotated[SeenCache, Depends(get_seen_cache)]
+outbound_dependency = Annotated[OutboundScheduler, Depends(get_outbound)]
+miner_dependency = Annotated[AutoMiner, Depends(get_miner)]
+journal_dependency = Annotated[PolicyJournal, Depends(get_policy_journal)]
+idempotency_dependency = Annotated[IdempotencyCache, Depends(get_idempotency_cache)]
+writer_dependency = Annotated[ChainWriter, Depends(get_chain_writer)]
 create_blockchain_dependency = Annotated[ACBlockchain, Depends(create_blockchain)]
 
+# How long a /policy-deltas request can be held
+MAX_DELTA_WAIT_S = 30.0
+
+policies_adapter = TypeAdapter(list[PolicyTransaction])
+
+
+def is_oversized_batch(payload) -> bool:
+    """
+    Tells whether a batch of policies, as decoded from JSON, holds more policies than a batch may. It is checked
+    before the policies are validated, so that an oversized batch costs nothing more than its decoding.
+    :param payload:
+    :return:
+    """
+    return isinstance(payload, list) and len(payload) > settings.max_policy_batch
+
+
+def batch_too_large() -> str:
+    return f"A batch can contain at most {settings.max_policy_batch} policies"
+
+
+async def check_batch_size(request: Request) -> None:
+    # Dependencies are solved before the body is validated, and the JSON FastAPI has decoded is cached by the request
+    try:
+        payload = await request.json()
+    except ValueError:
+        # FastAPI answers a body that is not JSON itself
+        return
+    if is_oversized_batch(payload):
+        raise HTTPException(status_code=413, detail=batch_too_large())
+
+
+def to_chain_policy(
+    policy: ACResourcePolicy | ACIdentityPolicy,
+) -> ac_transaction.ACResourcePolicy | ac_transaction.ACIdentityPolicy:
+    """
+    The policies are kept in the mem pool as the models of the block bodies, so that a policy hashes the same whether
+    it is pending or committed, and the mem pool recognizes it in the blocks of the peers
+    :param policy:
+    :return:
+    """
+    if isinstance(policy, ACResourcePolicy):
+        return ac_transaction.ACResourcePolicy.model_validate(policy.model_dump())
+    return ac_transaction.ACIdentityPolicy.model_validate(policy.model_dump())
+
 
 @router.get(path="/")
-async def get_chain(blockchain: blockchain_dependency) -> dict:
+async def get_chain(writer: writer_dependency) -> dict:
+    snapshot = writer.read()
     return {
-        "chain": [x.to_dict() for x in blockchain.chain],
-        "difficulty": blockchain.difficulty,
+        "chain": [x.to_dict() for x in snapshot.chain],
+        "difficulty": snapshot.difficulty,
+        "consensus": snapshot.consensus,
     }
 
 
 @router.get("/register-peer", status_code=200)
 async def register_peer(
-    request: Request, peers: peers_dependency, blockchain: blockchain_dependency
+    request: Request,
+    peers: peers_dependency,
+    blockchain: blockchain_dependency,
+    journal: journal_dependency,
+    writer: writer_dependency,
 ):
     """
     This function adds a new peer to the current node by inserting it into the set of his peers
@@ -61,21 +156,60 @@ async def register_peer(
         return JSONResponse(
             status_code=400, content="Client already present into peers!"
         )
-    chain_data: dict = await get_chain(blockchain)
+    checkpoint = await writer.submit(create_checkpoint, blockchain, journal)
+    chain_data: dict = await get_chain(writer)
     return {
         "chain": chain_data["chain"],
         "difficulty": chain_data["difficulty"],
         "peers": list(to_return_peers),
+        "checkpoint": checkpoint.to_dict(),
     }
 
 
+def create_checkpoint(blockchain: ACBlockchain, journal: PolicyJournal) -> Checkpoint:
+    """
+    This function signs a checkpoint for the block checkpoint_confirmations blocks below the tip, deep enough not to
+    be reorganized away, along with the digest of the policies at that block
+    :return:
+    """
+    journal.sync(blockchain.chain)
+    height = max(
+        0,
+        len(blockchain.chain)
+        - 1
+        - min(settings.checkpoint_confirmations, journal.max_depth),
+    )
+    return Checkpoint.create(
+        height=height,
+        block_hash=blockchain.chain[height].compute_hash(),
+        policy_digest=policy_state_digest(journal.policies_at(height)),
+        signer=serialize_pk_hex(),
+        sign=sign_message,
+    )
+
+
+@router.get("/checkpoint", status_code=200)
+async def get_checkpoint(
+    blockchain: blockchain_dependency,
+    journal: journal_dependency,
+    writer: writer_dependency,
+) -> dict:
+    # Signing a checkpoint brings the cache in step with the chain, which is a change like any other
+    checkpoint = await writer.submit(create_checkpoint, blockchain, journal)
+    return checkpoint.to_dict()
+
+
 @router.post("/add-policy", status_code=201)
 async def add_new_policy(
-    policy: ACPolicy,
+    policy: PolicyTransaction,
     blockchain: blockchain_dependency,
     peers: peers_dependency,
+    seen: seen_dependency,
+    outbound: outbound_dependency,
+    miner: miner_dependency,
     request: Request,
     logger: logger_dep,
+    hops: int = 0,
 ):
     """
     This method adds a new policy to the mem pool so that a miner can later mine and add them
@@ -83,124 +217,462 @@ async def add_new_policy(
     following the gossip protocol
     :param policy:
     :param blockchain:
+    :param hops: How many nodes the policy has gone through, it is 0 when it is submitted by a client
     :return:
     """
     # The policy is validated by FastAPI
-    policy = policy.model_dump()
-    if policy not in blockchain.unconfirmed_transactions:
-        blockchain.add_new_transaction(policy)
+    policy = to_chain_policy(policy)
+    tx_hash = Mempool.transaction_hash(policy)
+    if tx_hash in seen:
+        return JSONResponse(status_code=200, content="Policy already seen")
+    try:
+        is_new = blockchain.unconfirmed_transactions.add(policy)
+    except MempoolFull as e:
+        return JSONResponse(status_code=503, content=str(e))
+    seen.add(tx_hash)
+    miner.notify()
+    if is_new and hops < settings.gossip_max_hops:
         # Propagate the policy to the node's peers
         logger.info("Gossip protocol initiated by %s", request.client.host)
-        await gossip(policy, peers, logger)
+        gossip([policy.model_dump()], peers, outbound, hops + 1)
     return JSONResponse(status_code=200, content="Transactions added successfully")
 
 
-async def gossip(policy: dict, peers: set, logger: Logger):
-    for peer in peers:
-        try:
-            with fail_after(1):
-                response = requests.post(
-                    url=f"http://{peer}/add-policy", data=json.dumps(policy)
-                )
-                if response.status_code != 201:
-                    logger.warning(
-                        f"Peer {peer} returned the following error: {response.status_code}/{response.content}"
-                    )
-        except (TimeoutError, requests.exceptions.ConnectionError):
-            logger.warning(f"Peer {peer} did not respond to gossip protocol")
+@router.post("/add-policies", status_code=201, dependencies=[Depends(check_batch_size)])
+async def add_new_policies(
+    policies: list[PolicyTransaction],
+    blockchain: blockchain_dependency,
+    peers: peers_dependency,
+    seen: seen_dependency,
+    outbound: outbound_dependency,
+    miner: miner_dependency,
+    request: Request,
+    logger: logger_dep,
+    idempotency: idempotency_dependency,
+    hops: int = 0,
+    idempotency_key: Annotated[str | None, Header()] = None,
+):
+    """
+    This method adds a batch of policies to the mem pool. The batch is validated by FastAPI in a single pass and it
+    is inserted atomically: if it does not fit into the mem pool none of its policies is added. The new policies are
+    then gossiped to each peer as a single batched message. A batch larger than settings.max_policy_batch is
+    refused by check_batch_size before any of its policies is validated.
+    :param policies:
+    :param blockchain:
+    :param hops: How many nodes the batch has gone through, it is 0 when it is submitted by a client
+    :param idempotency_key: Set by the forwarders of the light nodes, a batch retried with the same key gets the
+    answer of the first attempt
+    :return:
+    """
+    if idempotency_key is not None:
+        answer = idempotency.get(idempotency_key)
+        if answer is not None:
+            return JSONResponse(status_code=201, content={**answer, "replayed": True})
+    response = receive_policies(
+        policies, hops, request.client.host, blockchain, peers, seen, outbound, logger
+    )
+    if idempotency_key is not None and response.status_code == 201:
+        idempotency.put(idempotency_key, json.loads(response.body))
+    miner.notify()
+    return response
+
+
+def receive_policies(
+    policies: list[PolicyTransaction],
+    hops: int,
+    origin: str,
+    blockchain: ACBlockchain,
+    peers: PeerTable,
+    seen: SeenCache,
+    outbound: OutboundScheduler,
+    logger: Logger,
+) -> JSONResponse:
+    policies = [to_chain_policy(policy) for policy in policies]
+    hashes = [Mempool.transaction_hash(policy) for policy in policies]
+    unseen = [
+        policy for policy, tx_hash in zip(policies, hashes) if tx_hash not in seen
+    ]
+    try:
+        added = blockchain.unconfirmed_transactions.add_many(unseen)
+    except MempoolFull as e:
+        return JSONResponse(status_code=503, content=str(e))
+    for tx_hash in hashes:
+        seen.add(tx_hash)
+    if added and hops < settings.gossip_max_hops:
+        logger.info(
+            "Gossip protocol initiated by %s for %d policies",
+            origin,
+            len(added),
+        )
+        gossip([policy.model_dump() for policy in added], peers, outbound, hops + 1)
+    return JSONResponse(
+        status_code=201,
+        content={"added": len(added), "duplicates": len(policies) - len(added)},
+    )
+
+
+def gossip(
+    policies: list[dict], peers: PeerTable, outbound: OutboundScheduler, hops: int
+):
+    """
+    This function queues the policies for a random subset of the node's peers that are not backing off, the outbound
+    scheduler coalesces them into batched messages
+    :return:
+    """
+    outbound.send_policies(
+        policies, select_peers(peers.available(), settings.gossip_fanout), hops
+    )
+
+
+@router.get("/mempool", status_code=200)
+async def mempool_stats(blockchain: blockchain_dependency) -> dict:
+    return blockchain.unconfirmed_transactions.stats()
 
 
 @router.get("/update-cache", status_code=200)
 async def update_local_cache(
-    mem_policies: policies_dep, blockchain: blockchain_dependency
+    journal: journal_dependency,
+    blockchain: blockchain_dependency,
+    writer: writer_dependency,
 ):
     """
-    This method instructs the node to update their local cache of the current valid access policies
+    This method instructs the node to update their local cache of the current valid access policies. Only the blocks
+    that changed since the last update are reverted or applied.
     :return:
     """
-    for block in blockchain.chain:
-        blockchain.apply_resource_policy_delta(block.body.policies, mem_policies)
+    return await writer.submit(sync_cache, journal, blockchain)
+
+
+def sync_cache(journal: PolicyJournal, blockchain: ACBlockchain) -> dict:
+    reverted, applied = journal.sync(blockchain.chain)
+    return {"reverted": reverted, "applied": applied, **journal.stats()}
 
 
 @router.get("/mine", status_code=200)
 async def mine(
-    blockchain: blockchain_dependency, peers: peers_dependency, logger: logger_dep
+    blockchain: blockchain_dependency,
+    peers: peers_dependency,
+    outbound: outbound_dependency,
+    journal: journal_dependency,
+    writer: writer_dependency,
+    logger: logger_dep,
 ):
     try:
-        result = blockchain.mine()
+        return await mine_block(blockchain, peers, outbound, journal, writer, logger)
     except NoTransactionsFound:
         return JSONResponse(
             status_code=400, content="No transactions have been found on this node!"
         )
+    except InvalidChain as e:
+        return JSONResponse(status_code=409, content=str(e))
+
+
+# Two miners would seal blocks on the same tip, only one of them could be committed
+mining_lock = asyncio.Lock()
+
+
+async def mine_block(
+    blockchain: ACBlockchain,
+    peers: PeerTable,
+    outbound: OutboundScheduler,
+    journal: PolicyJournal,
+    writer: ChainWriter,
+    logger: Logger,
+) -> str:
+    """
+    This function mines a block out of the pending transactions and brings the peers to a common view of the chain.
+    It is used both by /mine and by the background miner. The proof of work is computed in a worker thread, outside
+    the chain writer, so that the node keeps serving requests and applying the blocks of its peers meanwhile. Only
+    the commit goes through the writer, which refuses the block if the tip has moved since the template was built.
+    :return:
+    """
+    async with mining_lock:
+        template = blockchain.prepare_block(
+            settings.block_max_count, settings.block_max_bytes
+        )
+        logger.info(
+            "Mining block #%d with %d transactions, %d left for the next block, %.0f hashes expected",
+            template.block.index,
+            len(template.tx_hashes),
+            template.left_out,
+            template.expected_hashes,
+        )
+        await to_thread.run_sync(blockchain.proof_of_work, template.block)
+        await writer.submit(commit_mined_block, blockchain, journal, template)
     # When a block has been mined, all the nodes by using consensus need to reach
-    # a common view of the blockchain
-    with move_on_after(2.5):
-        response = await consensus(peers, blockchain)
+    # a common view of the blockchain. Consensus submits its own commands, so it runs once the block is committed
+    response = await consensus(peers, blockchain, journal, writer, logger)
     if not response["replaced"]:
-        await announce_new_block(blockchain, peers, logger)
-    return result
+        announce_new_block(blockchain, peers, outbound)
+    return f"Block #{template.block.index} has been mined!"
+
+
+def commit_mined_block(
+    blockchain: ACBlockchain, journal: PolicyJournal, template: BlockTemplate
+) -> None:
+    blockchain.commit_block(template.block, template.tx_hashes)
+    journal.sync(blockchain.chain)
+
+
+# The last report of /block-template, along with the tip and the state of the mem pool it was built from
+last_template: dict = {}
+
+
+@router.get("/block-template", status_code=200)
+async def block_template(blockchain: blockchain_dependency):
+    """
+    This method reports the block that would be mined next: how many transactions it would hold, how many would be
+    left for the following block and how much hashing its proof of work is expected to take. Building the template
+    runs the contracts, so the report is built again only once the tip or the mem pool have changed.
+    :return:
+    """
+    tip = blockchain.get_last_bloc
+    mempool = blockchain.unconfirmed_transactions
+    if (
+        last_template.get("tip") is tip
+        and last_template.get("mempool") is mempool
+        and last_template.get("version") == mempool.version
+    ):
+        return last_template["report"]
+    try:
+        template = blockchain.prepare_block(
+            settings.block_max_count, settings.block_max_bytes
+        )
+    except NoTransactionsFound:
+        return JSONResponse(
+            status_code=400, content="No transactions have been found on this node!"
+        )
+    last_template.update(
+        tip=tip, mempool=mempool, version=mempool.version, report=template.to_dict()
+    )
+    return last_template["report"]
+
+
+@router.get("/miner", status_code=200)
+async def miner_stats(miner: miner_dependency) -> dict:
+    return miner.stats()
 
 
 @router.get("/consensus", status_code=200)
 async def consensus(
-    peers: peers_dependency, blockchain: blockchain_dependency, logger: logger_dep
+    peers: peers_dependency,
+    blockchain: blockchain_dependency,
+    journal: journal_dependency,
+    writer: writer_dependency,
+    logger: logger_dep,
 ):
     """
-    This function will check all the peers of a given node and will try to figure out who has the longest valid chain.
-    When found, all the nodes will swap their chain with the longest valid chain found since it is considered the most updated
-    one.
+    This function will check all the peers of a given node and will try to figure out who has the valid chain with
+    the most cumulative work. When found, the node reorganizes its chain to it.
+    The peers are first asked, all at once, for the headers of the last max_reorg_depth blocks and of the ones past
+    the local chain. From the headers the node finds where each chain forks off the local one and how much work it
+    carries, so that only the blocks past the fork of the heaviest chains are downloaded. A chain that forks off too
+    deep, or that starts from another genesis block, is downloaded whole and swapped only if it carries more work.
+    Peers that are backing off after failing are skipped.
+    The peers are asked outside the writer, only the reorganization is submitted to it, so the chain may have grown
+    meanwhile: the work a downloaded chain has to beat is the one of the local chain when it is applied.
     :return:
     """
-    max_chain = blockchain.chain
-    replaced = False
-    # First, find the longest oldest chain
-    for indx, peer in enumerate(peers):
-        # Get peer chain
-        with move_on_after(2.5):
-            try:
-                response = requests.get(url=f"http://{peer}/")
-            except requests.exceptions.ConnectionError:
-                logger.warning(f"Peer {peer} did not respond to get_chain")
-        if response.status_code != 200:
-            logger.error(f"Peer {peer} error in getting chain")
-        peer_chain = response.json()
-        if len(peer_chain) > len(max_chain):
-            max_chain = peer_chain
-            replaced = True
-
-    # Found the longest chain, we get it and we validate it
+    snapshot = writer.read()
+    start = max(1, len(snapshot.chain) - settings.max_reorg_depth)
+    local_work = snapshot.work
+    candidates = {}
+
+    async def probe(peer: str):
+        response = await request_peer(
+            peers, peer, "/headers", logger, params={"start": start}
+        )
+        if response is None:
+            return
+        headers = response.json()["headers"]
+        if not headers:
+            return
+        peers.health(peer).tip_height = start + len(headers) - 1
+        fork = blockchain.fork_point(headers, start)
+        if fork is None:
+            # The chains do not meet within the headers, their work is at least the one of the headers
+            work = sum(blockchain.consensus.work(header) for header in headers)
+        else:
+            work = blockchain.branch_work(headers, start, fork)
+        # Headers from the genesis block on carry the whole work of the chain, otherwise it is only known once the
+        # chain is downloaded
+        if work > local_work or (fork is None and start > 1):
+            candidates[peer] = (work, fork)
+
+    async with create_task_group() as task_group:
+        for peer in peers.available():
+            task_group.start_soon(probe, peer)
+
+    # The heaviest chain is tried first, if it is not valid the next heaviest one is tried
+    for peer in sorted(candidates, key=lambda p: candidates[p][0], reverse=True):
+        _, fork = candidates[peer]
+        try:
+            if fork is None:
+                response = await request_peer(peers, peer, "/", logger, download=True)
+                replaced = response is not None and await writer.submit(
+                    adopt_chain, blockchain, journal, response.json()["chain"]
+                )
+            else:
+                response = await request_peer(
+                    peers,
+                    peer,
+                    "/blocks",
+                    logger,
+                    params={"start": fork + 1},
+                    download=True,
+                )
+                replaced = response is not None and await writer.submit(
+                    adopt_branch, blockchain, journal, response.json()["blocks"]
+                )
+        except (IndexError, KeyError, InvalidChain, ValidationError) as e:
+            logger.warning(f"Peer {peer} sent an invalid chain: {e}")
+            continue
+        if replaced:
+            return {"replaced": True}
+    return {"replaced": False}
+
+
+def adopt_chain(
+    blockchain: ACBlockchain, journal: PolicyJournal, chain: list[dict]
+) -> bool:
+    replaced = blockchain.create_blockchain_from_request(
+        chain, lazy_bodies=True, min_work=blockchain.cumulative_work()
+    )
     if replaced:
-        blockchain.create_blockchain_from_request(max_chain)
+        journal.sync(blockchain.chain)
+    return replaced
 
-    return {"replaced": replaced}
 
+def adopt_branch(
+    blockchain: ACBlockchain, journal: PolicyJournal, blocks: list[dict]
+) -> bool:
+    replaced = blockchain.add_branch(blocks, lazy_bodies=True)
+    if replaced:
+        journal.sync(blockchain.chain)
+    return replaced
 
-async def announce_new_block(blockchain: ACBlockchain, peers: set, logger: Logger):
+
+async def request_peer(
+    peers: PeerTable,
+    peer: str,
+    path: str,
+    logger: Logger,
+    params: dict | None = None,
+    download: bool = False,
+) -> requests.Response | None:
     """
-    This function announces the new mined block to all the peers
-    :return:
+    This function sends a GET request to a peer, waiting for it as long as its measured RTT suggests, and records
+    the outcome in the peer table
+    :param download: Whether a large answer is expected, in which case only the connection is bound to the adaptive
+    timeout and the time taken is not used as RTT
+    :return: The response, or None if the peer did not answer successfully
     """
-    block_to_announce = blockchain.get_last_bloc
-    for peer_url in peers:
-        try:
-            response = requests.post(
-                url=f"http://{peer_url}/add-block",
-                data=json.dumps(block_to_announce.to_dict()),
-            )
-        except requests.exceptions.ConnectionError:
-            logger.warning(f"Peer {peer_url} is unreachable while announcing new block")
-        if response.status_code != 201:
-            logger.error(
-                f"The following error "
-                f"occured while announcing the new block to the peer {peer_url}: {response.content}"
+    timeout = peers.timeout(peer)
+    started = time.monotonic()
+    try:
+        response = await to_thread.run_sync(
+            partial(
+                requests.get,
+                url=f"http://{peer}{path}",
+                params=params,
+                timeout=(timeout, peers.max_timeout_s) if download else timeout,
             )
+        )
+    except requests.exceptions.RequestException:
+        peers.record_failure(peer)
+        logger.warning(f"Peer {peer} did not respond to {path}")
+        return None
+    if not download:
+        peers.record_success(peer, time.monotonic() - started)
+    if response.status_code != 200:
+        logger.error(f"Peer {peer} error on {path}: {response.status_code}")
+        return None
+    return response
+
+
+@router.get("/peers", status_code=200)
+async def peers_stats(peers: peers_dependency) -> dict:
+    return peers.stats()
+
+
+def announce_new_block(
+    blockchain: ACBlockchain, peers: set, outbound: OutboundScheduler
+):
+    """
+    This function queues the compact announcement of the new mined block for all the peers
+    :return:
+    """
+    outbound.announce_block(blockchain.chain[-1], blockchain.chain[-2], list(peers))
+
+
+@router.get("/outbound", status_code=200)
+async def outbound_stats(outbound: outbound_dependency) -> dict:
+    return outbound.stats()
 
 
 @router.post(path="/add-block", status_code=201)
 async def add_block(
-    in_block: InputBlock, blockchain: blockchain_dependency, mem_pool: policies_dep
+    in_block: InputBlock,
+    blockchain: blockchain_dependency,
+    journal: journal_dependency,
+    writer: writer_dependency,
+):
+    block_data = in_block.model_dump()
+    try:
+        body = ACBlockBody.from_dict(block_data.pop("body"))
+    except (KeyError, ValueError) as e:
+        return JSONResponse(
+            status_code=400, content=f"The body of the block is not valid: {e}"
+        )
+    block = ACBlock(**block_data, body=body)
+    return await writer.submit(append_block, block, blockchain, journal)
+
+
+@router.post(path="/add-compact-block", status_code=201)
+async def add_compact_block(
+    compact: CompactBlock,
+    blockchain: blockchain_dependency,
+    journal: journal_dependency,
+    writer: writer_dependency,
 ):
-    block = ACBlock(**in_block.model_dump())
+    """
+    This method receives the compact announcement of a block and rebuilds its body from the mem pool. When some
+    policies are missing, their short ids are returned so that the peer can send them, and when the block cannot be
+    rebuilt at all the peer is asked for the full block. The block may extend a competing branch, as long as its
+    parent is known.
+    :param compact:
+    :param blockchain:
+    :return:
+    """
+    return await writer.submit(append_compact_block, compact, blockchain, journal)
+
+
+def append_compact_block(
+    compact: CompactBlock, blockchain: ACBlockchain, journal: PolicyJournal
+) -> JSONResponse:
+    parent = blockchain.find_block(compact.previous_hash, compact.index - 1)
+    if parent is None:
+        return JSONResponse(
+            status_code=400,
+            content=f"Current index is {blockchain.get_last_bloc.index}, but the index passed is {compact.index}",
+        )
+    try:
+        block, missing = compact_block.reconstruct(
+            compact.model_dump(),
+            blockchain.unconfirmed_transactions,
+            parent,
+        )
+    except InvalidChain:
+        return JSONResponse(status_code=200, content={"full": True})
+    if missing:
+        return JSONResponse(status_code=200, content={"missing": missing})
+    return append_block(block, blockchain, journal)
+
+
+def append_block(
+    block: ACBlock, blockchain: ACBlockchain, journal: PolicyJournal
+) -> JSONResponse:
+    tip = blockchain.get_last_bloc
     try:
         result = blockchain.add_block(block)
     except (IndexError, InvalidChain) as e:
@@ -208,31 +680,63 @@ async def add_block(
             status_code=400,
             content=f"Block discarded by the node due to the following error: {e}",
         )
-    if not blockchain.is_chain_valid() or not result:
-        blockchain.chain.pop(-1)
+    try:
+        chain_valid = blockchain.is_chain_valid()
+    except (IndexError, InvalidChain):
+        chain_valid = False
+    if not chain_valid or not result:
+        # The block may have extended the tip, reorganized the chain to its branch or only joined a side branch
+        blockchain.restore_tip(tip, block)
         return JSONResponse(
             status_code=400,
             content="Last block invalidated the chain, reverting back...",
         )
+    if blockchain.get_last_bloc is not block:
+        return JSONResponse(
+            status_code=201, content="Block added to a competing branch"
+        )
     # If the block is added successfully and the blockchain is valid then we remove
     # the transactions added to the block from our transactions pool
-    new_unconfirmed_transactions = []
-    for policy in blockchain.unconfirmed_transactions:
-        if block.body.policies.get(policy.id, None) is not None:
-            new_unconfirmed_transactions.append(policy)
-    blockchain.unconfirmed_transactions = new_unconfirmed_transactions
+    blockchain.remove_confirmed_transactions(block)
+    journal.sync(blockchain.chain)
     return JSONResponse(status_code=201, content="Block added successfully")
 
 
+@router.get(path="/validate-chain", status_code=200)
+async def validate_chain(blockchain: blockchain_dependency, writer: writer_dependency):
+    """
+    This function verifies the whole chain again from the genesis block, splitting the work across processes.
+    It is meant for audits, since blocks appended through /add-block are already verified incrementally. The
+    verification moves the mark of the blocks already verified, so it is submitted to the writer like a change.
+    :return:
+    """
+    try:
+        await writer.submit(
+            to_thread.run_sync,
+            partial(
+                blockchain.is_chain_valid,
+                full=True,
+                workers=settings.validation_workers,
+            ),
+        )
+    except (IndexError, InvalidChain) as e:
+        return JSONResponse(status_code=409, content=f"The chain is not valid: {e}")
+    return {"valid": True, "height": writer.read().tip.index}
+
+
 @router.post(path="/register-with-node", status_code=200)
 async def register_with_node(
     node_to_register: RegisterNode,
     peers: peers_dependency,
     blockchain: blockchain_dependency,
-    mem_policies: policies_dep,
+    journal: journal_dependency,
+    writer: writer_dependency,
+    logger: logger_dep,
 ):
     """
-    This function register with an existing node, and it syncs with the blockchain that the node has
+    This function register with an existing node, and it syncs with the blockchain that the node has.
+    When the node sends a checkpoint signed by one of the trusted publishers, the blocks below it are only checked
+    to be linked by their hashes, and the policies rebuilt from them are checked against the digest of the checkpoint.
     :return:
     """
     node_info = node_to_register.model_dump()
@@ -246,7 +750,7 @@ async def register_with_node(
         )
     # Register with node
     try:
-        response = requests.post(
+        response = requests.get(
             url=f"http://{node_info['node_address']}:{node_info['node_port']}/register-peer"
         )
     except requests.exceptions.ConnectionError:
@@ -254,7 +758,7 @@ async def register_with_node(
             status_code=400,
             content=f"Could not connect with node at {node_info['node_address']}",
         )
-    if response.status_code != 201:
+    if response.status_code != 200:
         return JSONResponse(
             status_code=400,
             content=f"Could not register with node at {node_info['node_address']}\n, {response.content}",
@@ -264,12 +768,315 @@ async def register_with_node(
     peers.update(set(data["peers"]))
     # Then I add to my peers the node that I am registering to
     peers.add(f"{node_info['node_address']}:{node_info['node_port']}")
-    # Updating local view of the blockchain
-    blockchain.create_blockchain_from_request(data["chain"])
-    # Then I refresh my view of the access policies
-    await update_local_cache(mem_policies, blockchain)
+    checkpoint = None
+    if settings.checkpoint_keys and data.get("checkpoint", None):
+        checkpoint = Checkpoint.from_dict(data["checkpoint"])
+        try:
+            checkpoint.verify(settings.checkpoint_keys, verify_user_message)
+        except InvalidChain as e:
+            logger.warning(
+                f"Ignoring the checkpoint, the chain is verified in full: {e}"
+            )
+            checkpoint = None
+    # Updating local view of the blockchain, and then of the access policies
+    try:
+        await writer.submit(
+            replace_chain, blockchain, journal, data["chain"], checkpoint
+        )
+    except (IndexError, KeyError, InvalidChain, ValidationError) as e:
+        return JSONResponse(
+            status_code=400,
+            content=f"The chain of node {node_info['node_address']} is not valid: {e}",
+        )
     return JSONResponse(
         status_code=200,
         content=f"Successfully registered to node {node_info['node_address']}, and now I can see the following"
         f" peers: {peers}",
     )
+
+
+def replace_chain(
+    blockchain: ACBlockchain,
+    journal: PolicyJournal,
+    chain: list[dict],
+    checkpoint: Checkpoint | None,
+) -> None:
+    """
+    This function swaps the chain for the one of the node registered with and refreshes the cache of the policies. A
+    chain whose policies do not match the checkpoint is refused before it is swapped, so the node keeps its own.
+    """
+    blockchain.create_blockchain_from_request(
+        chain, lazy_bodies=True, checkpoint=checkpoint
+    )
+    journal.sync(blockchain.chain)
+
+
+@router.get("/headers", status_code=200)
+async def get_headers(
+    writer: writer_dependency, start: int = 0, end: int | None = None
+) -> dict:
+    """
+    This method returns the headers of the blocks starting from the given index
+    :param writer:
+    :param start:
+    :param end: The index past the last header, the tip when not given
+    :return:
+    """
+    return {"headers": [block.header for block in writer.read().chain[start:end]]}
+
+
+@router.get("/blocks", status_code=200)
+async def get_blocks(
+    writer: writer_dependency, start: int = 0, end: int | None = None
+) -> dict:
+    """
+    This method returns the blocks starting from the given index, it is used by the peers to download the blocks past
+    the point where their chain forks off this one
+    :param writer:
+    :param start:
+    :param end: The index past the last block, the tip when not given
+    :return:
+    """
+    return {"blocks": [block.to_dict() for block in writer.read().chain[start:end]]}
+
+
+@router.get("/merkle-proof", status_code=200)
+async def merkle_proof(
+    writer: writer_dependency,
+    height: int,
+    policy_id: str | None = None,
+    user_id: str | None = None,
+    event: str | None = None,
+):
+    """
+    This method returns the proof that a resource policy, an identity policy (when user_id is given) or a row of the
+    events table is in the block at the given height. The proof is checked against the merkle root in the header of
+    the block, with merkle.verify_proof, so that a client holding the headers does not need the body of the block.
+    :param height:
+    :param policy_id: The key of the policy
+    :param user_id: The user the identity policy belongs to
+    :param event: The key of the row of the events table
+    :return:
+    """
+    chain = writer.read().chain
+    if not 0 <= height < len(chain):
+        return JSONResponse(status_code=404, content=f"There is no block #{height}")
+    block = chain[height]
+    if block.merkle_root is None:
+        return JSONResponse(
+            status_code=404,
+            content=f"Block #{height} does not commit to a merkle root",
+        )
+    if event is not None:
+        key = ("events", event)
+    elif user_id is not None:
+        key = ("identity_policies", user_id, policy_id)
+    else:
+        key = ("resource_policies", policy_id)
+    proof = block.inclusion_proof(key)
+    if proof is None:
+        return JSONResponse(
+            status_code=404, content=f"Block #{height} holds no {key[0]} {key[1:]}"
+        )
+    return {"height": height, "header": block.header, **proof}
+
+
+def policy_deltas(
+    chain: Sequence[ACBlock], since: int, block_hash: str | None, max_blocks: int
+) -> dict:
+    """
+    This function returns the policies of the blocks past the given one, which is identified by its height and its
+    hash. If the chain no longer holds that block, for instance after a reorganization, the policies are returned
+    from the genesis block and the answer is flagged as a reset, so that the replica rebuilds its state.
+    :param chain:
+    :param since: The height of the last block the replica has applied, -1 for none
+    :param block_hash: The hash of that block
+    :param max_blocks: How many blocks are returned at most
+    :return:
+    """
+    reset = since >= 0 and (
+        since >= len(chain) or chain[since].compute_hash() != block_hash
+    )
+    start = 0 if reset else since + 1
+    return {
+        "height": len(chain) - 1,
+        "reset": reset,
+        "blocks": [
+            {
+                "index": block.index,
+                "hash": block.compute_hash(),
+                "resource_policies": {
+                    key: policy.model_dump(mode="json")
+                    for key, policy in block.policies.resource_policies.items()
+                },
+                "identity_policies": {
+                    user_id: {
+                        key: policy.model_dump(mode="json")
+                        for key, policy in policies.items()
+                    }
+                    for user_id, policies in block.policies.identity_policies.items()
+                },
+            }
+            for block in chain[start : start + max_blocks]
+        ],
+    }
+
+
+@router.get("/policy-deltas", status_code=200)
+async def get_policy_deltas(
+    writer: writer_dependency,
+    since: int = -1,
+    block_hash: str | None = None,
+    wait_s: float = 0.0,
+    max_blocks: int = 100,
+):
+    """
+    This method is the feed the read replicas of the light nodes follow. The policies of the blocks past the one the
+    replica has applied are returned, and when there are none the request is held for up to wait_s seconds until a
+    block is added, so that a replica hears of a new block as soon as it is committed.
+    :param since: The height of the last block the replica has applied, -1 for none
+    :param block_hash: The hash of that block
+    :param wait_s: How long the request is held when there are no new blocks, at most MAX_DELTA_WAIT_S
+    :param max_blocks: How many blocks are returned at most, at most settings.policy_deltas_max_blocks. A replica that
+    starts from genesis or is reset gets the chain over several requests.
+    :return:
+    """
+    deadline = time.monotonic() + min(max(wait_s, 0.0), MAX_DELTA_WAIT_S)
+    max_blocks = min(max(max_blocks, 1), settings.policy_deltas_max_blocks)
+    # The snapshot is looked up each time, since the writer publishes a new one after each change. The answer hashes
+    # the blocks and may read their policies from their raw bodies, so it is built in a worker thread.
+    snapshot = writer.read()
+    deltas = await to_thread.run_sync(
+        policy_deltas, snapshot.chain, since, block_hash, max_blocks
+    )
+    while not deltas["blocks"] and time.monotonic() < deadline:
+        latest = await writer.wait_for_change(
+            snapshot.version, deadline - time.monotonic()
+        )
+        if latest.tip is not snapshot.tip:
+            deltas = await to_thread.run_sync(
+                policy_deltas, latest.chain, since, block_hash, max_blocks
+            )
+        snapshot = latest
+    return deltas
+
+
+@router.get("/block-tree", status_code=200)
+async def block_tree_stats(blockchain: blockchain_dependency) -> dict:
+    return {
+        "height": blockchain.get_last_bloc.index,
+        "work": blockchain.cumulative_work(),
+        **blockchain.tree.stats(),
+    }
+
+
+@router.websocket(STREAM_PATH)
+async def peer_stream(
+    websocket: WebSocket,
+    peers: peers_dependency,
+    seen: seen_dependency,
+    outbound: outbound_dependency,
+    miner: miner_dependency,
+    journal: journal_dependency,
+    writer: writer_dependency,
+    logger: logger_dep,
+):
+    """
+    This method serves the WebSocket channel opened by a peer. Each frame is handled as the REST route it replaces
+    would handle it, and it is answered with a reply frame carrying the same id, status code and content. A frame
+    that cannot be read is answered with a 422 reply without id, and the channel stays open.
+    :return:
+    """
+    await websocket.accept()
+    origin = f"{websocket.client.host}:{websocket.client.port}"
+    logger.info("Peer %s opened a channel", origin)
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            try:
+                # Frames are sent as text, a binary one is read all the same
+                frame = StreamFrame.model_validate_json(
+                    message.get("text", None) or message.get("bytes", None) or ""
+                )
+            except ValidationError as e:
+                logger.warning("Peer %s sent a malformed frame", origin)
+                await websocket.send_text(
+                    make_reply(None, 422, e.errors(include_url=False))
+                )
+                continue
+            if frame.type == "ping":
+                await websocket.send_text(make_frame("pong", frame.id))
+                continue
+            # The chain is fetched for each frame, since the connection outlives the requests
+            blockchain = get_blockchain()
+            try:
+                response = await handle_frame(
+                    frame,
+                    origin,
+                    blockchain,
+                    peers,
+                    seen,
+                    outbound,
+                    journal,
+                    writer,
+                    logger,
+                )
+            except ValidationError as e:
+                response = JSONResponse(
+                    status_code=422, content=e.errors(include_url=False)
+                )
+            except (KeyError, ValueError, IndexError, InvalidChain) as e:
+                # A frame the node cannot apply is refused, the channel stays open for the next ones
+                logger.warning("Peer %s sent a frame that failed: %r", origin, e)
+                response = JSONResponse(
+                    status_code=400, content=f"The frame could not be applied: {e!r}"
+                )
+            miner.notify()
+            await websocket.send_text(
+                make_reply(frame.id, response.status_code, json.loads(response.body))
+            )
+    except WebSocketDisconnect:
+        logger.info("Peer %s closed its channel", origin)
+
+
+async def handle_frame(
+    frame: StreamFrame,
+    origin: str,
+    blockchain: ACBlockchain,
+    peers: PeerTable,
+    seen: SeenCache,
+    outbound: OutboundScheduler,
+    journal: PolicyJournal,
+    writer: ChainWriter,
+    logger: Logger,
+) -> JSONResponse:
+    match frame.type:
+        case "transactions":
+            if is_oversized_batch(frame.payload):
+                return JSONResponse(status_code=413, content=batch_too_large())
+            return receive_policies(
+                policies_adapter.validate_python(frame.payload),
+                frame.hops,
+                origin,
+                blockchain,
+                peers,
+                seen,
+                outbound,
+                logger,
+            )
+        case "compact_block":
+            return await add_compact_block(
+                CompactBlock.model_validate(frame.payload), blockchain, journal, writer
+            )
+        case "block":
+            return await add_block(
+                InputBlock.model_validate(frame.payload), blockchain, journal, writer
+            )
+        case "headers":
+            return JSONResponse(
+                status_code=200,
+                content=await get_headers(writer, frame.start),
+            )
+    return JSONResponse(status_code=400, content=f"Unknown frame type {frame.type}")
@@ -2,7 +2,106 @@
 These nodes do not store a copy of the blockchain and if they want to commit any transactions they need to pass them to
 full nodes/publishing nodes."""
 
-from fastapi import APIRouter
+from typing import Annotated
 
+from anyio import to_thread
+from fastapi import APIRouter, Depends
+from starlette.responses import JSONResponse
 
-router = APIRouter()
+from blockchain.errors import InvalidChain
+from node import LightNode
+from ..ac_validation import PolicyTransaction
+from ..dependency import get_light_node, get_policy_replica, get_forwarder
+from ..forwarder import ForwarderFull, TransactionForwarder
+from ..replica import PolicyReplica
+
+router = APIRouter(prefix="/light", dependencies=[Depends(get_light_node)])
+
+light_node_dependency = Annotated[LightNode, Depends(get_light_node)]
+replica_dependency = Annotated[PolicyReplica | None, Depends(get_policy_replica)]
+forwarder_dependency = Annotated[TransactionForwarder, Depends(get_forwarder)]
+
+
+@router.get("/sync", status_code=200)
+async def sync(light_node: light_node_dependency):
+    """
+    This method downloads and verifies the headers appended by the full nodes since the last sync
+    :param light_node:
+    :return:
+    """
+    try:
+        added = await to_thread.run_sync(light_node.sync)
+    except ConnectionError as e:
+        return JSONResponse(status_code=503, content=str(e))
+    return {"added": added, **light_node.headers.stats()}
+
+
+@router.get("/headers", status_code=200)
+async def headers_stats(light_node: light_node_dependency):
+    if light_node.headers is None:
+        return JSONResponse(status_code=404, content="No header has been synced yet")
+    return light_node.headers.stats()
+
+
+@router.get("/verify-policy", status_code=200)
+async def verify_policy(
+    light_node: light_node_dependency,
+    height: int,
+    policy_id: str,
+    user_id: str | None = None,
+):
+    """
+    This method checks that a policy is in the block at the given height, with the proof of a full node checked
+    against the local header of the block
+    :param height:
+    :param policy_id:
+    :param user_id: The user the identity policy belongs to
+    :return: The policy as stored in the block
+    """
+    try:
+        policy = await to_thread.run_sync(
+            light_node.verify_policy, height, policy_id, user_id
+        )
+    except (LookupError, IndexError) as e:
+        return JSONResponse(status_code=404, content=str(e))
+    except InvalidChain as e:
+        return JSONResponse(status_code=502, content=str(e))
+    except ConnectionError as e:
+        return JSONResponse(status_code=503, content=str(e))
+    return {"height": height, "verified": True, "policy": policy}
+
+
+@router.post("/pass-transactions", status_code=201)
+async def pass_transactions(
+    policies: list[PolicyTransaction],
+    forwarder: forwarder_dependency,
+):
+    """
+    This method hands a batch of policies to a full node, since light nodes do not mine blocks. The policies are
+    batched with the ones submitted by the other clients, and the answer is sent once their batch has been accepted.
+    :param policies:
+    :param forwarder:
+    :return: The answer of the full node that accepted the batch
+    """
+    try:
+        return await forwarder.submit(
+            [policy.model_dump(mode="json") for policy in policies]
+        )
+    except ForwarderFull as e:
+        return JSONResponse(status_code=503, content=str(e))
+    except ConnectionError as e:
+        return JSONResponse(status_code=502, content=str(e))
+
+
+@router.get("/forwarder", status_code=200)
+async def forwarder_stats(forwarder: forwarder_dependency):
+    return forwarder.stats()
+
+
+@router.get("/replica", status_code=200)
+async def replica_stats(replica: replica_dependency):
+    if replica is None:
+        return JSONResponse(
+            status_code=404, content="Only light nodes replicate the policies"
+        )
+    return replica.stats()
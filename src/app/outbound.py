@@ -0,0 +1,340 @@
+"""This module contains the scheduler of the messages a node sends to its peers. Each peer has its own bounded queue,
+served by its own task, so that a slow peer neither stalls the request handlers nor the other peers.
+"""
+
+import asyncio
+import json
+import time
+from collections import deque
+from functools import partial
+from logging import Logger
+
+import requests
+from anyio import to_thread
+
+from blockchain import compact_block
+from blockchain.ac_block import ACBlock
+from .peers import PeerTable
+from .stream import CHANNEL_ERRORS, FRAME_TYPES, PeerChannel
+
+
+class PeerOutbox:
+    """
+    The pending messages for a single peer. Block announcements and policies are kept in two separate queues, so that
+    blocks can always be sent first, and consecutive policies can be coalesced into a single batched message.
+    """
+
+    def __init__(self, peer: str):
+        self.peer = peer
+        self.blocks: deque[tuple[dict, ACBlock]] = deque()
+        self.policies: deque[tuple[dict, int]] = deque()
+        self.wakeup = asyncio.Event()
+        self.needs_resync = False
+        self.task: asyncio.Task | None = None
+        self.channel: PeerChannel | None = None
+        self.consecutive_failures = 0
+        self.stats = {
+            "sent_blocks": 0,
+            "missing_requests": 0,
+            "full_blocks": 0,
+            "sent_batches": 0,
+            "sent_policies": 0,
+            "dropped": 0,
+            "resyncs": 0,
+            "failures": 0,
+            "streamed": 0,
+        }
+
+    def has_pending(self) -> bool:
+        return bool(self.blocks or self.policies or self.needs_resync)
+
+    def drop_pending(self) -> None:
+        self.stats["dropped"] += len(self.blocks) + len(self.policies)
+        self.blocks.clear()
+        self.policies.clear()
+
+
+class OutboundScheduler:
+    """
+    Messages are enqueued without waiting for the peers to answer. When a peer falls too far behind, meaning that its
+    queue would exceed its bound or that it keeps failing, its pending messages are dropped and it is asked to resync
+    by running consensus, since it will find the missing policies in the blocks it pulls.
+    When streaming is enabled the messages are pushed over a WebSocket channel kept open towards each peer, and plain
+    HTTP requests are only used when the channel cannot be established.
+    When a peer table is given, the timeouts follow the RTT measured for each peer, the outcome of every message is
+    recorded in it, and no message is sent to a peer while it is backing off after a failure. A resync is the
+    exception: the peer answers it once it has run consensus, which can take far longer than any RTT, so it is given
+    the fixed resync_timeout_s, and a peer still running consensus when it expires is not held to have failed.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        max_pending: int = 1000,
+        max_pending_blocks: int = 16,
+        batch_size: int = 500,
+        timeout_s: float = 1.0,
+        resync_timeout_s: float = 30.0,
+        max_failures: int = 5,
+        streaming: bool = False,
+        ping_interval_s: float | None = 20.0,
+        peer_table: PeerTable | None = None,
+    ):
+        self.logger = logger
+        self.max_pending = max_pending
+        self.max_pending_blocks = max_pending_blocks
+        self.batch_size = batch_size
+        self.timeout_s = timeout_s
+        self.resync_timeout_s = resync_timeout_s
+        self.max_failures = max_failures
+        self.streaming = streaming
+        self.ping_interval_s = ping_interval_s
+        self.peer_table = peer_table
+        self.outboxes: dict[str, PeerOutbox] = {}
+
+    def _outbox(self, peer: str) -> PeerOutbox:
+        outbox = self.outboxes.get(peer, None)
+        if outbox is None:
+            outbox = PeerOutbox(peer)
+            self.outboxes[peer] = outbox
+        if outbox.task is None or outbox.task.done():
+            outbox.task = asyncio.get_running_loop().create_task(self._serve(outbox))
+        return outbox
+
+    def send_policies(self, policies: list[dict], peers: list[str], hops: int) -> None:
+        for peer in peers:
+            outbox = self._outbox(peer)
+            if len(outbox.policies) + len(policies) > self.max_pending:
+                self.logger.warning(
+                    f"Peer {peer} is too far behind, dropping its pending messages"
+                )
+                outbox.drop_pending()
+                outbox.stats["dropped"] += len(policies)
+                outbox.needs_resync = True
+            else:
+                outbox.policies.extend((policy, hops) for policy in policies)
+            outbox.wakeup.set()
+
+    def announce_block(self, block: ACBlock, parent: ACBlock, peers: list[str]) -> None:
+        """
+        Queues the compact announcement of a block, the block itself is kept so that the policies the peers are
+        missing, or the whole block, can be sent to them
+        :param block:
+        :param parent:
+        :param peers:
+        :return:
+        """
+        announcement = (compact_block.to_compact(block, parent), block)
+        for peer in peers:
+            outbox = self._outbox(peer)
+            if len(outbox.blocks) >= self.max_pending_blocks:
+                self.logger.warning(
+                    f"Peer {peer} is too many blocks behind, it will be asked to resync"
+                )
+                outbox.drop_pending()
+                outbox.needs_resync = True
+            else:
+                outbox.blocks.append(announcement)
+            outbox.wakeup.set()
+
+    async def _serve(self, outbox: PeerOutbox) -> None:
+        while True:
+            await outbox.wakeup.wait()
+            outbox.wakeup.clear()
+            while outbox.has_pending():
+                await self._send_next(outbox)
+
+    def _timeout(self, peer: str) -> float:
+        if self.peer_table is None:
+            return self.timeout_s
+        return self.peer_table.timeout(peer)
+
+    async def _send_next(self, outbox: PeerOutbox) -> None:
+        if self.peer_table is not None:
+            await asyncio.sleep(self.peer_table.backoff_remaining(outbox.peer))
+        if outbox.needs_resync:
+            outbox.needs_resync = False
+            outbox.stats["resyncs"] += 1
+            try:
+                response = await self._request(
+                    outbox, "get", "/consensus", timeout_s=self.resync_timeout_s
+                )
+                sent = response is not None
+            except requests.exceptions.ReadTimeout:
+                # The peer has taken the request and is still running consensus
+                self.logger.info(f"Peer {outbox.peer} is still resyncing")
+                sent = True
+        elif outbox.blocks:
+            # Block announcements always take priority over policies
+            sent = await self._send_block(outbox, *outbox.blocks.popleft())
+            outbox.stats["sent_blocks"] += sent
+        else:
+            batch = [
+                outbox.policies.popleft()
+                for _ in range(min(self.batch_size, len(outbox.policies)))
+            ]
+            # The batch is forwarded with the highest hop count among its policies, so that no hop limit is exceeded
+            response = await self._request(
+                outbox,
+                "post",
+                "/add-policies",
+                data=[policy for policy, _ in batch],
+                params={"hops": max(hops for _, hops in batch)},
+            )
+            sent = response is not None
+            outbox.stats["sent_batches"] += sent
+            outbox.stats["sent_policies"] += len(batch) if sent else 0
+        if sent:
+            outbox.consecutive_failures = 0
+            return
+        outbox.consecutive_failures += 1
+        outbox.stats["failures"] += 1
+        if outbox.consecutive_failures >= self.max_failures:
+            self.logger.warning(
+                f"Peer {outbox.peer} failed {outbox.consecutive_failures} times in a row, dropping its messages"
+            )
+            outbox.drop_pending()
+            outbox.consecutive_failures = 0
+
+    async def _send_block(
+        self, outbox: PeerOutbox, compact: dict, block: ACBlock
+    ) -> bool:
+        """
+        Sends the compact announcement of a block. If the peer answers with the short ids it could not find in its mem
+        pool, the announcement is sent again along with those policies, and if the peer could not rebuild the block at
+        all, the full block is sent instead
+        :return:
+        """
+        response = await self._request(outbox, "post", "/add-compact-block", compact)
+        if response is None:
+            return False
+        answer = response.json() if response.status_code == 200 else {}
+        if answer.get("missing", None):
+            compact = {
+                **compact,
+                "transactions": compact_block.find_transactions(
+                    block, answer["missing"]
+                ),
+            }
+            outbox.stats["missing_requests"] += 1
+            response = await self._request(
+                outbox, "post", "/add-compact-block", compact
+            )
+            if response is None:
+                return False
+            answer = response.json() if response.status_code == 200 else {}
+        if answer.get("full", False):
+            outbox.stats["full_blocks"] += 1
+            response = await self._request(
+                outbox, "post", "/add-block", block.to_dict()
+            )
+        return response is not None
+
+    async def _request(
+        self,
+        outbox: PeerOutbox,
+        method: str,
+        path: str,
+        data: dict | list | None = None,
+        params: dict | None = None,
+        timeout_s: float | None = None,
+    ) -> requests.Response | None:
+        """
+        Sends a message to the peer, over its channel when there is one for the path, and records the outcome in the
+        peer table
+        :param timeout_s: A fixed timeout replacing the one measured for the peer, a peer that does not answer within
+        it is not recorded as failed and the ReadTimeout is raised to the caller
+        :return: The response, or None if the peer could not be reached or returned an error
+        """
+        frame_type = FRAME_TYPES.get(path, None)
+        started = time.monotonic()
+        if self.streaming and frame_type is not None:
+            response = await self._stream_request(outbox, frame_type, data, params)
+            if response is not None:
+                outbox.stats["streamed"] += 1
+                self._record_success(outbox.peer, time.monotonic() - started)
+                return self._check_response(outbox, path, response)
+            started = time.monotonic()
+        try:
+            response = await to_thread.run_sync(
+                partial(
+                    requests.request,
+                    method,
+                    url=f"http://{outbox.peer}{path}",
+                    params=params,
+                    data=json.dumps(data, default=str) if data is not None else None,
+                    timeout=timeout_s or self._timeout(outbox.peer),
+                )
+            )
+        except requests.exceptions.RequestException as e:
+            if timeout_s is not None and isinstance(e, requests.exceptions.ReadTimeout):
+                raise
+            self.logger.warning(f"Peer {outbox.peer} did not respond to {path}")
+            if self.peer_table is not None:
+                self.peer_table.record_failure(outbox.peer)
+            return None
+        self._record_success(outbox.peer, time.monotonic() - started)
+        return self._check_response(outbox, path, response)
+
+    def _record_success(self, peer: str, rtt_s: float) -> None:
+        if self.peer_table is not None:
+            self.peer_table.record_success(peer, rtt_s)
+
+    async def _stream_request(
+        self,
+        outbox: PeerOutbox,
+        frame_type: str,
+        data: dict | list | None,
+        params: dict | None,
+    ):
+        if outbox.channel is None:
+            outbox.channel = PeerChannel(
+                outbox.peer,
+                self.logger,
+                timeout_s=self.timeout_s,
+                ping_interval_s=self.ping_interval_s,
+            )
+        if not outbox.channel.available():
+            return None
+        outbox.channel.timeout_s = self._timeout(outbox.peer)
+        try:
+            return await outbox.channel.request(frame_type, data, **(params or {}))
+        except CHANNEL_ERRORS as e:
+            self.logger.warning(
+                f"Channel towards peer {outbox.peer} failed on {frame_type}, falling back to HTTP: {e!r}"
+            )
+            return None
+
+    def _check_response(self, outbox: PeerOutbox, path: str, response):
+        if response.status_code >= 400:
+            self.logger.warning(
+                f"Peer {outbox.peer} returned the following error on {path}: "
+                f"{response.status_code}/{response.content}"
+            )
+            return None
+        return response
+
+    def stats(self) -> dict:
+        return {
+            peer: {
+                "pending_blocks": len(outbox.blocks),
+                "pending_policies": len(outbox.policies),
+                **outbox.stats,
+            }
+            for peer, outbox in self.outboxes.items()
+        }
+
+    async def stop(self) -> None:
+        for outbox in self.outboxes.values():
+            if outbox.task is not None:
+                outbox.task.cancel()
+        await asyncio.gather(
+            *(outbox.task for outbox in self.outboxes.values() if outbox.task),
+            *(
+                outbox.channel.close()
+                for outbox in self.outboxes.values()
+                if outbox.channel
+            ),
+            return_exceptions=True,
+        )
+        self.outboxes.clear()
@@ -0,0 +1,128 @@
+"""This module contains the table of the peers of a node, which keeps, along with their addresses, how healthy each of
+them has been: how fast it answers, how many times in a row it failed, when it was last seen and the height of its
+chain.
+"""
+
+import time
+
+
+class PeerHealth:
+    """
+    The health of a single peer. The timeout of the requests follows the measured round trip time as in TCP, the
+    smoothed RTT plus four times its variation, and after each consecutive failure the peer is left alone for twice as
+    long as the previous time.
+    """
+
+    def __init__(self):
+        self.srtt: float | None = None
+        self.rttvar: float = 0.0
+        self.failures = 0
+        self.last_seen: float | None = None
+        self.tip_height: int | None = None
+        self.backoff_until = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "rtt_s": self.srtt,
+            "rttvar_s": self.rttvar,
+            "failures": self.failures,
+            "last_seen": self.last_seen,
+            "tip_height": self.tip_height,
+            "backoff_s": max(0.0, self.backoff_until - time.monotonic()),
+        }
+
+
+class PeerTable(set):
+    """
+    The addresses of the peers, stored as a set so that it can be used wherever the plain set of peers was, along with
+    the health of each of them
+    """
+
+    def __init__(
+        self,
+        peers=(),
+        min_timeout_s: float = 0.2,
+        max_timeout_s: float = 2.5,
+        backoff_base_s: float = 1.0,
+        backoff_max_s: float = 60.0,
+    ):
+        super().__init__(peers)
+        self.min_timeout_s = min_timeout_s
+        self.max_timeout_s = max_timeout_s
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self._health: dict[str, PeerHealth] = {}
+
+    def health(self, peer: str) -> PeerHealth:
+        health = self._health.get(peer, None)
+        if health is None:
+            health = PeerHealth()
+            self._health[peer] = health
+        return health
+
+    def discard(self, peer: str) -> None:
+        super().discard(peer)
+        self._health.pop(peer, None)
+
+    def timeout(self, peer: str) -> float:
+        """
+        Returns how long to wait for an answer of the peer, the maximum timeout is used until its RTT is measured
+        :param peer:
+        :return:
+        """
+        health = self.health(peer)
+        if health.srtt is None:
+            return self.max_timeout_s
+        return min(
+            self.max_timeout_s,
+            max(self.min_timeout_s, health.srtt + 4 * health.rttvar),
+        )
+
+    def backoff_remaining(self, peer: str) -> float:
+        return max(0.0, self.health(peer).backoff_until - time.monotonic())
+
+    def is_available(self, peer: str) -> bool:
+        return self.backoff_remaining(peer) == 0.0
+
+    def record_success(
+        self, peer: str, rtt_s: float, tip_height: int | None = None
+    ) -> None:
+        health = self.health(peer)
+        if health.srtt is None:
+            health.srtt = rtt_s
+            health.rttvar = rtt_s / 2
+        else:
+            health.rttvar = 0.75 * health.rttvar + 0.25 * abs(health.srtt - rtt_s)
+            health.srtt = 0.875 * health.srtt + 0.125 * rtt_s
+        health.failures = 0
+        health.backoff_until = 0.0
+        health.last_seen = time.time()
+        if tip_height is not None:
+            health.tip_height = tip_height
+
+    def record_failure(self, peer: str) -> None:
+        health = self.health(peer)
+        health.failures += 1
+        # The exponent is bounded, a peer that stays down would otherwise overflow the float after 1024 failures
+        backoff = min(
+            self.backoff_max_s,
+            self.backoff_base_s * 2 ** min(health.failures - 1, 32),
+        )
+        health.backoff_until = time.monotonic() + backoff
+
+    def available(self) -> list[str]:
+        """
+        Returns the peers that are not backing off, the healthiest first: the ones that failed less recently, and
+        then the fastest ones
+        :return:
+        """
+        return sorted(
+            (peer for peer in self if self.is_available(peer)),
+            key=lambda peer: (
+                self.health(peer).failures,
+                self.health(peer).srtt if self.health(peer).srtt is not None else 0.0,
+            ),
+        )
+
+    def stats(self) -> dict:
+        return {peer: self.health(peer).to_dict() for peer in self}
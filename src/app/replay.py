@@ -0,0 +1,85 @@
+"""This module contains the cache that keeps a signed challenge from being used twice. The challenges themselves are
+stateless, see security.issue_nonce, so the node only has to remember the ones that have been answered, and only until
+they expire: past that a replayed answer is refused anyway.
+"""
+
+import math
+import time
+
+
+class ReplayCacheFull(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class ReplayCache:
+    """
+    The keys are dropped by a timer wheel: a ring of slots, each holding the keys that expire within the same tick_s
+    seconds, so that expiring them costs a single pass over the slots the clock has gone past instead of a scan of the
+    whole cache. The wheel spans max_ttl_s seconds, a key expiring later is kept until the end of the span.
+    The cache never holds more than max_entries keys. A key cannot be dropped before it expires without letting its
+    challenge be replayed, so once the cache is full new keys are refused until some expire.
+    """
+
+    def __init__(
+        self, max_ttl_s: float = 300, tick_s: float = 1.0, max_entries: int = 1_000_000
+    ):
+        self.tick_s = tick_s
+        self.max_entries = max_entries
+        self.slots: list[set[str]] = [
+            set() for _ in range(max(1, math.ceil(max_ttl_s / tick_s)) + 2)
+        ]
+        self._entries: dict[str, int] = {}
+        self._tick = self._tick_at(time.time())
+        self._stats = {"added": 0, "replayed": 0, "refused": 0, "expired": 0}
+
+    def _tick_at(self, timestamp: float) -> int:
+        return math.floor(timestamp / self.tick_s)
+
+    def _advance(self, now: float) -> None:
+        tick = self._tick_at(now)
+        # Past a whole turn of the wheel every slot has expired
+        for passed in range(
+            self._tick + 1, min(tick, self._tick + len(self.slots)) + 1
+        ):
+            slot = self.slots[passed % len(self.slots)]
+            for key in slot:
+                del self._entries[key]
+            self._stats["expired"] += len(slot)
+            slot.clear()
+        self._tick = max(self._tick, tick)
+
+    def add(self, key: str, expires_at: float) -> bool:
+        """
+        Records a key until the given time
+        :param key:
+        :param expires_at: The UNIX time the challenge of the key expires at
+        :return: False if the key had already been recorded
+        """
+        self._advance(time.time())
+        if key in self._entries:
+            self._stats["replayed"] += 1
+            return False
+        if len(self._entries) >= self.max_entries:
+            self._stats["refused"] += 1
+            raise ReplayCacheFull("Too many challenges are pending, retry later")
+        # A key is dropped once the tick it expires in has passed, and never past the span of the wheel
+        tick = min(
+            max(self._tick_at(expires_at) + 1, self._tick + 1),
+            self._tick + len(self.slots) - 1,
+        )
+        self.slots[tick % len(self.slots)].add(key)
+        self._entries[key] = tick
+        self._stats["added"] += 1
+        return True
+
+    def __contains__(self, key: str) -> bool:
+        self._advance(time.time())
+        return key in self._entries
+
+    def __len__(self) -> int:
+        self._advance(time.time())
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {"entries": len(self), **self._stats}
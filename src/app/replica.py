@@ -0,0 +1,187 @@
+"""This module contains the replica of the access policies kept by the light nodes that serve /authZ. The replica follows
+the policies committed by a full node through /policy-deltas, a long-polling feed of the policies of each new block,
+so that the authorization requests of a MinIO instance are answered next to it and the publishers only serve the
+feed. While the replica lags behind, the requests are forwarded to the full node instead.
+"""
+
+import asyncio
+import time
+from functools import partial
+from logging import Logger
+from typing import Callable
+
+import requests
+from anyio import to_thread
+
+from blockchain.ac_block import (
+    identity_policies_validator,
+    resource_policies_validator,
+)
+from blockchain.ac_blockchain import ACBlockchain
+
+
+class PolicyReplica:
+    """
+    The policies of the chain of a full node, up to the block at height, materialized in the same caches the /authZ
+    endpoint reads. The replica lags when it has not heard from the full node for longer than a poll plus max_lag_s
+    seconds, or when it is more than max_lag_blocks blocks behind the tip the full node last reported.
+    """
+
+    def __init__(
+        self,
+        upstreams: list[str],
+        resource_policies: dict,
+        identity_policies: dict,
+        logger: Logger,
+        max_lag_s: float = 5.0,
+        max_lag_blocks: int = 0,
+        wait_s: float = 10.0,
+        timeout_s: float = 2.5,
+        max_blocks: int = 100,
+    ):
+        """
+        :param upstreams: The addresses of the full nodes the replica follows, the first one that answers is used
+        :param wait_s: How long a poll is held by the full node when no block has been added
+        :param timeout_s: How long a full node is waited for on top of wait_s
+        :param max_blocks: How many blocks a poll returns at most
+        """
+        self.upstreams = upstreams
+        self.resource_policies = resource_policies
+        self.identity_policies = identity_policies
+        self.logger = logger
+        self.max_lag_s = max_lag_s
+        self.max_lag_blocks = max_lag_blocks
+        self.wait_s = wait_s
+        self.timeout_s = timeout_s
+        self.max_blocks = max_blocks
+        self.height = -1
+        self.tip_hash: str | None = None
+        self.upstream_height: int | None = None
+        self.synced_at: float | None = None
+        self.task: asyncio.Task | None = None
+        # Called with the height of the last block applied whenever the caches change
+        self.listeners: list[Callable[[int], None]] = []
+        self._stats = {"polls": 0, "failures": 0, "resets": 0, "proxied": 0}
+
+    def apply(self, deltas: dict) -> int:
+        """
+        Applies an answer of /policy-deltas. When the chain of the full node no longer holds the last block applied,
+        for instance after a reorganization, the answer starts again from the genesis block and the caches are
+        rebuilt.
+        :param deltas:
+        :return: How many blocks have been applied
+        """
+        if deltas["reset"]:
+            self.resource_policies.clear()
+            self.identity_policies.clear()
+            self.height = -1
+            self._stats["resets"] += 1
+        for block in deltas["blocks"]:
+            if block["index"] != self.height + 1:
+                raise ValueError(
+                    f"Expected the policies of block #{self.height + 1}, got #{block['index']}"
+                )
+            ACBlockchain.apply_resource_policy_delta(
+                resource_policies_validator.validate_python(block["resource_policies"]),
+                self.resource_policies,
+            )
+            identity_policies = identity_policies_validator.validate_python(
+                block["identity_policies"]
+            )
+            for user_id, policies in identity_policies.items():
+                ACBlockchain.apply_resource_policy_delta(
+                    policies, self.identity_policies.setdefault(user_id, {})
+                )
+            self.height = block["index"]
+            self.tip_hash = block["hash"]
+        self.upstream_height = deltas["height"]
+        self.synced_at = time.monotonic()
+        if deltas["reset"] or deltas["blocks"]:
+            for listener in self.listeners:
+                listener(self.height)
+        return len(deltas["blocks"])
+
+    def is_lagging(self) -> bool:
+        if self.synced_at is None:
+            return True
+        if time.monotonic() - self.synced_at > self.wait_s + self.max_lag_s:
+            return True
+        return self.upstream_height - self.height > self.max_lag_blocks
+
+    async def poll(self, upstream: str) -> int:
+        response = await to_thread.run_sync(
+            partial(
+                requests.get,
+                url=f"http://{upstream}/policy-deltas",
+                params={
+                    "since": self.height,
+                    "block_hash": self.tip_hash,
+                    "wait_s": self.wait_s if not self.is_lagging() else 0,
+                    "max_blocks": self.max_blocks,
+                },
+                timeout=self.wait_s + self.timeout_s,
+            )
+        )
+        response.raise_for_status()
+        self._stats["polls"] += 1
+        return self.apply(response.json())
+
+    def start(self) -> None:
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        backoff = 0
+        while True:
+            for upstream in self.upstreams:
+                try:
+                    await self.poll(upstream)
+                    backoff = 0
+                    break
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    self._stats["failures"] += 1
+                    self.logger.warning(f"Policy feed of {upstream} failed: {e!r}")
+            else:
+                # No full node answered, the next round waits longer
+                backoff = min(backoff + 1, 6)
+                await asyncio.sleep(min(self.timeout_s * 2**backoff, 60.0))
+
+    async def proxy(self, body: bytes) -> tuple[int, dict]:
+        """
+        Forwards an authorization request to the first full node that answers
+        :param body: The request, as sent by MinIO
+        :return: The status code and the content of the answer
+        """
+        self._stats["proxied"] += 1
+        for upstream in self.upstreams:
+            try:
+                response = await to_thread.run_sync(
+                    partial(
+                        requests.post,
+                        url=f"http://{upstream}/authZ",
+                        data=body,
+                        headers={"Content-Type": "application/json"},
+                        timeout=self.timeout_s,
+                    )
+                )
+            except requests.exceptions.RequestException as e:
+                self.logger.warning(f"Forwarding /authZ to {upstream} failed: {e!r}")
+                continue
+            return response.status_code, response.json()
+        return 503, {"reason": "The replica is behind and no full node answered"}
+
+    def stats(self) -> dict:
+        return {
+            "running": self.task is not None and not self.task.done(),
+            "height": self.height,
+            "upstream_height": self.upstream_height,
+            "lagging": self.is_lagging(),
+            "resource_policies": len(self.resource_policies),
+            "identity_users": len(self.identity_policies),
+            **self._stats,
+        }
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
@@ -1,55 +1,144 @@
 """This module contains all methods and variables that are used for authentication by a node"""
 
+import hashlib
+import hmac
+import secrets
 import time
+from functools import lru_cache
+from typing import Literal
 
-from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
+from cryptography.hazmat.primitives.asymmetric.types import (
+    PrivateKeyTypes,
+    PublicKeyTypes,
+)
 from pydantic_settings import BaseSettings
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.serialization import load_ssh_public_key
 import jwt
-from pydantic import Field
+from pydantic import Field, field_validator, model_validator
 import os
 
+from .replay import ReplayCache
+from .security_pool import SecurityPool
+from .token_cache import IssuerRegistry, VerifiedTokenCache
+
 
 class SecuritySettings(BaseSettings):
     RSA_PUBLIC_EXP: int = Field(ge=65537)
     KEY_SIZE: int = Field(ge=2048)
+    # The algorithm of the key of the node, RSA is kept for the nodes and the clients that only know it
+    key_algorithm: Literal["RS256", "EdDSA", "ES256"] = "RS256"
     nonce_exp_min: int = 0
     nonce_exp_s: int = Field(lt=60)
     nonce_size: int
+    # The key the challenges are bound with, a random one is drawn at startup when it is not given
+    nonce_secret: str | None = Field(min_length=32, default=None)
+    # How many worker processes serve the node, the one serving /auth must be alone, see main.py
+    workers: int = Field(gt=0, default=1)
+    replay_tick_s: float = Field(gt=0, default=1.0)
+    replay_max_entries: int = Field(gt=0, default=1_000_000)
+    public_key_cache_size: int = Field(gt=0, default=1024)
+    token_cache_max_entries: int = Field(gt=0, default=100_000)
+    # The public keys of the nodes whose tokens are accepted besides this one, any node when not given
+    trusted_issuers: str | list[str] | None = None
+    security_workers: int = Field(gt=0, default=4)
+    security_max_pending: int = Field(gt=0, default=1000)
+
+    @field_validator("trusted_issuers", mode="after")
+    def make_list(cls, v):
+        if v and isinstance(v, str):
+            return v.replace('"', "").split(sep=",")
+        return v
+
+    @model_validator(mode="after")
+    def draw_nonce_secret(self):
+        if self.nonce_secret is None:
+            self.nonce_secret = secrets.token_hex(32)
+        return self
 
 
 settings = SecuritySettings(
     RSA_PUBLIC_EXP=os.environ.get("RSA_PUBLIC_EXP", 65537),
     KEY_SIZE=os.environ.get("KEY_SIZE", 2048),
+    key_algorithm=os.environ.get("KEY_ALGORITHM", "RS256"),
     nonce_exp_min=os.environ.get("NONCE_EXP_MIN", 1),
     nonce_exp_s=os.environ.get("NONCE_EXP_S", 0),
     nonce_size=os.environ.get("NONCE_SIZE", 10),
+    nonce_secret=os.environ.get("NONCE_SECRET", None),
+    workers=os.environ.get("WEB_CONCURRENCY", 1),
+    replay_tick_s=os.environ.get("REPLAY_TICK_S", 1.0),
+    replay_max_entries=os.environ.get("REPLAY_MAX_ENTRIES", 1_000_000),
+    public_key_cache_size=os.environ.get("PUBLIC_KEY_CACHE_SIZE", 1024),
+    token_cache_max_entries=os.environ.get("TOKEN_CACHE_MAX_ENTRIES", 100_000),
+    trusted_issuers=os.environ.get("TRUSTED_ISSUERS", None),
+    security_workers=os.environ.get("SECURITY_WORKERS", 4),
+    security_max_pending=os.environ.get("SECURITY_MAX_PENDING", 1000),
 )
 
 
+def generate_private_key(algorithm: str) -> PrivateKeyTypes:
+    if algorithm == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    if algorithm == "ES256":
+        return ec.generate_private_key(ec.SECP256R1())
+    return rsa.generate_private_key(
+        public_exponent=settings.RSA_PUBLIC_EXP,
+        key_size=settings.KEY_SIZE,
+    )
+
+
+def key_algorithm(key: PrivateKeyTypes | PublicKeyTypes) -> str:
+    """
+    Returns the JWT algorithm a key signs with. Tokens are verified with the algorithm of the key of their issuer,
+    never with the one their header names.
+    :param key: A private or a public key
+    :return:
+    """
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return "EdDSA"
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)):
+        if isinstance(key.curve, ec.SECP256R1):
+            return "ES256"
+        raise ValueError(f"The curve {key.curve.name} is not supported")
+    if isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+        return "RS256"
+    raise ValueError(f"Keys of type {type(key).__name__} are not supported")
+
+
 # These keys will be used to validate incoming transactions and to auth user requests
-PRIVATE_KEY = rsa.generate_private_key(
-    public_exponent=65537,
-    key_size=2048,
-)
+PRIVATE_KEY = generate_private_key(settings.key_algorithm)
 PUBLIC_KEY = PRIVATE_KEY.public_key()
-# This is a dictionary that will contain clients that have requested the nonce for auth
-mem_nonce = {}
+# The public key is sent along with every token and every signed block, it is serialized once
+PUBLIC_KEY_HEX = PUBLIC_KEY.public_bytes(
+    encoding=serialization.Encoding.OpenSSH,
+    format=serialization.PublicFormat.OpenSSH,
+).hex()
+# The challenges that have been answered, until they expire
+replay_cache = ReplayCache(
+    max_ttl_s=settings.nonce_exp_min * 60 + settings.nonce_exp_s,
+    tick_s=settings.replay_tick_s,
+    max_entries=settings.replay_max_entries,
+)
 
 
 def serialize_pk_hex() -> str:
-    return PUBLIC_KEY.public_bytes(
-        encoding=serialization.Encoding.OpenSSH,
-        format=serialization.PublicFormat.OpenSSH,
-    ).hex()
-
-
-def sign_message(message: bytes) -> bytes:
-    return PRIVATE_KEY.sign(
+    return PUBLIC_KEY_HEX
+
+
+def sign_with(private_key: PrivateKeyTypes, message: bytes) -> bytes:
+    """
+    Signs a message with RSA-PSS, ECDSA or Ed25519, according to the key
+    :return:
+    """
+    algorithm = key_algorithm(private_key)
+    if algorithm == "EdDSA":
+        return private_key.sign(message)
+    if algorithm == "ES256":
+        return private_key.sign(message, ec.ECDSA(hashes.SHA256()))
+    return private_key.sign(
         message,
         padding.PSS(
             mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH
@@ -58,31 +147,57 @@ def sign_message(message: bytes) -> bytes:
     )
 
 
-def verify_message(message: bytes, signature: bytes) -> bool:
-    PUBLIC_KEY.verify(
-        signature,
-        message,
-        padding.PSS(
-            mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH
-        ),
-        hashes.SHA256(),
-    )
+def verify_with(public_key: PublicKeyTypes, message: bytes, signature: bytes) -> bool:
+    """
+    Verifies a signature made by sign_with
+    :return: True, InvalidSignature is raised if the signature is not valid
+    """
+    algorithm = key_algorithm(public_key)
+    if algorithm == "EdDSA":
+        public_key.verify(signature, message)
+    elif algorithm == "ES256":
+        public_key.verify(signature, message, ec.ECDSA(hashes.SHA256()))
+    else:
+        public_key.verify(
+            signature,
+            message,
+            padding.PSS(
+                mgf=padding.MGF1(hashes.SHA256()),
+                salt_length=padding.PSS.MAX_LENGTH,
+            ),
+            hashes.SHA256(),
+        )
     return True
 
 
+def sign_message(message: bytes) -> bytes:
+    return sign_with(PRIVATE_KEY, message)
+
+
+def verify_message(message: bytes, signature: bytes) -> bool:
+    return verify_with(PUBLIC_KEY, message, signature)
+
+
+@lru_cache(maxsize=settings.public_key_cache_size)
+def load_public_key(user_pk: bytes) -> PublicKeyTypes:
+    """
+    Parses an OpenSSH public key. The keys of the clients and of the peers are parsed again and again, so the most
+    recently used ones are kept parsed
+    :param user_pk: The key, as bytes decoded from its hex encoding
+    :return:
+    """
+    return load_ssh_public_key(user_pk)
+
+
 def verify_user_message(message: bytes, signature: bytes, user_pk: bytes) -> bool:
-    user_pk: RSAPublicKey = load_ssh_public_key(user_pk)
-    user_pk.verify(
-        signature,
-        message,
-        padding.PSS(
-            mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH
-        ),
-        hashes.SHA256(),
-    )
-    return True
+    """
+    Verifies the signature of a client or of a peer, with the algorithm of its key, be it RSA, ECDSA P-256 or Ed25519
+    :return:
+    """
+    return verify_with(load_public_key(user_pk), message, signature)
 
 
+# Encryption is only available with RSA keys
 def encrypt(message: bytes) -> bytes:
     return PUBLIC_KEY.encrypt(
         message,
@@ -105,30 +220,95 @@ def decrypt(ciphertext: bytes) -> bytes:
     )
 
 
+def _nonce_mac(client_pk: str, expiration: float, salt: str) -> str:
+    return hmac.new(
+        settings.nonce_secret.encode(),
+        f"{client_pk}|{expiration!r}|{salt}".encode(),
+        hashlib.sha256,
+    ).hexdigest()
+
+
+def issue_nonce(client_pk: str, expiration: float) -> str:
+    """
+    Creates the nonce of a challenge, a random salt followed by an HMAC binding it to the client and to the expiration,
+    so that the node does not need to remember the challenges it issued
+    :param client_pk: The public key of the client, hex encoded
+    :param expiration: The UNIX time the challenge expires at
+    :return:
+    """
+    salt = secrets.token_hex(settings.nonce_size)
+    return f"{salt}.{_nonce_mac(client_pk, expiration, salt)}"
+
+
+def verify_nonce(nonce: str, client_pk: str, expiration: float) -> bool:
+    """
+    Checks that the nonce has been issued by a node sharing the secret, for this client and with this expiration
+    :return: False as well for a nonce that is malformed
+    """
+    salt, _, mac = nonce.partition(".")
+    try:
+        # The nonce comes from the client, non ASCII characters would make compare_digest raise on str
+        return hmac.compare_digest(
+            mac.encode(), _nonce_mac(client_pk, float(expiration), salt).encode()
+        )
+    except (TypeError, ValueError):
+        return False
+
+
 def create_access_token(data: dict) -> str:
     data.update(
         {"exp": time.time() + settings.nonce_exp_min * 60 + settings.nonce_exp_s}
     )
     data.update({"iat": time.time()})
     data.update({"iss": serialize_pk_hex()})
-    return jwt.encode(data, PRIVATE_KEY, algorithm="RS256")
+    return jwt.encode(data, PRIVATE_KEY, algorithm=settings.key_algorithm)
 
 
 def decode_and_verify_jwt_signature(token: str):
-    decoded_jwt = decode_complete_access_token(token, verify_signature=False)
-    user_pk: RSAPublicKey = load_ssh_public_key(
-        bytes.fromhex(decoded_jwt["payload"]["iss"])
-    )
-    return jwt.decode(token, user_pk, algorithms=["RS256"])
+    """
+    Verifies a token against the key of the node that issued it, which must be trusted. A token already verified is
+    only looked up until it expires.
+    :param token:
+    :return: The claims of the token
+    """
+    claims = cached_claims(token)
+    if claims is not None:
+        return claims
+    claims = verify_token(token)
+    token_cache.put(token, claims)
+    return claims
+
+
+def cached_claims(token: str) -> dict | None:
+    """
+    Returns the claims of a token already verified. Its issuer is checked again, since it may have been removed from
+    the registry after the token was cached.
+    :param token:
+    :return: The claims, or None if the token is not in the cache
+    """
+    claims = token_cache.get(token)
+    if claims is not None and not issuers.is_trusted(claims.get("iss", None)):
+        raise jwt.InvalidIssuerError(
+            f"{claims.get('iss', None)} is not a trusted issuer"
+        )
+    return claims
+
+
+def verify_token(token: str) -> dict:
+    issuer = decode_access_token(token, verify_signature=False)["iss"]
+    if not issuers.is_trusted(issuer):
+        raise jwt.InvalidIssuerError(f"{issuer} is not a trusted issuer")
+    user_pk = load_public_key(bytes.fromhex(issuer))
+    return jwt.decode(token, user_pk, algorithms=[key_algorithm(user_pk)])
 
 
 def decode_access_token(encoded_jwt: str, verify_signature: bool = True) -> dict:
     if verify_signature:
-        return jwt.decode(encoded_jwt, PUBLIC_KEY, algorithms=["RS256"])
+        return jwt.decode(encoded_jwt, PUBLIC_KEY, algorithms=[settings.key_algorithm])
     return jwt.decode(
         encoded_jwt,
         PUBLIC_KEY,
-        algorithms=["RS256"],
+        algorithms=[settings.key_algorithm],
         options={"verify_signature": False},
     )
 
@@ -137,17 +317,67 @@ def decode_complete_access_token(
     encoded_jwt: str, verify_signature: bool = True
 ) -> dict:
     if verify_signature:
-        return jwt.decode_complete(encoded_jwt, PUBLIC_KEY, algorithms=["RS256"])
+        return jwt.decode_complete(
+            encoded_jwt, PUBLIC_KEY, algorithms=[settings.key_algorithm]
+        )
     return jwt.decode_complete(
         encoded_jwt,
         PUBLIC_KEY,
-        algorithms=["RS256"],
+        algorithms=[settings.key_algorithm],
         options={"verify_signature": False},
     )
 
 
-def get_mem_nonce():
-    return mem_nonce
+# The tokens already verified, and the nodes whose tokens are accepted
+token_cache = VerifiedTokenCache(max_entries=settings.token_cache_max_entries)
+
+issuers = IssuerRegistry(serialize_pk_hex(), settings.trusted_issuers)
+
+
+# The operations above are CPU bound, the routes run them in this pool through the async variants below
+security_pool = SecurityPool(
+    workers=settings.security_workers, max_pending=settings.security_max_pending
+)
+
+
+async def sign_message_async(message: bytes) -> bytes:
+    return await security_pool.run(sign_message, message)
+
+
+async def verify_user_message_async(
+    message: bytes, signature: bytes, user_pk: bytes
+) -> bool:
+    return await security_pool.run(verify_user_message, message, signature, user_pk)
+
+
+async def create_access_token_async(data: dict) -> str:
+    return await security_pool.run(create_access_token, data)
+
+
+async def decode_and_verify_jwt_signature_async(token: str) -> dict:
+    # The cache is only used from the event loop, the pool only verifies the signature
+    claims = cached_claims(token)
+    if claims is not None:
+        return claims
+    claims = await security_pool.run(verify_token, token)
+    token_cache.put(token, claims)
+    return claims
+
+
+def get_security_pool():
+    return security_pool
+
+
+def get_token_cache():
+    return token_cache
+
+
+def get_issuers():
+    return issuers
+
+
+def get_replay_cache():
+    return replay_cache
 
 
 def get_security_settings():
@@ -0,0 +1,100 @@
+"""This module contains the pool the CPU bound security operations, signing and verifying with RSA, are run in so
+that a burst of logins does not stall the event loop, and with it /authZ. The operations run in threads: OpenSSL
+releases the GIL while it signs and verifies, and the keys and caches they use stay shared with the event loop.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class SecurityPoolFull(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class SecurityPool:
+    """
+    At most workers operations run at once, and at most max_pending are in the pool, running or waiting for a worker:
+    past that new operations are refused, so that the backpressure reaches the clients instead of the queue growing
+    without bound.
+    """
+
+    def __init__(self, workers: int = 4, max_pending: int = 1000):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor: ThreadPoolExecutor | None = None
+        self.in_flight = 0
+        self._stats = {
+            "completed": 0,
+            "failed": 0,
+            "refused": 0,
+            "max_queued": 0,
+            "wait_s": 0.0,
+            "run_s": 0.0,
+        }
+
+    async def run(self, operation: Callable[..., T], *args) -> T:
+        """
+        Runs an operation in the pool and waits for its result
+        :param operation:
+        :param args:
+        :return: What the operation returns, or raises what it raises
+        """
+        if self.in_flight >= self.max_pending:
+            self._stats["refused"] += 1
+            raise SecurityPoolFull("Too many security operations are pending")
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="security"
+            )
+        self.in_flight += 1
+        self._stats["max_queued"] = max(self._stats["max_queued"], self.queued)
+        loop = asyncio.get_running_loop()
+        queued_at = time.monotonic()
+        started_at = None
+
+        def timed():
+            nonlocal started_at
+            started_at = time.monotonic()
+            return operation(*args)
+
+        try:
+            result = await loop.run_in_executor(self.executor, timed)
+        except Exception:
+            self._stats["failed"] += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        # Only the operations that succeeded are counted as completed, and their times alone make the means
+        self._stats["completed"] += 1
+        self._stats["wait_s"] += started_at - queued_at
+        self._stats["run_s"] += time.monotonic() - started_at
+        return result
+
+    @property
+    def queued(self) -> int:
+        """
+        How many operations wait for a worker, the pool running nothing else
+        :return:
+        """
+        return max(0, self.in_flight - self.workers)
+
+    def stats(self) -> dict:
+        completed = self._stats["completed"]
+        return {
+            "workers": self.workers,
+            "running": min(self.in_flight, self.workers),
+            "queued": self.queued,
+            **self._stats,
+            "mean_wait_s": self._stats["wait_s"] / completed if completed else 0.0,
+            "mean_run_s": self._stats["run_s"] / completed if completed else 0.0,
+        }
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
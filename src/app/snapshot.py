@@ -0,0 +1,291 @@
+"""This module contains the snapshot of the access policies that lets /authZ be served by many worker processes. The
+process that owns the chain, or the replica of a light node, writes the committed policies to a file each time they
+change, and the workers map it read-only: the pages are shared by all of them through the page cache, and a lookup
+decodes only the entry it needs.
+A snapshot is never modified once written. A new one is written next to it and moved in its place, so a worker keeps
+reading a consistent snapshot until it maps the new file.
+
+The file starts with a header, MAGIC, the generation, the height of the last block applied and the number of tables,
+followed by a directory with the name, the number of entries and the offset of the index of each table. An index is
+an array of fixed size records, the offset and the length of the key and of the value of each entry, sorted by key so
+that an entry is found by binary search. Keys are UTF-8 encoded and values are JSON encoded.
+"""
+
+import asyncio
+import json
+import mmap
+import os
+import struct
+import time
+from collections.abc import Mapping
+from typing import Iterator
+
+from anyio import to_thread
+from pydantic import BaseModel, TypeAdapter
+
+from blockchain.ac_transaction import ACIdentityPolicy, ACResourcePolicy
+
+MAGIC = b"ACPSNAP1"
+HEADER = struct.Struct("<8sQqI")
+TABLE = struct.Struct("<HIQ")
+RECORD = struct.Struct("<QIQI")
+
+# How the values of each table are decoded, they mirror the caches /authZ reads
+DECODERS: dict[str, TypeAdapter] = {
+    "resource_policies": TypeAdapter(ACResourcePolicy),
+    "identity_policies": TypeAdapter(dict[str, ACIdentityPolicy]),
+}
+
+
+def encode_value(value) -> bytes:
+    if isinstance(value, BaseModel):
+        return value.model_dump_json().encode()
+    return json.dumps(
+        {
+            key: item.model_dump(mode="json") if isinstance(item, BaseModel) else item
+            for key, item in value.items()
+        }
+    ).encode()
+
+
+def write_snapshot(
+    path: str, tables: dict[str, dict], generation: int, height: int
+) -> None:
+    """
+    This function writes the snapshot of the given tables, replacing the previous one atomically
+    :param path:
+    :param tables: The entries of each table, their values being policies or dicts of policies
+    :param generation: Increases with each snapshot
+    :param height: The height of the last block applied to the tables
+    :return:
+    """
+    names = [name.encode() for name in tables]
+    offset = HEADER.size + sum(TABLE.size + len(name) for name in names)
+    directory = []
+    parts = []
+    for name, table in zip(names, tables.values()):
+        entries = sorted(
+            (str(key).encode(), encode_value(value)) for key, value in table.items()
+        )
+        directory.append(TABLE.pack(len(name), len(entries), offset) + name)
+        # The keys and the values of a table follow its index
+        offset += RECORD.size * len(entries)
+        for key, value in entries:
+            parts.append(RECORD.pack(offset, len(key), offset + len(key), len(value)))
+            offset += len(key) + len(value)
+        parts += [blob for entry in entries for blob in entry]
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(HEADER.pack(MAGIC, generation, height, len(names)))
+        file.write(b"".join(directory))
+        file.write(b"".join(parts))
+        # The data must be on disk before the rename makes it the snapshot, or a crash could leave an empty file
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+class SnapshotTable(Mapping):
+    """
+    A read-only view of a table of a mapped snapshot. The values are decoded on lookup and kept, since the snapshot
+    does not change.
+    """
+
+    def __init__(
+        self, buffer: mmap.mmap, count: int, index_offset: int, decoder: TypeAdapter
+    ):
+        self.buffer = buffer
+        self.count = count
+        self.index_offset = index_offset
+        self.decoder = decoder
+        self._decoded = {}
+
+    def _record(self, position: int) -> tuple[int, int, int, int]:
+        return RECORD.unpack_from(
+            self.buffer, self.index_offset + position * RECORD.size
+        )
+
+    def _key(self, position: int) -> bytes:
+        key_offset, key_length, _, _ = self._record(position)
+        return self.buffer[key_offset : key_offset + key_length]
+
+    def __getitem__(self, key: str):
+        if key in self._decoded:
+            return self._decoded[key]
+        encoded = str(key).encode()
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.count or self._key(low) != encoded:
+            raise KeyError(key)
+        _, _, value_offset, value_length = self._record(low)
+        value = self.decoder.validate_json(
+            self.buffer[value_offset : value_offset + value_length]
+        )
+        self._decoded[key] = value
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        return (self._key(position).decode() for position in range(self.count))
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class PolicySnapshot:
+    """
+    A snapshot mapped read-only, with a view for each of its tables
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self.inode = os.fstat(file.fileno()).st_ino
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.generation, self.height, count = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a policy snapshot")
+        self.tables: dict[str, SnapshotTable] = {}
+        offset = HEADER.size
+        for _ in range(count):
+            name_length, entries, index_offset = TABLE.unpack_from(self.buffer, offset)
+            offset += TABLE.size
+            name = self.buffer[offset : offset + name_length].decode()
+            offset += name_length
+            self.tables[name] = SnapshotTable(
+                self.buffer, entries, index_offset, DECODERS[name]
+            )
+
+
+class PolicySnapshotWriter:
+    """
+    Writes a snapshot of the caches of the policies each time the blocks applied to them change.
+    Within an event loop, publish only records the change: a task writes the snapshot in a worker thread, and the
+    changes published while a snapshot is being written are coalesced into the next one. Outside of one the snapshot
+    is written right away.
+    """
+
+    def __init__(
+        self, path: str, resource_policies: dict, identity_policies: dict
+    ) -> None:
+        self.path = path
+        self.resource_policies = resource_policies
+        self.identity_policies = identity_policies
+        self.generation = 0
+        # The height of the last change not written yet
+        self.pending: int | None = None
+        self.wakeup: asyncio.Event | None = None
+        self.task: asyncio.Task | None = None
+        self.stopping = False
+        self._stats = {"published": 0, "written": 0, "failures": 0}
+
+    def publish(self, height: int) -> None:
+        self._stats["published"] += 1
+        self.pending = height
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.write(*self.take())
+            return
+        if self.task is None or self.task.done() or self.task.get_loop() is not loop:
+            self.start()
+        self.wakeup.set()
+
+    def take(self) -> tuple[dict, int, int]:
+        """
+        Copies the caches as they are now, so that they can be encoded while the event loop keeps changing them
+        :return: The tables, the generation and the height of the next snapshot
+        """
+        height, self.pending = self.pending, None
+        self.generation += 1
+        tables = {
+            "resource_policies": dict(self.resource_policies),
+            "identity_policies": {
+                user_id: dict(policies)
+                for user_id, policies in self.identity_policies.items()
+            },
+        }
+        return tables, self.generation, height
+
+    def write(self, tables: dict, generation: int, height: int) -> None:
+        write_snapshot(self.path, tables, generation, height)
+        self._stats["written"] += 1
+
+    def start(self) -> None:
+        self.wakeup = asyncio.Event()
+        self.stopping = False
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            if self.pending is not None:
+                try:
+                    await to_thread.run_sync(self.write, *self.take())
+                except OSError:
+                    self._stats["failures"] += 1
+            if self.stopping:
+                return
+
+    def stats(self) -> dict:
+        return {
+            "running": self.task is not None and not self.task.done(),
+            "generation": self.generation,
+            "pending": self.pending,
+            **self._stats,
+        }
+
+    async def stop(self) -> None:
+        """
+        Stops the task once it has written the changes published so far. It is not cancelled, since the worker thread
+        writing a snapshot would go on without it.
+        """
+        if self.task is not None:
+            self.stopping = True
+            self.wakeup.set()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+
+class PolicySnapshotReader:
+    """
+    Maps the latest snapshot. Whether a new snapshot has been moved in place of the mapped one is checked at most every
+    check_interval_s seconds, and until a snapshot has been written the tables are empty.
+    """
+
+    def __init__(self, path: str, check_interval_s: float = 0.1):
+        self.path = path
+        self.check_interval_s = check_interval_s
+        self.snapshot: PolicySnapshot | None = None
+        self.checked_at = float("-inf")
+
+    def current(self) -> PolicySnapshot | None:
+        now = time.monotonic()
+        if now - self.checked_at >= self.check_interval_s:
+            self.checked_at = now
+            try:
+                inode = os.stat(self.path).st_ino
+            except FileNotFoundError:
+                return self.snapshot
+            if self.snapshot is None or self.snapshot.inode != inode:
+                self.snapshot = PolicySnapshot(self.path)
+        return self.snapshot
+
+    def table(self, name: str) -> Mapping:
+        snapshot = self.current()
+        return {} if snapshot is None else snapshot.tables[name]
+
+    def stats(self) -> dict:
+        snapshot = self.current()
+        if snapshot is None:
+            return {"path": self.path, "generation": None}
+        return {
+            "path": self.path,
+            "generation": snapshot.generation,
+            "height": snapshot.height,
+            **{name: len(table) for name, table in snapshot.tables.items()},
+        }
@@ -0,0 +1,153 @@
+"""This module contains the long-lived WebSocket channel that a node can open towards each of its peers. Instead of
+sending a separate HTTP request per message, the framed messages (transactions, blocks, headers and pings) are pushed
+over a single connection, and the replies are matched to their requests by id.
+"""
+
+import asyncio
+import itertools
+import json
+import time
+from logging import Logger
+
+from websockets.asyncio.client import ClientConnection, connect
+from websockets.exceptions import WebSocketException
+
+STREAM_PATH = "/peer-stream"
+
+# The frames a node can send, mapped from the REST routes they replace
+FRAME_TYPES = {
+    "/add-policies": "transactions",
+    "/add-compact-block": "compact_block",
+    "/add-block": "block",
+    "/headers": "headers",
+}
+
+# The errors after which a channel is considered broken, and the HTTP routes are used instead
+CHANNEL_ERRORS = (OSError, TimeoutError, WebSocketException)
+
+
+class StreamReply:
+    """
+    The reply to a frame, which exposes the same interface of the responses of requests, so that the callers do not
+    need to know whether a message went through the channel or through a plain HTTP request
+    """
+
+    def __init__(self, status_code: int, content):
+        self.status_code = status_code
+        self.content = content
+
+    def json(self):
+        return self.content
+
+
+def make_frame(frame_type: str, frame_id: int, payload=None, **fields) -> str:
+    return json.dumps(
+        {"type": frame_type, "id": frame_id, "payload": payload, **fields},
+        default=str,
+    )
+
+
+def make_reply(frame_id: int, status_code: int, content) -> str:
+    return json.dumps(
+        {"type": "reply", "id": frame_id, "status": status_code, "payload": content},
+        default=str,
+    )
+
+
+class PeerChannel:
+    """
+    The WebSocket channel towards a single peer. The connection is opened on the first request and a reader task
+    resolves the pending requests as their replies arrive. When the connection cannot be opened, for instance because
+    the peer does not support streaming, no new attempt is made for retry_s seconds.
+    """
+
+    def __init__(
+        self,
+        peer: str,
+        logger: Logger,
+        timeout_s: float = 1.0,
+        ping_interval_s: float | None = 20.0,
+        retry_s: float = 30.0,
+    ):
+        self.peer = peer
+        self.logger = logger
+        self.timeout_s = timeout_s
+        self.ping_interval_s = ping_interval_s
+        self.retry_s = retry_s
+        self.connection: ClientConnection | None = None
+        self.reader: asyncio.Task | None = None
+        self.pending: dict[int, asyncio.Future] = {}
+        self.ids = itertools.count()
+        self.retry_at = 0.0
+
+    def available(self) -> bool:
+        return self.connection is not None or time.monotonic() >= self.retry_at
+
+    async def _connect(self) -> None:
+        try:
+            self.connection = await connect(
+                f"ws://{self.peer}{STREAM_PATH}",
+                open_timeout=self.timeout_s,
+                ping_interval=self.ping_interval_s,
+            )
+        except CHANNEL_ERRORS:
+            self.retry_at = time.monotonic() + self.retry_s
+            raise
+        self.reader = asyncio.get_running_loop().create_task(self._read())
+
+    async def _read(self) -> None:
+        try:
+            async for message in self.connection:
+                frame = json.loads(message)
+                future = self.pending.pop(frame.get("id", None), None)
+                if future is not None and not future.done():
+                    future.set_result(frame)
+        except CHANNEL_ERRORS:
+            self.logger.warning(f"The channel towards peer {self.peer} was closed")
+        finally:
+            self.connection = None
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Channel closed"))
+            self.pending.clear()
+
+    async def request(self, frame_type: str, payload=None, **fields) -> StreamReply:
+        """
+        Sends a frame and waits for its reply
+        :param frame_type:
+        :param payload:
+        :param fields: Additional fields of the frame, such as the hops of the transactions
+        :return:
+        """
+        if self.connection is None:
+            await self._connect()
+        frame_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[frame_id] = future
+        try:
+            await self.connection.send(
+                make_frame(frame_type, frame_id, payload, **fields)
+            )
+            async with asyncio.timeout(self.timeout_s):
+                frame = await future
+        finally:
+            self.pending.pop(frame_id, None)
+        if frame["type"] == "pong":
+            return StreamReply(200, frame["payload"])
+        return StreamReply(frame["status"], frame["payload"])
+
+    async def ping(self) -> float:
+        """
+        Sends a ping frame
+        :return: The round trip time in seconds
+        """
+        start = time.monotonic()
+        await self.request("ping")
+        return time.monotonic() - start
+
+    async def close(self) -> None:
+        if self.connection is not None:
+            await self.connection.close()
+        if self.reader is not None:
+            await asyncio.gather(self.reader, return_exceptions=True)
+        self.connection = None
@@ -0,0 +1,30 @@
+from fastapi.testclient import TestClient
+
+from app.dependency import get_blockchain
+from app.main import app
+from blockchain.ac_block import ACBlock
+from blockchain.ac_transaction import ACResourcePolicy
+
+
+def next_block(policy_id: str) -> dict:
+    chain = get_blockchain()
+    block = ACBlock(
+        index=chain.get_last_bloc.index + 1,
+        timestamp=str(chain.get_last_bloc.index + 1),
+        previous_hash=chain.get_last_bloc.compute_hash(),
+        resource_policies=[ACResourcePolicy(id=policy_id, action="add")],
+    )
+    chain.proof_of_work(block)
+    return block.to_dict()
+
+
+def test_block_without_body_is_refused():
+    with TestClient(app) as client:
+        block = next_block("p0")
+        response = client.post("/add-block", json={**block, "body": {}})
+        assert response.status_code == 422
+        malformed = {**block["body"], "resource_policies": {"p0": {"id": 0}}}
+        response = client.post("/add-block", json={**block, "body": malformed})
+        assert response.status_code == 400
+        response = client.post("/add-block", json=block)
+        assert response.status_code == 201
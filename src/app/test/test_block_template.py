@@ -0,0 +1,28 @@
+from fastapi.testclient import TestClient
+
+from app.dependency import get_blockchain
+from app.main import app
+from blockchain.ac_blockchain import ACBlockchain
+from blockchain.ac_transaction import ACResourcePolicy
+
+
+def test_template_is_built_again_only_after_a_change(monkeypatch):
+    built = []
+    prepare_block = ACBlockchain.prepare_block
+
+    def counting(self, *args):
+        built.append(self.unconfirmed_transactions.version)
+        return prepare_block(self, *args)
+
+    monkeypatch.setattr(ACBlockchain, "prepare_block", counting)
+    with TestClient(app) as client:
+        mempool = get_blockchain().unconfirmed_transactions
+        mempool.add(ACResourcePolicy(id="t0", action="add"))
+        first = client.get("/block-template").json()
+        assert client.get("/block-template").json() == first
+        assert len(built) == 1
+
+        mempool.add(ACResourcePolicy(id="t1", action="add"))
+        second = client.get("/block-template").json()
+        assert second["transactions"] == first["transactions"] + 1
+        assert len(built) == 2
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+
+import pytest
+
+from app.chain_writer import ChainWriter
+from app.dependency import (
+    get_chain_writer,
+    get_identity_policies_cache,
+    get_policies_cache,
+)
+from blockchain.ac_blockchain import ACBlockchain
+from blockchain.ac_transaction import ACResourcePolicy
+from blockchain.policy_journal import PolicyJournal
+from blockchain.test.test_block_tree import seal_next
+
+
+def create_writer():
+    chain = ACBlockchain(difficulty=1)
+    journal = PolicyJournal({})
+    writer = ChainWriter(
+        lambda: chain, journal.mem_policies, {}, logging.getLogger("test")
+    )
+    journal.listeners.append(writer.policies_changed)
+    return chain, journal, writer
+
+
+def test_commands_run_one_at_a_time():
+    chain, journal, writer = create_writer()
+    running = []
+
+    async def command(name: str):
+        running.append(name)
+        # Another command would start here if the writer did not wait for this one
+        await asyncio.sleep(0.01)
+        assert running[-1] == name
+        seal_next(chain, name)
+        return name
+
+    async def submit_all():
+        try:
+            return await asyncio.gather(
+                *(writer.submit(command, f"a{i}") for i in range(5))
+            )
+        finally:
+            await writer.stop()
+
+    assert asyncio.run(submit_all()) == [f"a{i}" for i in range(5)]
+    assert len(writer.read().chain) == 6
+    assert writer.stats()["commands"] == 5
+
+
+def test_snapshots_are_not_changed_by_commands():
+    chain, journal, writer = create_writer()
+
+    def add_policy(policy_id: str, action: str):
+        policy = ACResourcePolicy(id=policy_id, action=action)
+        seal_next(chain, f"{policy_id}-{action}", [policy])
+        journal.sync(chain.chain)
+
+    def failing():
+        raise ValueError("refused")
+
+    async def run():
+        await writer.submit(add_policy, "p0", "add")
+        before = writer.read()
+        await writer.submit(add_policy, "p1", "add")
+        with pytest.raises(ValueError):
+            await writer.submit(failing)
+        await writer.stop()
+        return before
+
+    before = asyncio.run(run())
+    assert len(before.chain) == 2 and list(before.resource_policies) == ["p0"]
+    with pytest.raises(TypeError):
+        before.resource_policies["p2"] = None
+    after = writer.read()
+    assert len(after.chain) == 3 and sorted(after.resource_policies) == ["p0", "p1"]
+    assert writer.stats()["failures"] == 1
+
+
+def test_snapshots_are_published_only_after_changes():
+    chain, journal, writer = create_writer()
+
+    async def run():
+        await writer.submit(seal_next, chain, "b1")
+        first = writer.read()
+        # A command that changes nothing publishes nothing
+        await writer.submit(len, chain.chain)
+        assert writer.read() is first
+        await writer.submit(seal_next, chain, "b2")
+        second = writer.read()
+        # A reorganization does not change what the older snapshots read
+        await writer.submit(chain.chain.pop)
+        await writer.submit(seal_next, chain, "b2'")
+        await writer.stop()
+        return first, second
+
+    first, second = asyncio.run(run())
+    third = writer.read()
+    assert (first.version, second.version, third.version) == (1, 2, 4)
+    # The snapshots of a growing chain share its blocks
+    assert first.chain.blocks is second.chain.blocks
+    assert len(first.chain) == 2 and second.chain[-1] is not third.tip
+    assert second.chain[:2] == third.chain[:2] == list(chain.chain[:2])
+    assert third.tip is chain.chain[-1]
+
+
+def test_readers_are_woken_by_a_publish():
+    chain, journal, writer = create_writer()
+
+    async def run():
+        version = writer.read().version
+        started = time.monotonic()
+        waiting = asyncio.create_task(writer.wait_for_change(version, 5.0))
+        await asyncio.sleep(0.01)
+        await writer.submit(seal_next, chain, "c1")
+        snapshot = await waiting
+        elapsed = time.monotonic() - started
+        # Nothing is published past the timeout
+        assert await writer.wait_for_change(snapshot.version, 0.01) is snapshot
+        await writer.stop()
+        return snapshot, elapsed
+
+    snapshot, elapsed = asyncio.run(run())
+    assert snapshot.tip is chain.chain[-1] and elapsed < 1.0
+
+
+def test_authorization_reads_the_published_policies():
+    snapshot = get_chain_writer().read()
+    assert get_policies_cache() is snapshot.resource_policies
+    assert get_identity_policies_cache() is snapshot.identity_policies
+    with pytest.raises(TypeError):
+        get_identity_policies_cache()["user"] = {}
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+
+import pytest
+import requests
+
+from app.forwarder import ForwarderFull, IdempotencyCache, TransactionForwarder
+from app.peers import PeerTable
+
+
+class RecordingForwarder(TransactionForwarder):
+    """
+    Sends nothing, it records the batches and fails on the publishers listed in down
+    """
+
+    def __init__(self, publishers, down=(), **kwargs):
+        super().__init__(PeerTable(publishers), logging.getLogger("test"), **kwargs)
+        self.down = set(down)
+        self.sent = []
+
+    async def _post(self, publisher, policies, key):
+        self.sent.append((publisher, [policy["id"] for policy in policies], key))
+        if publisher in self.down:
+            raise requests.exceptions.ConnectionError(publisher)
+        return 201, {"added": len(policies), "duplicates": 0}
+
+
+def policies(*ids: str) -> list[dict]:
+    return [{"id": policy_id, "action": "add"} for policy_id in ids]
+
+
+async def submit_all(forwarder: TransactionForwarder, *submissions) -> list:
+    forwarder.start()
+    try:
+        return await asyncio.gather(
+            *(forwarder.submit(submission) for submission in submissions)
+        )
+    finally:
+        await forwarder.stop()
+
+
+def test_submissions_are_batched():
+    forwarder = RecordingForwarder(["a"], batch_size=3, linger_s=0.05)
+    answers = asyncio.run(
+        submit_all(forwarder, policies("0"), policies("1"), policies("2", "3"))
+    )
+    assert [ids for _, ids, _ in forwarder.sent] == [["0", "1"], ["2", "3"]]
+    assert answers[0] == answers[1] and answers[0]["batch_policies"] == 2
+    assert forwarder.stats()["batches"] == 2
+
+
+def test_failed_batch_is_retried_with_same_key():
+    forwarder = RecordingForwarder(["a", "b"], down=["a"], strategy="round_robin")
+    forwarder.turn = 1
+    (answer,) = asyncio.run(submit_all(forwarder, policies("0")))
+    assert [publisher for publisher, _, _ in forwarder.sent] == ["a", "b"]
+    assert forwarder.sent[0][2] == forwarder.sent[1][2] == answer["idempotency_key"]
+    assert answer["publisher"] == "b"
+    # The failed publisher backs off
+    assert forwarder.publishers.available() == ["b"]
+
+
+def test_least_load_picks_the_idlest_publisher():
+    forwarder = RecordingForwarder(["a", "b"])
+    forwarder.in_flight = {"a": 2, "b": 1}
+    assert forwarder.pick() == "b"
+    forwarder.in_flight = {"a": 0, "b": 1}
+    assert forwarder.pick() == "a"
+
+
+def test_full_buffer_pushes_back():
+    async def overflow():
+        forwarder = RecordingForwarder(["a"], max_pending=2, max_wait_s=0.05)
+        with pytest.raises(ForwarderFull):
+            await forwarder.submit(policies("0", "1", "2"))
+        # Nothing drains the buffer, since the forwarder is not running
+        waiting = asyncio.ensure_future(forwarder.submit(policies("0", "1")))
+        await asyncio.sleep(0)
+        with pytest.raises(ForwarderFull):
+            await forwarder.submit(policies("2"))
+        assert forwarder.stats()["refused"] == 1
+        waiting.cancel()
+
+    asyncio.run(overflow())
+
+
+def test_idempotency_cache():
+    cache = IdempotencyCache(ttl_s=300, max_entries=2)
+    cache.put("k0", {"added": 1})
+    assert cache.get("k0") == {"added": 1}
+    cache.put("k1", {"added": 2})
+    cache.put("k2", {"added": 3})
+    assert cache.get("k0") is None and len(cache) == 2
+    cache = IdempotencyCache(ttl_s=0)
+    cache.put("k0", {"added": 1})
+    assert cache.get("k0") is None
@@ -0,0 +1,57 @@
+import time
+
+from app.gossip import BloomFilter, SeenCache, select_peers
+
+
+def test_seen_cache_add():
+    cache = SeenCache(ttl_s=60)
+    assert cache.add("a hash")
+    assert not cache.add("a hash")
+    assert "a hash" in cache
+    assert "another hash" not in cache
+
+
+def test_seen_cache_expires():
+    cache = SeenCache(ttl_s=0.01)
+    cache.add("a hash")
+    time.sleep(0.02)
+    assert "a hash" not in cache
+    assert len(cache) == 0
+
+
+def test_seen_cache_is_bounded():
+    cache = SeenCache(ttl_s=60, max_entries=10)
+    for i in range(20):
+        cache.add(str(i))
+    assert len(cache) == 10
+    assert "0" not in cache
+    assert "19" in cache
+
+
+def test_seen_cache_bloom():
+    cache = SeenCache(ttl_s=0.01, max_entries=1000, use_bloom=True)
+    assert cache.add("a hash")
+    assert "a hash" in cache
+    # The key survives one rotation and is forgotten after the second one
+    time.sleep(0.02)
+    assert "a hash" in cache
+    time.sleep(0.02)
+    assert "a hash" not in cache
+
+
+def test_bloom_filter_false_positive_rate():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f"key{i}")
+    assert all(f"key{i}" in bloom for i in range(1000))
+    false_positives = sum(f"other{i}" in bloom for i in range(1000))
+    assert false_positives < 50
+
+
+def test_select_peers():
+    peers = {f"peer{i}:8000" for i in range(10)}
+    assert set(select_peers(peers, None)) == peers
+    assert set(select_peers(peers, 20)) == peers
+    selected = select_peers(peers, 3)
+    assert len(selected) == 3
+    assert set(selected).issubset(peers)
@@ -0,0 +1,59 @@
+import jwt
+import pytest
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from app import security
+from app.security import (
+    decode_and_verify_jwt_signature,
+    generate_private_key,
+    key_algorithm,
+    sign_with,
+    verify_user_message,
+)
+
+
+def openssh_hex(private_key) -> str:
+    return (
+        private_key.public_key()
+        .public_bytes(
+            encoding=serialization.Encoding.OpenSSH,
+            format=serialization.PublicFormat.OpenSSH,
+        )
+        .hex()
+    )
+
+
+@pytest.mark.parametrize("algorithm", ["RS256", "ES256", "EdDSA"])
+def test_challenge_signatures(algorithm):
+    private_key = generate_private_key(algorithm)
+    assert key_algorithm(private_key.public_key()) == algorithm
+    signature = sign_with(private_key, b"challenge")
+    user_pk = bytes.fromhex(openssh_hex(private_key))
+    assert verify_user_message(b"challenge", signature, user_pk)
+    with pytest.raises(InvalidSignature):
+        verify_user_message(b"another challenge", signature, user_pk)
+
+
+@pytest.mark.parametrize("algorithm", ["RS256", "ES256", "EdDSA"])
+def test_tokens_are_verified_with_the_algorithm_of_the_issuer(algorithm):
+    private_key = generate_private_key(algorithm)
+    issuer = openssh_hex(private_key)
+    claims = {"sub": "pk", "client_id": "c", "iss": issuer, "exp": 2**40}
+    token = jwt.encode(claims, private_key, algorithm=algorithm)
+    assert decode_and_verify_jwt_signature(token)["client_id"] == "c"
+    # A token naming another algorithm than the one of its issuer is refused
+    other = "EdDSA" if algorithm != "EdDSA" else "ES256"
+    forged = jwt.encode(claims, generate_private_key(other), algorithm=other)
+    with pytest.raises(jwt.InvalidTokenError):
+        decode_and_verify_jwt_signature(forged)
+
+
+def test_unsupported_curve_is_refused():
+    with pytest.raises(ValueError):
+        key_algorithm(ec.generate_private_key(ec.SECP384R1()))
+
+
+def test_public_key_is_serialized_once():
+    assert security.serialize_pk_hex() is security.serialize_pk_hex()
@@ -0,0 +1,47 @@
+import pytest
+
+from blockchain.ac_blockchain import ACBlockchain
+from blockchain.ac_transaction import ACResourcePolicy
+from blockchain.consensus import ProofOfWork
+from blockchain.errors import InvalidChain
+from blockchain.header_chain import HeaderChain
+from blockchain.test.test_block_tree import seal_next
+from blockchain.test.test_header_chain import headers_of
+from node import LightNode
+
+
+def light_node(chain: ACBlockchain, prove) -> LightNode:
+    node = LightNode({"peer:8000"}, ProofOfWork(chain.difficulty))
+    genesis = chain.chain[0]
+    node.headers = HeaderChain(
+        node.consensus, genesis.header, genesis.compute_hash(), node.window
+    )
+    node.headers.add_headers(headers_of(chain))
+    node._get = lambda peer, path, **params: prove(params)
+    return node
+
+
+def test_proof_of_another_policy_is_refused():
+    chain = ACBlockchain(difficulty=1)
+    seal_next(
+        chain,
+        "a0",
+        [
+            ACResourcePolicy(id="A", action="add"),
+            ACResourcePolicy(id="B", action="add"),
+        ],
+    )
+
+    def prove(params):
+        return chain.chain[1].inclusion_proof(
+            ("resource_policies", params["policy_id"])
+        )
+
+    assert light_node(chain, prove).verify_policy(1, "A")["id"] == "A"
+
+    # The peer answers with a valid proof, but for B
+    def substitute(params):
+        return chain.chain[1].inclusion_proof(("resource_policies", "B"))
+
+    with pytest.raises(InvalidChain):
+        light_node(chain, substitute).verify_policy(1, "A")
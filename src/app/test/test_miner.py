@@ -0,0 +1,57 @@
+import asyncio
+import logging
+
+from app.miner import AutoMiner
+from blockchain.ac_transaction import ACResourcePolicy
+from blockchain.mempool import Mempool
+
+
+def make_policy(policy_id: str) -> ACResourcePolicy:
+    return ACResourcePolicy(id=policy_id, action="add")
+
+
+def test_trigger_bounds():
+    mempool = Mempool()
+    miner = AutoMiner(logging.getLogger("test"), max_count=2, max_bytes=None)
+    assert miner.trigger(mempool) is None
+    mempool.add(make_policy("0"))
+    assert miner.trigger(mempool) is None
+    mempool.add(make_policy("1"))
+    assert miner.trigger(mempool) == "count"
+
+    miner = AutoMiner(logging.getLogger("test"), max_count=None, max_bytes=1)
+    assert miner.trigger(mempool) == "bytes"
+
+    miner = AutoMiner(
+        logging.getLogger("test"), max_count=None, max_bytes=None, max_age_s=0.0
+    )
+    assert miner.trigger(mempool) == "age"
+
+
+def test_mines_when_woken_up_and_on_age():
+    async def run():
+        mempool = Mempool()
+        miner = AutoMiner(
+            logging.getLogger("test"), max_count=3, max_bytes=None, max_age_s=0.2
+        )
+
+        async def mine():
+            mempool.clear()
+
+        miner.start(lambda: mempool, mine)
+        for i in range(3):
+            mempool.add(make_policy(str(i)))
+        miner.notify()
+        await asyncio.sleep(0.05)
+        assert miner.stats()["by_count"] == 1
+
+        mempool.add(make_policy("3"))
+        miner.notify()
+        await asyncio.sleep(0.05)
+        assert miner.stats()["mined"] == 1
+        await asyncio.sleep(0.3)
+        assert miner.stats()["by_age"] == 1
+        assert not mempool
+        await miner.stop()
+
+    asyncio.run(run())
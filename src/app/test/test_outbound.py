@@ -0,0 +1,169 @@
+import asyncio
+import logging
+
+import requests
+
+from app.outbound import OutboundScheduler
+from app.peers import PeerTable
+from blockchain import compact_block
+from blockchain.ac_block import ACBlock
+from blockchain.ac_transaction import ACResourcePolicy
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, content: dict | str):
+        self.status_code = status_code
+        self.content = content
+
+    def json(self):
+        return self.content
+
+
+class RecordingScheduler(OutboundScheduler):
+    def __init__(self, *args, fail: bool = False, answers: dict = None, **kwargs):
+        super().__init__(logging.getLogger("test"), *args, **kwargs)
+        self.fail = fail
+        self.answers = answers if answers is not None else {}
+        self.sent = []
+
+    async def _request(
+        self, outbox, method, path, data=None, params=None, timeout_s=None
+    ):
+        self.sent.append((outbox.peer, path, data, params))
+        await asyncio.sleep(0)
+        if self.fail:
+            return None
+        answers = self.answers.get(path, [])
+        return answers.pop(0) if answers else FakeResponse(201, "")
+
+
+async def drain(scheduler: OutboundScheduler):
+    for _ in range(100):
+        await asyncio.sleep(0)
+    await scheduler.stop()
+
+
+def test_policies_are_coalesced():
+    async def run():
+        scheduler = RecordingScheduler(batch_size=10)
+        for i in range(25):
+            scheduler.send_policies([{"id": str(i)}], ["peer:8000"], hops=1)
+        await drain(scheduler)
+        return scheduler.sent
+
+    sent = asyncio.run(run())
+    assert [len(data) for _, _, data, _ in sent] == [10, 10, 5]
+    assert all(path == "/add-policies" for _, path, _, _ in sent)
+
+
+def make_blocks() -> tuple[ACBlock, ACBlock]:
+    policy = ACResourcePolicy(id="0", action="add")
+    parent = ACBlock(index=0, timestamp="10", previous_hash="0")
+    block = ACBlock(
+        index=1,
+        timestamp="11",
+        previous_hash=parent.compute_hash(),
+        resource_policies=[policy],
+    )
+    return block, parent
+
+
+def test_blocks_take_priority():
+    async def run():
+        scheduler = RecordingScheduler()
+        scheduler.send_policies([{"id": "0"}], ["peer:8000"], hops=1)
+        scheduler.announce_block(*make_blocks(), ["peer:8000"])
+        await drain(scheduler)
+        return scheduler.sent
+
+    sent = asyncio.run(run())
+    assert [path for _, path, _, _ in sent] == ["/add-compact-block", "/add-policies"]
+
+
+def test_missing_transactions_are_sent():
+    async def run():
+        block, parent = make_blocks()
+        short_id = compact_block.to_compact(block, parent)["resource_policies"][0][1]
+        scheduler = RecordingScheduler(
+            answers={"/add-compact-block": [FakeResponse(200, {"missing": [short_id]})]}
+        )
+        scheduler.announce_block(block, parent, ["peer:8000"])
+        await drain(scheduler)
+        return short_id, scheduler.sent
+
+    short_id, sent = asyncio.run(run())
+    assert [path for _, path, _, _ in sent] == [
+        "/add-compact-block",
+        "/add-compact-block",
+    ]
+    assert sent[0][2]["transactions"] == {}
+    assert list(sent[1][2]["transactions"]) == [short_id]
+
+
+def test_full_block_is_sent_when_it_cannot_be_rebuilt():
+    async def run():
+        scheduler = RecordingScheduler(
+            answers={"/add-compact-block": [FakeResponse(200, {"full": True})]}
+        )
+        scheduler.announce_block(*make_blocks(), ["peer:8000"])
+        await drain(scheduler)
+        return scheduler.sent
+
+    sent = asyncio.run(run())
+    assert [path for _, path, _, _ in sent] == ["/add-compact-block", "/add-block"]
+    assert "body" in sent[1][2]
+
+
+def test_peer_too_far_behind_is_resynced():
+    async def run():
+        scheduler = RecordingScheduler(max_pending=5)
+        scheduler.send_policies([{"id": str(i)} for i in range(4)], ["peer:8000"], 1)
+        scheduler.send_policies([{"id": str(i)} for i in range(4)], ["peer:8000"], 1)
+        stats = scheduler.stats()["peer:8000"]
+        await drain(scheduler)
+        return stats, scheduler.sent
+
+    stats, sent = asyncio.run(run())
+    assert stats["dropped"] == 8
+    assert [path for _, path, _, _ in sent] == ["/consensus"]
+
+
+def test_failing_peer_messages_are_dropped():
+    async def run():
+        scheduler = RecordingScheduler(batch_size=1, max_failures=2, fail=True)
+        scheduler.send_policies([{"id": str(i)} for i in range(5)], ["peer:8000"], 1)
+        await drain(scheduler)
+        return scheduler
+
+    scheduler = asyncio.run(run())
+    assert len(scheduler.sent) == 2
+
+
+def test_slow_resync_is_not_a_failure(monkeypatch):
+    timeouts = []
+
+    def slow_consensus(method, url, timeout, **kwargs):
+        timeouts.append(timeout)
+        raise requests.exceptions.ReadTimeout()
+
+    monkeypatch.setattr(requests, "request", slow_consensus)
+    peers = PeerTable(["peer:8000"])
+
+    async def run():
+        scheduler = OutboundScheduler(
+            logging.getLogger("test"),
+            max_pending=1,
+            resync_timeout_s=30.0,
+            peer_table=peers,
+        )
+        scheduler.send_policies([{"id": "0"}, {"id": "1"}], ["peer:8000"], 1)
+        # The resync runs in a worker thread
+        await asyncio.sleep(0.2)
+        stats = scheduler.stats()["peer:8000"]
+        await drain(scheduler)
+        return stats
+
+    stats = asyncio.run(run())
+    assert timeouts == [30.0]
+    assert stats["resyncs"] == 1 and stats["failures"] == 0
+    assert peers.health("peer:8000").failures == 0
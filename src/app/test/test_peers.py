@@ -0,0 +1,66 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from app.dependency import get_peers
+from app.main import app
+from app.peers import PeerTable
+
+
+def test_timeout_follows_rtt():
+    peers = PeerTable(["a"], min_timeout_s=0.05, max_timeout_s=2.5)
+    assert peers.timeout("a") == 2.5
+    for _ in range(20):
+        peers.record_success("a", 0.1)
+    assert 0.1 <= peers.timeout("a") < 0.2
+    peers.record_success("a", 10)
+    assert peers.timeout("a") == 2.5
+
+
+def test_failures_back_off_exponentially():
+    peers = PeerTable(["a", "b"], backoff_base_s=10, backoff_max_s=25)
+    peers.record_failure("a")
+    assert not peers.is_available("a")
+    assert 9 < peers.backoff_remaining("a") <= 10
+    peers.record_failure("a")
+    assert 19 < peers.backoff_remaining("a") <= 20
+    peers.record_failure("a")
+    assert peers.backoff_remaining("a") <= 25
+    assert peers.available() == ["b"]
+    peers.record_success("a", 0.1)
+    assert peers.is_available("a")
+    assert peers.health("a").failures == 0
+
+
+def test_backoff_of_a_peer_that_stays_down_is_capped():
+    peers = PeerTable(["a"], backoff_base_s=1, backoff_max_s=60)
+    for _ in range(5000):
+        peers.record_failure("a")
+    assert 59 < peers.backoff_remaining("a") <= 60
+    assert peers.health("a").failures == 5000
+
+
+def test_available_prefers_healthy_peers():
+    peers = PeerTable(["slow", "fast", "flaky"], backoff_base_s=0.001)
+    peers.record_success("slow", 1.0)
+    peers.record_success("fast", 0.01)
+    peers.record_failure("flaky")
+    time.sleep(0.01)
+    assert peers.available() == ["fast", "slow", "flaky"]
+
+
+def test_consensus_skips_dead_peer():
+    with TestClient(app) as client:
+        peers = get_peers()
+        peers.add("127.0.0.1:1")
+        try:
+            assert client.get("/consensus").json() == {"replaced": False}
+            health = client.get("/peers").json()["127.0.0.1:1"]
+            assert health["failures"] == 1 and health["backoff_s"] > 0
+
+            started = time.monotonic()
+            assert client.get("/consensus").json() == {"replaced": False}
+            assert time.monotonic() - started < 0.5
+            assert client.get("/peers").json()["127.0.0.1:1"]["failures"] == 1
+        finally:
+            peers.discard("127.0.0.1:1")
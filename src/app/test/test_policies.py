@@ -0,0 +1,92 @@
+import logging
+
+from fastapi.testclient import TestClient
+
+from app.ac_validation import ACIdentityPolicy, ACResourcePolicy
+from app.config import settings
+from app.gossip import SeenCache
+from app.main import app
+from app.nodes.full_node import policies_adapter, receive_policies
+from app.peers import PeerTable
+from blockchain import ac_transaction
+from blockchain.ac_block import ACBlock
+from blockchain.ac_blockchain import ACBlockchain
+
+IDENTITY_POLICY = {
+    "id": "i0",
+    "action": "add",
+    "statements": {
+        "s0": {"version": "1", "sid": "s0", "effect": "Allow", "resource": "bucket"}
+    },
+}
+RESOURCE_POLICY = {
+    "id": "r0",
+    "action": "add",
+    "statements": {
+        "s0": {
+            "version": "1",
+            "sid": "s0",
+            "effect": "Deny",
+            "resource": "bucket",
+            "principal": "user",
+        }
+    },
+}
+
+
+def test_policies_are_told_apart_by_their_principal():
+    identity, resource = policies_adapter.validate_python(
+        [IDENTITY_POLICY, RESOURCE_POLICY]
+    )
+    assert isinstance(identity, ACIdentityPolicy)
+    assert isinstance(resource, ACResourcePolicy)
+    assert identity.model_dump() == IDENTITY_POLICY | {
+        "statements": {
+            "s0": IDENTITY_POLICY["statements"]["s0"] | {"action": [], "condition": {}}
+        }
+    }
+
+
+def test_committed_identity_policy_leaves_the_mempool():
+    chain = ACBlockchain(difficulty=1)
+    response = receive_policies(
+        policies_adapter.validate_python([IDENTITY_POLICY, RESOURCE_POLICY]),
+        settings.gossip_max_hops,
+        "test",
+        chain,
+        PeerTable(()),
+        SeenCache(),
+        None,
+        logging.getLogger("test"),
+    )
+    assert response.status_code == 201
+    assert len(chain.unconfirmed_transactions) == 2
+
+    # A peer mines the policies into a block, with the models of the block bodies
+    block = ACBlock(
+        index=1,
+        timestamp="1",
+        previous_hash=chain.get_last_bloc.compute_hash(),
+        resource_policies=[ac_transaction.ACResourcePolicy(**RESOURCE_POLICY)],
+        identity_policies={
+            "user": {"i0": ac_transaction.ACIdentityPolicy(**IDENTITY_POLICY)}
+        },
+    )
+    chain.proof_of_work(block)
+    assert chain.add_block(block)
+    assert chain.remove_confirmed_transactions(block) == 2
+    assert len(chain.unconfirmed_transactions) == 0
+
+
+def test_oversized_batch_is_refused_before_validation(monkeypatch):
+    monkeypatch.setattr(settings, "max_policy_batch", 2)
+    with TestClient(app) as client:
+        # The policies are not valid, the batch is refused for its size alone
+        response = client.post("/add-policies", json=[{"id": 0}] * 3)
+        assert response.status_code == 413
+        response = client.post("/add-policies", json=[{"id": 0}] * 2)
+        assert response.status_code == 422
+        response = client.post("/add-policies", content=b"[")
+        assert response.status_code == 422
+        response = client.post("/add-policies", json=[RESOURCE_POLICY])
+        assert response.status_code == 201
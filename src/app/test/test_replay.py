@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+from app import replay
+from app.replay import ReplayCache, ReplayCacheFull
+from app.security import issue_nonce, verify_nonce
+
+
+class Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+def test_nonce_is_bound_to_client_and_expiration():
+    expiration = time.time() + 60
+    nonce = issue_nonce("aa", expiration)
+    assert verify_nonce(nonce, "aa", expiration)
+    assert not verify_nonce(nonce, "bb", expiration)
+    assert not verify_nonce(nonce, "aa", expiration + 1)
+    assert not verify_nonce("not a nonce", "aa", expiration)
+
+
+def test_replay_cache_expires_keys(monkeypatch):
+    clock = Clock(1000.0)
+    monkeypatch.setattr(replay, "time", clock)
+    cache = ReplayCache(max_ttl_s=10, tick_s=1)
+    assert cache.add("n0", 1005.5)
+    assert cache.add("n1", 1002.0)
+    assert not cache.add("n0", 1005.5)
+    clock.now = 1003.0
+    assert "n1" not in cache and "n0" in cache
+    # The key is kept until its expiration has passed, even within its last tick
+    clock.now = 1005.9
+    assert "n0" in cache
+    clock.now = 1006.0
+    assert len(cache) == 0
+    # Past a whole turn of the wheel every key has expired
+    assert cache.add("n2", 1100.0)
+    clock.now = 2000.0
+    assert len(cache) == 0
+    assert cache.stats()["expired"] == 3 and cache.stats()["replayed"] == 1
+
+
+def test_full_replay_cache_refuses_keys(monkeypatch):
+    clock = Clock(1000.0)
+    monkeypatch.setattr(replay, "time", clock)
+    cache = ReplayCache(max_ttl_s=10, max_entries=1)
+    cache.add("n0", 1001.0)
+    with pytest.raises(ReplayCacheFull):
+        cache.add("n1", 1001.0)
+    clock.now = 1002.0
+    assert cache.add("n1", 1005.0)
+
+
+def test_malformed_nonce_is_refused():
+    expiration = time.time() + 60
+    assert not verify_nonce("ab.\u00e9", "aa", expiration)
+    assert not verify_nonce("ab.\ud800", "aa", expiration)
+    assert not verify_nonce(issue_nonce("aa", expiration), "aa", "soon")
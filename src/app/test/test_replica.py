@@ -0,0 +1,74 @@
+import asyncio
+import json
+import logging
+
+from app.nodes.full_node import policy_deltas
+from app.replica import PolicyReplica
+from blockchain.ac_blockchain import ACBlockchain
+from blockchain.ac_transaction import ACIdentityPolicy, ACResourcePolicy
+from blockchain.test.test_block_tree import fork_of, seal_next
+
+
+def make_replica(**kwargs) -> PolicyReplica:
+    return PolicyReplica(["127.0.0.1:1"], {}, {}, logging.getLogger("test"), **kwargs)
+
+
+def feed(replica: PolicyReplica, chain: ACBlockchain, max_blocks: int = 100) -> int:
+    # The answers go through JSON as they do between the nodes
+    deltas = policy_deltas(chain.chain, replica.height, replica.tip_hash, max_blocks)
+    return replica.apply(json.loads(json.dumps(deltas)))
+
+
+def test_replica_follows_the_chain():
+    chain = ACBlockchain(difficulty=1)
+    for i in range(3):
+        seal_next(chain, f"a{i}", [ACResourcePolicy(id=f"p{i}", action="add")])
+    replica = make_replica()
+    assert replica.is_lagging()
+
+    assert feed(replica, chain, max_blocks=2) == 2
+    assert replica.height == 1 and replica.is_lagging()
+    assert feed(replica, chain) == 2
+    assert not replica.is_lagging()
+    assert set(replica.resource_policies) == {"p0", "p1", "p2"}
+    assert feed(replica, chain) == 0
+
+    seal_next(chain, "a3", [ACResourcePolicy(id="p0", action="remove")])
+    assert feed(replica, chain) == 1
+    assert set(replica.resource_policies) == {"p1", "p2"}
+    assert replica.tip_hash == chain.get_last_bloc.compute_hash()
+
+
+def test_identity_policies_are_replicated():
+    chain = ACBlockchain(difficulty=1)
+    seal_next(chain, "a0")
+    chain.get_last_bloc.body.identity_policies = {
+        "user": {"i0": ACIdentityPolicy(id="i0", action="add")}
+    }
+    replica = make_replica()
+    feed(replica, chain)
+    assert set(replica.identity_policies["user"]) == {"i0"}
+
+
+def test_reorganization_rebuilds_the_replica():
+    chain = ACBlockchain(difficulty=1)
+    seal_next(chain, "a0", [ACResourcePolicy(id="p0", action="add")])
+    other = fork_of(chain, 1)
+    seal_next(chain, "a1", [ACResourcePolicy(id="p1", action="add")])
+    replica = make_replica()
+    feed(replica, chain)
+
+    for i in range(2):
+        seal_next(other, f"b{i}", [ACResourcePolicy(id=f"q{i}", action="add")])
+    assert feed(replica, other) == 4
+    assert replica.stats()["resets"] == 1
+    assert set(replica.resource_policies) == {"p0", "q0", "q1"}
+    assert replica.height == 3
+
+
+def test_lagging_replica_proxies():
+    replica = make_replica(wait_s=0.0, max_lag_s=0.0)
+    status_code, content = asyncio.run(replica.proxy(b"{}"))
+    # No full node answers at this address
+    assert status_code == 503
+    assert replica.stats()["proxied"] == 1
@@ -0,0 +1,55 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.security import (
+    create_access_token_async,
+    decode_and_verify_jwt_signature_async,
+)
+from app.security_pool import SecurityPool, SecurityPoolFull
+
+
+def test_operations_run_off_the_event_loop():
+    pool = SecurityPool(workers=2)
+    loop_thread = threading.get_ident()
+
+    async def run():
+        threads = await asyncio.gather(
+            *(pool.run(threading.get_ident) for _ in range(4))
+        )
+        with pytest.raises(ZeroDivisionError):
+            await pool.run(divmod, 1, 0)
+        return threads
+
+    threads = asyncio.run(run())
+    pool.shutdown()
+    assert loop_thread not in threads
+    stats = pool.stats()
+    assert stats["completed"] == 4 and stats["failed"] == 1
+    assert stats["queued"] == 0 and stats["max_queued"] == 2
+
+
+def test_full_pool_refuses_operations():
+    pool = SecurityPool(workers=1, max_pending=1)
+    release = threading.Event()
+
+    async def run():
+        blocked = asyncio.ensure_future(pool.run(release.wait))
+        await asyncio.sleep(0)
+        with pytest.raises(SecurityPoolFull):
+            await pool.run(int)
+        release.set()
+        await blocked
+
+    asyncio.run(run())
+    pool.shutdown()
+    assert pool.stats()["refused"] == 1
+
+
+def test_tokens_are_signed_and_verified_in_the_pool():
+    async def run():
+        token = await create_access_token_async({"sub": "pk", "client_id": "c"})
+        return await decode_and_verify_jwt_signature_async(token)
+
+    assert asyncio.run(run())["client_id"] == "c"
@@ -0,0 +1,76 @@
+import asyncio
+
+from app.snapshot import PolicySnapshotReader, PolicySnapshotWriter
+from blockchain.ac_blockchain import ACBlockchain
+from blockchain.ac_transaction import ACIdentityPolicy, ACResourcePolicy
+from blockchain.policy_journal import PolicyJournal
+from blockchain.test.test_block_tree import seal_next
+
+
+def test_snapshot_lookups(tmp_path):
+    path = str(tmp_path / "policies.snapshot")
+    resource_policies = {
+        f"p{i}": ACResourcePolicy(id=f"p{i}", action="add") for i in range(50)
+    }
+    identity_policies = {
+        "user": {"i0": ACIdentityPolicy(id="i0", action="add")},
+        "üser": {},
+    }
+    reader = PolicySnapshotReader(path, check_interval_s=0)
+    assert reader.table("resource_policies") == {}
+
+    writer = PolicySnapshotWriter(path, resource_policies, identity_policies)
+    writer.publish(height=7)
+    table = reader.table("resource_policies")
+    assert len(table) == 50 and sorted(table) == sorted(resource_policies)
+    assert table["p17"] == resource_policies["p17"]
+    assert table.get("missing") is None
+    identities = reader.table("identity_policies")
+    assert identities["user"]["i0"].id == "i0"
+    assert identities["üser"] == {}
+    assert reader.stats()["height"] == 7
+
+    # A view keeps reading the snapshot it was taken from
+    del resource_policies["p17"]
+    writer.publish(height=8)
+    assert table["p17"].id == "p17"
+    assert "p17" not in reader.table("resource_policies")
+    assert reader.stats()["generation"] == 2
+
+
+def test_journal_publishes_on_change(tmp_path):
+    path = str(tmp_path / "policies.snapshot")
+    chain = ACBlockchain(difficulty=1)
+    seal_next(chain, "a0", [ACResourcePolicy(id="p0", action="add")])
+    journal = PolicyJournal({})
+    writer = PolicySnapshotWriter(path, journal.mem_policies, {})
+    journal.listeners.append(writer.publish)
+
+    journal.sync(chain.chain)
+    journal.sync(chain.chain)
+    assert writer.generation == 1
+    reader = PolicySnapshotReader(path)
+    assert list(reader.table("resource_policies")) == ["p0"]
+    assert reader.stats()["height"] == 1
+
+
+def test_publishes_are_coalesced_off_the_loop(tmp_path):
+    path = str(tmp_path / "policies.snapshot")
+    resource_policies = {}
+    writer = PolicySnapshotWriter(path, resource_policies, {})
+
+    async def run():
+        for i in range(20):
+            resource_policies[f"p{i}"] = ACResourcePolicy(id=f"p{i}", action="add")
+            writer.publish(height=i)
+        # Nothing has been written by the calls themselves
+        assert writer.stats()["written"] == 0
+        await writer.stop()
+
+    asyncio.run(run())
+    stats = writer.stats()
+    assert stats["published"] == 20 and stats["written"] == 1
+    assert stats["pending"] is None and not stats["running"]
+    reader = PolicySnapshotReader(path)
+    assert len(reader.table("resource_policies")) == 20
+    assert reader.stats()["height"] == 19
@@ -0,0 +1,59 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.nodes import full_node
+from app.stream import STREAM_PATH, make_frame
+
+
+async def missing_key(*args):
+    raise KeyError("resource_policies")
+
+
+def test_peer_stream_frames(monkeypatch):
+    with TestClient(app) as client:
+        with client.websocket_connect(STREAM_PATH) as websocket:
+            websocket.send_text(make_frame("ping", 0))
+            assert websocket.receive_json()["type"] == "pong"
+
+            policy = {"id": "stream-policy", "action": "add"}
+            websocket.send_text(make_frame("transactions", 1, [policy], hops=1))
+            reply = websocket.receive_json()
+            assert reply["id"] == 1 and reply["status"] == 201
+            assert reply["payload"] == {"added": 1, "duplicates": 0}
+
+            websocket.send_text(make_frame("transactions", 2, [policy], hops=1))
+            assert websocket.receive_json()["payload"] == {"added": 0, "duplicates": 1}
+
+            websocket.send_text(make_frame("transactions", 3, [{"id": "0"}]))
+            assert websocket.receive_json()["status"] == 422
+
+            websocket.send_text(make_frame("headers", 4, start=0))
+            reply = websocket.receive_json()
+            assert reply["status"] == 200
+            assert reply["payload"]["headers"][0]["index"] == 0
+
+            websocket.send_text(json.dumps({"type": "unknown", "id": 5}))
+            assert websocket.receive_json()["status"] == 400
+
+            # Malformed frames are refused, and the channel stays open
+            for malformed in ("not json", "[]", json.dumps({"type": "ping"})):
+                websocket.send_text(malformed)
+                reply = websocket.receive_json()
+                assert reply["id"] is None and reply["status"] == 422
+            websocket.send_bytes(b"\x00")
+            assert websocket.receive_json()["status"] == 422
+            # A block whose body cannot be read, or whose contents break the handler
+            websocket.send_text(make_frame("block", 7, {"index": 1, "body": {}}))
+            assert websocket.receive_json()["status"] == 422
+            with monkeypatch.context() as patch:
+                patch.setattr(full_node, "get_headers", missing_key)
+                websocket.send_text(make_frame("headers", 8))
+                assert websocket.receive_json()["status"] == 400
+            websocket.send_text(make_frame("ping", 6))
+            assert websocket.receive_json() == {
+                "type": "pong",
+                "id": 6,
+                "payload": None,
+            }
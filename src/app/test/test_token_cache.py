@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+
+from app import security
+from app.security import (
+    create_access_token,
+    decode_and_verify_jwt_signature,
+    decode_and_verify_jwt_signature_async,
+    generate_private_key,
+)
+from app.token_cache import IssuerRegistry, VerifiedTokenCache
+
+
+def test_verified_tokens_are_cached_until_they_expire():
+    cache = VerifiedTokenCache(max_entries=2)
+    cache.put("t0", {"exp": time.time() + 60, "sub": "a"})
+    cache.put("t1", {"exp": time.time() - 1, "sub": "b"})
+    cache.put("t2", {"sub": "c"})
+    assert cache.get("t0")["sub"] == "a"
+    assert cache.get("t1") is None and cache.get("t2") is None
+    cache.put("t3", {"exp": time.time() + 60})
+    cache.put("t4", {"exp": time.time() + 60})
+    # t0 was the least recently used
+    assert cache.get("t0") is None and len(cache) == 2
+
+
+def test_token_is_verified_once(monkeypatch):
+    token = create_access_token({"sub": "pk", "client_id": "c"})
+    assert decode_and_verify_jwt_signature(token)["client_id"] == "c"
+    # A cached token is not verified again
+    monkeypatch.setattr(security.jwt, "decode", None)
+    assert decode_and_verify_jwt_signature(token)["client_id"] == "c"
+    assert security.get_token_cache().stats()["hits"] >= 1
+
+
+def test_untrusted_issuer_is_refused(monkeypatch):
+    registry = IssuerRegistry("own")
+    assert registry.is_trusted("anyone")
+    registry.add("peer")
+    assert registry.is_trusted("peer") and not registry.is_trusted("anyone")
+    registry.remove("own")
+    assert registry.is_trusted("own")
+
+    monkeypatch.setattr(security, "issuers", IssuerRegistry("own", ["peer"]))
+    with pytest.raises(jwt.InvalidIssuerError):
+        decode_and_verify_jwt_signature(create_access_token({"sub": "pk"}))
+
+
+def test_cached_token_of_a_removed_issuer_is_refused(monkeypatch):
+    peer_key = generate_private_key("EdDSA")
+    peer = (
+        peer_key.public_key()
+        .public_bytes(
+            encoding=serialization.Encoding.OpenSSH,
+            format=serialization.PublicFormat.OpenSSH,
+        )
+        .hex()
+    )
+    registry = IssuerRegistry("own", [peer])
+    monkeypatch.setattr(security, "issuers", registry)
+    claims = {"sub": "pk", "client_id": "c", "iss": peer, "exp": time.time() + 60}
+    token = jwt.encode(claims, peer_key, algorithm="EdDSA")
+    assert decode_and_verify_jwt_signature(token)["client_id"] == "c"
+    registry.remove(peer)
+    with pytest.raises(jwt.InvalidIssuerError):
+        decode_and_verify_jwt_signature(token)
+    with pytest.raises(jwt.InvalidIssuerError):
+        asyncio.run(decode_and_verify_jwt_signature_async(token))
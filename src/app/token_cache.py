@@ -0,0 +1,78 @@
+"""This module contains what lets a node check the tokens presented by MinIO without verifying their signature each
+time: the cache of the tokens already verified, and the registry of the nodes whose tokens are trusted.
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+
+
+class VerifiedTokenCache:
+    """
+    The claims of the tokens whose signature has been verified, by digest of the token, until the token expires. The
+    cache never holds more than max_entries tokens, the least recently used being dropped first.
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> dict | None:
+        key = self.digest(token)
+        entry = self._entries.get(key, None)
+        if entry is None or entry[0] <= time.time():
+            self._entries.pop(key, None)
+            self._stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._stats["hits"] += 1
+        return dict(entry[1])
+
+    def put(self, token: str, claims: dict) -> None:
+        """
+        Records the claims of a verified token, a token without expiration is not cached
+        :param token:
+        :param claims:
+        :return:
+        """
+        if "exp" not in claims:
+            return
+        key = self.digest(token)
+        self._entries[key] = (float(claims["exp"]), dict(claims))
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), **self._stats}
+
+
+class IssuerRegistry:
+    """
+    The public keys, hex encoded, of the nodes whose tokens are accepted. A node always trusts itself. When no other
+    issuer is configured the registry is open and any issuer is accepted, as nodes did before it existed.
+    """
+
+    def __init__(self, own_key: str, trusted: list[str] | None = None):
+        self.own_key = own_key
+        self.open = not trusted
+        self.keys: set[str] = {own_key, *(trusted or ())}
+
+    def add(self, key: str) -> None:
+        self.keys.add(key)
+        self.open = False
+
+    def remove(self, key: str) -> None:
+        if key != self.own_key:
+            self.keys.discard(key)
+
+    def is_trusted(self, key: str) -> bool:
+        return self.open or key in self.keys
@@ -7,10 +7,23 @@ import time
 import pandas as pd
 import hashlib
 
+from pydantic import BaseModel, TypeAdapter
+
+from . import merkle
 from .errors import ContractNotFound
 from .smart_contract import SmartContract
 from .ac_transaction import ACResourcePolicy, ACIdentityPolicy
 
+resource_policies_validator = TypeAdapter(dict[str, ACResourcePolicy])
+identity_policies_validator = TypeAdapter(dict[str, dict[str, ACIdentityPolicy]])
+
+
+def _json_default(value) -> str:
+    # Timestamps are written as the REST API writes them, so that a body hashes the same once it has been shipped
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
 
 class ACBlockBody:
     def __init__(
@@ -78,6 +91,53 @@ class ACBlockBody:
             "identity_policies": identities,
         }
 
+    def to_bytes(self) -> bytes:
+        """
+        Returns the canonical serialization of the body, which is what gets hashed and shipped to peers
+        :return:
+        """
+        return ACBlockBody.serialize(self.to_dict())
+
+    @staticmethod
+    def serialize(body_dict: dict) -> bytes:
+        return json.dumps(body_dict, default=_json_default).encode()
+
+    @classmethod
+    def from_dict(cls, body_dict: dict) -> ACBlockBody:
+        """
+        Builds a body from its dict representation, validating the policies it carries
+        :param body_dict:
+        :return:
+        """
+        body_dict = dict(body_dict)
+        if body_dict["resource_policies"]:
+            body_dict["resource_policies"] = (
+                resource_policies_validator.validate_python(
+                    body_dict["resource_policies"]
+                )
+            )
+        if body_dict["identity_policies"]:
+            body_dict["identity_policies"] = (
+                identity_policies_validator.validate_python(
+                    body_dict["identity_policies"]
+                )
+            )
+        return cls(**body_dict)
+
+    @classmethod
+    def from_bytes(cls, raw_body: bytes) -> ACBlockBody:
+        return cls.from_dict(json.loads(raw_body))
+
+
+class BlockPolicies(BaseModel):
+    """
+    The policies of a body, which can be read from its canonical bytes without building its contract and events
+    tables
+    """
+
+    resource_policies: dict[str, ACResourcePolicy] = {}
+    identity_policies: dict[str, dict[str, ACIdentityPolicy]] = {}
+
 
 class ACBlock(Block):
     def __init__(
@@ -106,21 +166,175 @@ class ACBlock(Block):
             ]
         ),
         body: dict | ACBlockBody = None,
+        raw_body: bytes | None = None,
+        target: int | None = None,
+        signer: str | None = None,
+        signature: str | None = None,
+        merkle_root: str | None = None,
+        body_hash: str | None = None,
     ):
+        """
+        When raw_body is given, the block keeps the canonical bytes of its body and parses them only on the first
+        access to body. This is meant for blocks imported from peers, whose bodies are rarely read after validation.
+        The target is the number the proof of work digest must not exceed, blocks without one were mined with the
+        difficulty of the chain. Blocks sealed by proof of authority carry instead the public key of the authority that
+        signed them and its signature, both hex encoded. The merkle root commits to the policies and the events of the
+        body one by one, see merkle.py.
+        Blocks sealed with a body hash commit to their body only through it, so that their hash and their seal can be
+        checked from the header alone. Blocks without one are hashed and sealed together with their whole body.
+        """
         super().__init__(index, timestamp, previous_hash, proof)
+        self.target = target
+        self.signer = signer
+        self.signature = signature
+        self.merkle_root = merkle_root
+        self.body_hash = body_hash
+        self._body: ACBlockBody | None = None
+        self._raw_body = raw_body
+        self._policies: BlockPolicies | None = None
+        if raw_body is not None:
+            return
         if resource_policies is None:
             resource_policies = []
         if identity_policies is None:
             identity_policies = {}
         if not body:
-            self.body: ACBlockBody = ACBlockBody(
+            self.body = ACBlockBody(
                 resource_policies, contract_header, events, identity_policies
             )
         else:
             self.body = body if isinstance(body, ACBlockBody) else ACBlockBody(**body)
 
+    @property
+    def body(self) -> ACBlockBody:
+        if self._body is None:
+            self._body = ACBlockBody.from_bytes(self._raw_body)
+            # Once parsed the body can be mutated, so the raw bytes are no longer trustworthy
+            self._raw_body = None
+            self._policies = None
+        return self._body
+
+    @body.setter
+    def body(self, value: ACBlockBody) -> None:
+        self._body = value
+        self._raw_body = None
+        self._policies = None
+
+    @property
+    def policies(self) -> BlockPolicies:
+        """
+        The policies of the block. While the body has not been parsed they are read alone from its raw bytes, so that
+        the cache of the policies and the mem pool can follow an imported chain without parsing its bodies.
+        """
+        if self._body is not None:
+            return BlockPolicies.model_construct(
+                resource_policies=self._body.resource_policies,
+                identity_policies=self._body.identity_policies,
+            )
+        if self._policies is None:
+            self._policies = BlockPolicies.model_validate_json(self._raw_body)
+        return self._policies
+
+    @property
+    def is_body_loaded(self) -> bool:
+        return self._body is not None
+
+    @property
+    def body_bytes(self) -> bytes:
+        if self._body is None:
+            return self._raw_body
+        return self._body.to_bytes()
+
+    @property
+    def header(self) -> dict:
+        header = super().to_dict()
+        if self.target is not None:
+            header["target"] = self.target
+        if self.merkle_root is not None:
+            header["merkle_root"] = self.merkle_root
+        if self.body_hash is not None:
+            header["body_hash"] = self.body_hash
+        if self.signer is not None:
+            header["signer"] = self.signer
+        if self.signature is not None:
+            header["signature"] = self.signature
+        return header
+
     def compute_hash(self) -> str:
-        return hashlib.sha256(json.dumps(self.to_dict()).encode()).hexdigest()
+        return ACBlock.hash_from_parts(self.header, self.body_bytes)
+
+    def compute_merkle_root(self) -> str:
+        return merkle.merkle_root(
+            [leaf for _, leaf in merkle.body_leaves(self.body_bytes)]
+        )
+
+    def commit_body(self) -> None:
+        """
+        Stores in the header the merkle root and the hash of the body, once the body will not change anymore
+        :return:
+        """
+        body_bytes = self.body_bytes
+        self.merkle_root = merkle.merkle_root(
+            [leaf for _, leaf in merkle.body_leaves(body_bytes)]
+        )
+        self.body_hash = ACBlock.body_digest(body_bytes)
+
+    @property
+    def seal_data(self) -> bytes:
+        header = self.header
+        if "body_hash" in header:
+            return ACBlock.seal_bytes(header, None)
+        return ACBlock.seal_bytes(header, self.body_bytes)
+
+    @staticmethod
+    def body_digest(body_bytes: bytes) -> str:
+        return hashlib.sha256(body_bytes).hexdigest()
+
+    @staticmethod
+    def seal_bytes(header: dict, body_bytes: bytes | None) -> bytes:
+        """
+        Returns the data the seal of a block covers besides its proof: the header, without the fields set by the
+        sealing itself, for the blocks that carry the hash of their body, and the whole body for the others
+        :param header:
+        :param body_bytes: Not needed when the header carries the hash of the body
+        :return:
+        """
+        if "body_hash" not in header:
+            return body_bytes
+        return json.dumps(
+            {
+                key: value
+                for key, value in header.items()
+                if key not in ("proof", "signature")
+            }
+        ).encode()
+
+    def inclusion_proof(self, key: tuple) -> dict | None:
+        """
+        Returns the proof that a policy or an event is in the block
+        :param key: The key of the leaf, see merkle.body_leaves
+        :return: The leaf, the siblings on its way to the root and the root, or None if the block holds no such leaf
+        """
+        leaves = merkle.body_leaves(self.body_bytes)
+        keys = [leaf_key for leaf_key, _ in leaves]
+        if key not in keys:
+            return None
+        index = keys.index(key)
+        return {
+            "leaf": leaves[index][1].decode(),
+            "proof": merkle.merkle_proof([leaf for _, leaf in leaves], index),
+            "root": self.merkle_root,
+        }
+
+    @staticmethod
+    def hash_from_parts(header: dict, body_bytes: bytes | None) -> str:
+        if "body_hash" in header:
+            return hashlib.sha256(json.dumps(header).encode()).hexdigest()
+        # The body bytes are spliced into the header, so that hashing a lazy block does not parse its body
+        header = json.dumps(header)
+        return hashlib.sha256(
+            header[:-1].encode() + b', "body": ' + body_bytes + b"}"
+        ).hexdigest()
 
     def find_contract(
         self, contract_name: str
@@ -148,10 +362,13 @@ class ACBlock(Block):
 
     def __eq__(self, other) -> bool:
         if isinstance(other, ACBlock):
-            return other.to_dict() == self.to_dict()
+            return other.header == self.header and other.body_bytes == self.body_bytes
         return NotImplemented
 
     def to_dict(self) -> dict:
-        super_dict = super().to_dict()
-        super_dict.update({"body": self.body.to_dict()})
+        super_dict = self.header
+        if self._body is None:
+            super_dict.update({"body": json.loads(self._raw_body)})
+        else:
+            super_dict.update({"body": self._body.to_dict()})
         return super_dict
@@ -1,20 +1,44 @@
+from concurrent.futures import ProcessPoolExecutor
 from copy import deepcopy
+from itertools import repeat
 
 import pandas as pd
 
-from pydantic import TypeAdapter
 from blockchain.blockchain import BlockChain
-from .ac_transaction import ACPolicy, ACResourcePolicy, ACIdentityPolicy
+from .ac_transaction import ACPolicy, ACResourcePolicy
 from blockchain.ac_block import ACBlock, ACBlockBody
 from datetime import datetime
-import hashlib
 from .errors import (
     NoTransactionsFound,
     ContractNotFound,
     InvalidChain,
+    MempoolFull,
 )
+from .block_template import BlockTemplate, select_transactions
+from . import merkle
+from .block_tree import BlockTree
+from .checkpoint import Checkpoint, policy_state_digest
+from .mempool import Mempool
+from .consensus import ConsensusEngine, ProofOfWork, digest_proof_and_transactions
 from .smart_contract import SmartContract
-from typing import Callable, Dict
+from typing import Callable
+
+
+def verify_chain_segment(
+    segment: list[tuple[dict, bytes]], consensus: ConsensusEngine | int
+):
+    """
+    This function verifies every link of a contiguous run of blocks, each given as a (header, body bytes) pair.
+    It lives at module level so that it can be shipped to worker processes.
+    :param segment:
+    :param consensus: The consensus engine of the chain, or its proof of work difficulty
+    :return:
+    """
+    for (last_header, last_body), (new_header, new_body) in zip(segment, segment[1:]):
+        ACBlockchain.is_link_valid(
+            last_header, last_body, new_header, new_body, consensus
+        )
+    return True
 
 
 class ACBlockchain(BlockChain):
@@ -23,12 +47,38 @@ class ACBlockchain(BlockChain):
         difficulty: int,
         genesis_block: ACBlock = None,
         transactions: list[ACPolicy] = None,
+        mempool: Mempool = None,
+        retarget_interval: int | None = None,
+        block_interval_s: float = 10.0,
+        consensus: ConsensusEngine | None = None,
+        max_reorg_depth: int = 100,
     ):
+        """
+        :param difficulty: The number of leading hex zeros of the proofs, it gives the target of the blocks until the
+        first retarget
+        :param retarget_interval: How many blocks there are between two retargets, None to keep the target fixed
+        :param block_interval_s: The time between two blocks the retargets aim for
+        :param consensus: The engine that seals and verifies the blocks, proof of work with the parameters above by
+        default
+        :param max_reorg_depth: How many blocks below the tip a competing branch may fork off and still be considered
+        """
+        # Set before the genesis block is created, since it is sealed by the engine
+        self.consensus: ConsensusEngine = (
+            consensus
+            if consensus is not None
+            else ProofOfWork(difficulty, retarget_interval, block_interval_s)
+        )
         super().__init__(difficulty, genesis_block)
+        self._verified_height = 0
+        self._verified_block = self.chain[0]
+        self.tree = BlockTree(max_reorg_depth)
+        # The cumulative work of the active chain at each height, along with the block it was computed for
+        self._work: list[tuple[ACBlock, float]] = []
+        self.unconfirmed_transactions: Mempool = (
+            mempool if mempool is not None else Mempool()
+        )
         if transactions:
-            self.unconfirmed_transactions = transactions
-        else:
-            self.unconfirmed_transactions: list[ACPolicy] = []
+            self.add_new_transaction(transactions)
 
     def create_genesis_block(self):
         block_to_add = ACBlock(index=0, timestamp=datetime.now(), previous_hash="0")
@@ -44,7 +94,7 @@ class ACBlockchain(BlockChain):
         previous_proof: int,
         next_proof: int,
         index: int,
-        block_body: ACBlockBody,
+        block_body: ACBlockBody | bytes,
     ) -> bytes:
         """
         This function ties together two blocks by digesting the previous block's proof with the one
@@ -52,44 +102,59 @@ class ACBlockchain(BlockChain):
         :param previous_proof: The proof of the previous block
         :param next_proof: The proof of the current block
         :param index: The current index
-        :param block_body: The body of the block which contains the headers data
+        :param block_body: The body of the block which contains the headers data, or its canonical bytes
         :return:
         """
-        math_proof = str(previous_proof**2 - next_proof**2 + index).encode()
-        return math_proof + str(block_body.to_dict()).encode()
+        if isinstance(block_body, ACBlockBody):
+            block_body = block_body.to_bytes()
+        return digest_proof_and_transactions(
+            previous_proof, next_proof, index, block_body
+        )
 
     def proof_of_work(self, block_to_calculate_proof: ACBlock) -> None:
         """
-        This function tries different values of the proof and finds a suitable value that satisfies the difficulty
-        set by the blockchain. The nonce is then stored in the block
+        This function seals a block with the consensus engine of the chain. With proof of work, it tries different
+        values of the proof and finds a suitable value that satisfies the target of the block, the nonce is then
+        stored in the block. With proof of authority the block is signed instead.
         :return:
         """
-        current_index = len(self.chain)
-        if current_index == 0:
-            previous_proof = 0
-        else:
-            previous_proof = self.get_last_bloc.proof
-        while True:
-            digested_data = ACBlockchain.digest_proof_and_transactions(
-                previous_proof=previous_proof,
-                next_proof=block_to_calculate_proof.proof,
-                index=current_index,
-                block_body=block_to_calculate_proof.body,
-            )
-            computed_hash = hashlib.sha256(digested_data).hexdigest()
-            if computed_hash.startswith("0" * self.difficulty):
-                break
-            block_to_calculate_proof.proof += 1
+        # The body is committed to before sealing, since the seal covers the header
+        block_to_calculate_proof.commit_body()
+        self.consensus.seal(self, block_to_calculate_proof)
+
+    def next_target(self) -> int:
+        """
+        Returns the target of the next block to be mined, for chains sealed by proof of work
+        :return:
+        """
+        return self.consensus.target_at(
+            lambda height: self.chain[height].header, len(self.chain)
+        )
+
+    def verify_schedule(
+        self, header_at: Callable[[int], dict], start: int, end: int
+    ) -> None:
+        """
+        This function checks that the blocks from start to end, excluded, follow the rules of the consensus engine
+        that span more than a link, such as the retargeting schedule or the rotation of the authorities
+        :return:
+        """
+        self.consensus.verify_schedule(header_at, start, end)
 
     def add_new_transaction(self, data: list[ACPolicy]):
-        self.unconfirmed_transactions += data
+        for transaction in data:
+            self.unconfirmed_transactions.add(transaction)
 
-    def mine(self):
+    def prepare_block(
+        self, max_count: int | None = None, max_bytes: int | None = None
+    ) -> BlockTemplate:
         """
-        This function adds pending transactions to a block and figures
-        out the proof of work.
+        This function adds pending transactions to a new block, without figuring out its proof of work. At most
+        max_count transactions and max_bytes bytes of them are taken, the others are left for the next block.
         For the time being we do not allow contracts to call other contracts
-        :return:
+        :param max_count: The maximum number of transactions of the block, None for no limit
+        :param max_bytes: The maximum size of the transactions of the block, None for no limit
+        :return: The template of the block
         """
         # This is the case no transaction is available
         if not self.unconfirmed_transactions:
@@ -97,6 +162,9 @@ class ACBlockchain(BlockChain):
 
         # Find MAC Address
         MAC = self.find_contract("MAC")
+        transactions = select_transactions(
+            self.unconfirmed_transactions, max_count, max_bytes
+        )
         # We temporally create a new block
         to_add = ACBlock(
             index=self.get_last_bloc.index + 1,
@@ -105,46 +173,181 @@ class ACBlockchain(BlockChain):
             contract_header=deepcopy(self.get_last_bloc.body.contract_header),
             events=deepcopy(self.get_last_bloc.body.events),
         )
+        self.consensus.prepare(self, to_add)
         try:
             # For each transaction call the MAC and execute it
-            for transaction in self.unconfirmed_transactions:
+            for _, transaction in transactions:
                 # The MAC will also need to understand if the policy passed is an identity policy or a resource one
                 # ( Basically the smart contracts should look for a principal attribute/id )
                 MAC(transaction.model_dump(), to_add)
         except Exception:
             del to_add
             raise InvalidChain("Could not mine block due to a contract error")
-        self.proof_of_work(to_add)
-        self.chain.append(to_add)
-        self.unconfirmed_transactions = []
+        to_add.commit_body()
+        attempt = ACBlockchain.digest_proof_and_transactions(
+            previous_proof=self.get_last_bloc.proof,
+            next_proof=0,
+            index=to_add.index,
+            block_body=to_add.seal_data,
+        )
+        return BlockTemplate(
+            block=to_add,
+            tx_hashes=[tx_hash for tx_hash, _ in transactions],
+            tx_bytes=sum(
+                self.unconfirmed_transactions.size(tx_hash)
+                for tx_hash, _ in transactions
+            ),
+            left_out=len(self.unconfirmed_transactions) - len(transactions),
+            expected_hashes=self.consensus.expected_hashes(to_add.header),
+            attempt_bytes=len(attempt),
+        )
+
+    def commit_block(self, block: ACBlock, tx_hashes: list[str]) -> None:
+        """
+        This function appends a mined block to the chain and drops its transactions from the mem pool. The
+        transactions received while the proof of work was being computed are kept for the next block.
+        :param block:
+        :param tx_hashes: The hashes of the transactions the block holds
+        :return:
+        """
+        if block.previous_hash != self.get_last_bloc.compute_hash():
+            raise InvalidChain(
+                "The chain has changed while mining, the block has been discarded"
+            )
+        self.chain.append(block)
+        self.unconfirmed_transactions.remove_mined(tx_hashes)
+
+    def mine(self):
+        """
+        This function adds pending transactions to a block and figures
+        out the proof of work.
+        :return:
+        """
+        template = self.prepare_block()
+        self.proof_of_work(template.block)
+        self.commit_block(template.block, template.tx_hashes)
         return f"Block #{self.get_last_bloc.index} has been mined!"
 
-    def is_chain_valid(self) -> bool:
-        pass
+    def is_chain_valid(self, full: bool = False, workers: int = 1) -> bool:
+        """
+        This function checks each block's hash of the chain with the field 'previous_hash' of the block immediately next
+        to it, and that each proof respects the chain difficulty. If there is a mismatch, then it means that the
+        transactions have been altered and the chain is no longer valid.
+        The chain keeps a watermark of the height it has already verified, so that by default only the links appended
+        after it are checked. With full set the whole chain is verified again, split in chunks across worker processes
+        when more than one worker is requested.
+        :param full: Ignores the watermark and verifies the chain from the genesis block
+        :param workers: The number of processes used to verify the chain
+        :return:
+        """
+        start = 0 if full else self.verified_height
+        segment = [(block.header, block.body_bytes) for block in self.chain[start:]]
+        if workers > 1 and len(segment) > workers:
+            # Chunks overlap by one block, so that the link between two chunks is checked as well
+            chunk_size = -(-(len(segment) - 1) // workers)
+            chunks = [
+                segment[i : i + chunk_size + 1]
+                for i in range(0, len(segment) - 1, chunk_size)
+            ]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for _ in executor.map(
+                    verify_chain_segment, chunks, repeat(self.consensus)
+                ):
+                    pass
+        else:
+            verify_chain_segment(segment, self.consensus)
+        self.verify_schedule(
+            lambda height: self.chain[height].header, start + 1, len(self.chain)
+        )
+        self._mark_verified()
+        return True
+
+    @property
+    def verified_height(self) -> int:
+        """
+        Returns the height up to which the chain has been verified. If the block at the watermark has been replaced,
+        for instance after a block has been popped and a different one appended, the watermark is no longer trusted.
+        """
+        height = self._verified_height
+        if height < len(self.chain) and self.chain[height] is self._verified_block:
+            return height
+        return 0
+
+    def _mark_verified(self) -> None:
+        self._verified_height = len(self.chain) - 1
+        self._verified_block = self.get_last_bloc
 
     @staticmethod
     def is_block_valid(
-        last_block: ACBlock, new_block: ACBlock, chain_difficulty: int
+        last_block: ACBlock,
+        new_block: ACBlock,
+        chain_difficulty: int | ConsensusEngine,
     ) -> bool:
-        if new_block.index != (last_block.index + 1):
+        return ACBlockchain.is_link_valid(
+            last_block.header,
+            last_block.body_bytes,
+            new_block.header,
+            new_block.body_bytes,
+            chain_difficulty,
+        )
+
+    @staticmethod
+    def is_link_valid(
+        last_header: dict,
+        last_body: bytes | None,
+        new_header: dict,
+        new_body: bytes | None,
+        chain_difficulty: int | ConsensusEngine,
+    ) -> bool:
+        """
+        This function checks that a block, given by its header and the canonical bytes of its body, correctly
+        extends the previous one. The bodies can be left out for the blocks that carry the hash of their body, in
+        which case only the headers are checked, as light nodes do.
+        :param chain_difficulty: The consensus engine that checks the seal of the block, a bare difficulty stands for
+        proof of work with a fixed target
+        :return:
+        """
+        for header, body in ((last_header, last_body), (new_header, new_body)):
+            if body is None and "body_hash" not in header:
+                raise InvalidChain(
+                    f"Block #{header['index']} cannot be checked without its body"
+                )
+        if new_header["index"] != (last_header["index"] + 1):
             raise IndexError(
-                f"Current index is {last_block.index}, but the index passed is {new_block.index}"
+                f"Current index is {last_header['index']}, but the index passed is {new_header['index']}"
             )
-        if last_block.compute_hash() != new_block.previous_hash:
+        if (
+            ACBlock.hash_from_parts(last_header, last_body)
+            != new_header["previous_hash"]
+        ):
             raise InvalidChain(
                 "The passed hash is not consistent with the hash of the last block"
             )
-        digested_data = ACBlockchain.digest_proof_and_transactions(
-            next_proof=new_block.proof,
-            previous_proof=last_block.proof,
-            block_body=new_block.body,
-            index=new_block.index,
-        )
-        block_hash = hashlib.sha256(digested_data).hexdigest()
-        if not block_hash.startswith("0" * chain_difficulty):
-            raise InvalidChain("Block hash is not consistent with chain difficulty")
+        consensus = (
+            chain_difficulty
+            if isinstance(chain_difficulty, ConsensusEngine)
+            else ProofOfWork(chain_difficulty)
+        )
+        if new_body is not None:
+            ACBlockchain.verify_body(new_header, new_body)
+        consensus.verify_seal(last_header, last_body, new_header, new_body)
         return True
 
+    @staticmethod
+    def verify_body(header: dict, body_bytes: bytes) -> None:
+        """
+        Checks that the body of a block is the one its header commits to, raising InvalidChain otherwise
+        :return:
+        """
+        body_hash = header.get("body_hash", None)
+        if body_hash is not None and body_hash != ACBlock.body_digest(body_bytes):
+            raise InvalidChain("The body hash is not consistent with the block body")
+        merkle_root = header.get("merkle_root", None)
+        if merkle_root is not None and merkle_root != merkle.merkle_root(
+            [leaf for _, leaf in merkle.body_leaves(body_bytes)]
+        ):
+            raise InvalidChain("The merkle root is not consistent with the block body")
+
     def find_contract(
         self, contract_name: str
     ) -> Callable[[dict, ACBlock], bool | str | tuple]:
@@ -157,46 +360,340 @@ class ACBlockchain(BlockChain):
         else:
             return SmartContract.decode(to_return["contract_bytecode"].values[0])
 
-    def create_blockchain_from_request(self, data: list[dict]) -> bool:
-        resource_val = TypeAdapter(Dict[str, ACResourcePolicy])
-        identity_val = TypeAdapter(Dict[str, Dict[str, ACIdentityPolicy]])
+    def create_blockchain_from_request(
+        self,
+        data: list[dict],
+        lazy_bodies: bool = False,
+        min_work: float | None = None,
+        checkpoint: Checkpoint | None = None,
+    ) -> bool:
+        """
+        This function creates a new blockchain given a list of blocks. As each block is inserted, both the transactional
+        data it holds and the block itself are validated.
+        When lazy_bodies is set, the bodies of all the blocks but the last one are kept as canonical bytes: they are
+        verified against the proof of work, but they are parsed and validated only when they are first accessed.
+        :param data:
+        :param lazy_bodies:
+        :param min_work: When given, the chain is swapped only if it carries more work than this
+        :param checkpoint: A checkpoint whose signature has already been verified. The blocks up to its height are only
+        checked to be linked by their hashes up to the block the checkpoint vouches for, their seals are not verified,
+        and the policies they hold must match its digest before the chain is swapped.
+        :return:
+        """
         temp_chain = []
         for index, block_dict in enumerate(data):
-            # Check if the transaction are valid by calling the validator
-            if block_dict["body"]["resource_policies"]:
-                block_dict["body"]["resource_policies"] = resource_val.validate_python(
-                    block_dict["body"]["resource_policies"]
+            if lazy_bodies and index < len(data) - 1:
+                header = {key: val for key, val in block_dict.items() if key != "body"}
+                to_add = ACBlock(
+                    **header, raw_body=ACBlockBody.serialize(block_dict["body"])
                 )
-            if block_dict["body"]["identity_policies"]:
-                block_dict["body"]["identity_policies"] = identity_val.validate_python(
-                    block_dict["body"]["identity_policies"]
-                )
-            # If the validation is passed then we add the block
-            to_add = ACBlock(**block_dict)
+            else:
+                # Check if the transaction are valid by calling the validator
+                block_dict["body"] = ACBlockBody.from_dict(block_dict["body"])
+                # If the validation is passed then we add the block
+                to_add = ACBlock(**block_dict)
             if index == 0:
                 temp_chain.append(to_add)
                 continue
             last_block: ACBlock = temp_chain[-1]
+            if checkpoint is not None and index <= checkpoint.height:
+                if (
+                    to_add.index != index
+                    or last_block.compute_hash() != to_add.previous_hash
+                ):
+                    raise InvalidChain(
+                        f"Block #{index} is not linked to the block before it"
+                    )
+                if to_add.body_hash is not None:
+                    # The hash of the block no longer covers the body itself
+                    ACBlockchain.verify_body(
+                        {"body_hash": to_add.body_hash}, to_add.body_bytes
+                    )
+                temp_chain.append(to_add)
+                continue
+            self.verify_schedule(
+                lambda height: (
+                    temp_chain[height] if height < index else to_add
+                ).header,
+                index,
+                index + 1,
+            )
             if ACBlockchain.is_block_valid(
                 last_block=last_block,
                 new_block=to_add,
-                chain_difficulty=self.difficulty,
+                chain_difficulty=self.consensus,
             ):
                 temp_chain.append(to_add)
             else:
                 return False
+        if checkpoint is not None and (
+            checkpoint.height >= len(temp_chain)
+            or temp_chain[checkpoint.height].compute_hash() != checkpoint.block_hash
+        ):
+            raise InvalidChain("The chain does not match the checkpoint")
+        if checkpoint is not None:
+            policies = {}
+            for block in temp_chain[: checkpoint.height + 1]:
+                ACBlockchain.apply_resource_policy_delta(
+                    block.policies.resource_policies, policies
+                )
+            if policy_state_digest(policies) != checkpoint.policy_digest:
+                raise InvalidChain(
+                    "The policies of the chain do not match the ones of the checkpoint"
+                )
+        if min_work is not None and (
+            sum(self.consensus.work(block.header) for block in temp_chain[1:])
+            <= min_work
+        ):
+            return False
         # Finally we swap
         self.chain = temp_chain
+        self.tree = BlockTree(self.tree.max_depth)
+        self._mark_verified()
         return True
 
+    def cumulative_work(self, height: int | None = None) -> float:
+        """
+        Returns the work of the active chain from the genesis block up to the given height, the tip by default.
+        The sums are cached along with the blocks they were computed for, so that only the heights whose block has
+        changed since the last call are summed again.
+        :param height:
+        :return:
+        """
+        if height is None:
+            height = len(self.chain) - 1
+        valid = 0
+        while (
+            valid < min(len(self._work), len(self.chain))
+            and self._work[valid][0] is self.chain[valid]
+        ):
+            valid += 1
+        del self._work[valid:]
+        for current in range(len(self._work), height + 1):
+            block = self.chain[current]
+            # The genesis block is not sealed, so it carries no work
+            work = self.consensus.work(block.header) if current > 0 else 0.0
+            previous = self._work[-1][1] if self._work else 0.0
+            self._work.append((block, previous + work))
+        return self._work[height][1]
+
+    def fork_point(self, headers: list[dict], start: int) -> int | None:
+        """
+        This function finds the highest height at which a chain, given by its headers from start on, agrees with the
+        active chain. Since each header commits to the hash of the previous block, two chains that agree at a height
+        agree at all the heights below it, so the fork point is found by bisection hashing only a few blocks.
+        :param headers: The headers of the other chain, from height start on
+        :param start: The height of the first header, at least 1
+        :return: The fork height, or None if the chains do not agree even at start - 1
+        """
+
+        def agree(height: int) -> bool:
+            return (
+                headers[height + 1 - start]["previous_hash"]
+                == self.chain[height].compute_hash()
+            )
+
+        low = start - 1
+        high = min(len(self.chain) - 1, start + len(headers) - 2)
+        if not headers or high < low or not agree(low):
+            return None
+        while low < high:
+            middle = (low + high + 1) // 2
+            if agree(middle):
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def branch_work(self, headers: list[dict], start: int, fork: int) -> float:
+        """
+        Returns the cumulative work of a chain that forks off the active one at the given height
+        :param headers: The headers of the other chain, from height start on
+        :param start:
+        :param fork:
+        :return:
+        """
+        return self.cumulative_work(fork) + sum(
+            self.consensus.work(header) for header in headers[fork + 1 - start :]
+        )
+
+    def find_block(self, block_hash: str, height: int) -> ACBlock | None:
+        """
+        Returns the block with the given hash, whether it is on a competing branch or on the active chain
+        :param block_hash:
+        :param height: The height the block is expected at
+        :return:
+        """
+        block = self.tree.get(block_hash)
+        if block is not None:
+            return block
+        if 0 <= height < len(self.chain):
+            block = self.chain[height]
+            if block.compute_hash() == block_hash:
+                return block
+        return None
+
     def add_block(self, new_block: ACBlock) -> bool:
+        """
+        This function adds a block extending either the tip of the active chain or a competing branch, as long as
+        the branch forks off at most max_reorg_depth blocks below the tip. When a competing branch ends up carrying
+        more work than the active chain, the chain is reorganized to it.
+        :param new_block:
+        :return:
+        """
         last_block = self.get_last_bloc
-        if ACBlockchain.is_block_valid(last_block, new_block, self.difficulty):
+        if new_block.previous_hash in self.tree or new_block.index < len(self.chain):
+            parent = self.find_block(new_block.previous_hash, new_block.index - 1)
+            if parent is not None:
+                return self._add_to_tree(new_block, parent)
+        self.verify_schedule(
+            lambda height: (
+                new_block if height == len(self.chain) else self.chain[height]
+            ).header,
+            len(self.chain),
+            len(self.chain) + 1,
+        )
+        if ACBlockchain.is_block_valid(last_block, new_block, self.consensus):
             self.chain.append(new_block)
             return True
         else:
             return False
 
+    def _add_to_tree(self, new_block: ACBlock, parent: ACBlock) -> bool:
+        new_hash = new_block.compute_hash()
+        if (
+            new_hash in self.tree
+            or self.find_block(new_hash, new_block.index) is not None
+        ):
+            raise InvalidChain(f"Block #{new_block.index} is already known")
+        branch = list(reversed(list(self.tree.ancestors(new_block.previous_hash))))
+        fork = branch[0][1].index - 1 if branch else parent.index
+        if branch and (
+            fork >= len(self.chain)
+            or self.chain[fork].compute_hash() != branch[0][1].previous_hash
+        ):
+            raise InvalidChain(
+                "The branch of the block does not fork off the chain anymore"
+            )
+        if fork < len(self.chain) - 1 - self.tree.max_depth:
+            raise InvalidChain(
+                f"The block forks off the chain more than {self.tree.max_depth} blocks below its tip"
+            )
+        branch_blocks = [block for _, block in branch] + [new_block]
+        self.verify_schedule(
+            lambda height: (
+                branch_blocks[height - fork - 1]
+                if height > fork
+                else self.chain[height]
+            ).header,
+            new_block.index,
+            new_block.index + 1,
+        )
+        ACBlockchain.is_block_valid(parent, new_block, self.consensus)
+        parent_work = (
+            self.tree.work[new_block.previous_hash]
+            if new_block.previous_hash in self.tree
+            else self.cumulative_work(fork)
+        )
+        work = parent_work + self.consensus.work(new_block.header)
+        self.tree.add(new_hash, new_block, work)
+        if work > self.cumulative_work():
+            self.reorganize(fork, branch + [(new_hash, new_block)])
+        return True
+
+    def reorganize(self, fork: int, branch: list[tuple[str, ACBlock]]) -> list[ACBlock]:
+        """
+        This function makes a competing branch the active chain. Only the blocks past the fork height are swapped:
+        the ones of the active chain move to the tree, and their policies go back to the mem pool unless the new
+        branch commits them as well.
+        :param fork: The height of the last block the branch shares with the active chain
+        :param branch: The hashes and the blocks of the branch past the fork, in chain order
+        :return: The blocks that have left the active chain
+        """
+        removed = self.chain[fork + 1 :]
+        for height, block in enumerate(removed, start=fork + 1):
+            self.tree.add(block.compute_hash(), block, self.cumulative_work(height))
+        for block_hash, _ in branch:
+            self.tree.discard(block_hash)
+        if self.verified_height > fork:
+            self._verified_height = fork
+            self._verified_block = self.chain[fork]
+        self.chain[fork + 1 :] = [block for _, block in branch]
+        committed = set()
+        for _, block in branch:
+            self.remove_confirmed_transactions(block)
+            committed.update(self._block_policy_hashes(block))
+        for block in removed:
+            for tx_hash, policy in self._block_policies(block):
+                if tx_hash in committed:
+                    continue
+                try:
+                    self.unconfirmed_transactions.add(policy)
+                except MempoolFull:
+                    # The policies of the abandoned branch are dropped rather than the ones waiting in the pool
+                    pass
+        self.tree.prune(self.get_last_bloc.index)
+        return removed
+
+    def restore_tip(self, tip: ACBlock, discarded: ACBlock) -> None:
+        """
+        This function brings back the active chain that ended at the given tip, after a block that was added on top of
+        it, or that reorganized the chain to its branch, has been found to invalidate the chain
+        :param tip: The tip of the chain before the block was added
+        :param discarded: The block, which is dropped from the chain and from the tree
+        :return:
+        """
+        if tip.index < len(self.chain) and self.chain[tip.index] is tip:
+            del self.chain[tip.index + 1 :]
+        else:
+            # The chain has been reorganized, the branch of the old tip is in the tree
+            branch = list(reversed(list(self.tree.ancestors(tip.compute_hash()))))
+            self.reorganize(branch[0][1].index - 1, branch)
+        self.tree.discard(discarded.compute_hash())
+
+    @staticmethod
+    def _block_policies(block: ACBlock) -> list[tuple[str, ACPolicy]]:
+        policies = list(block.policies.resource_policies.values())
+        for user_policies in block.policies.identity_policies.values():
+            policies += list(user_policies.values())
+        return [(Mempool.transaction_hash(policy), policy) for policy in policies]
+
+    @staticmethod
+    def _block_policy_hashes(block: ACBlock) -> set[str]:
+        return {tx_hash for tx_hash, _ in ACBlockchain._block_policies(block)}
+
+    def add_branch(self, data: list[dict], lazy_bodies: bool = False) -> bool:
+        """
+        This function adds the blocks of a competing branch, given in chain order, reorganizing the chain if the
+        branch carries more work than it
+        :param data: The blocks past the fork height, as dicts
+        :param lazy_bodies: Keeps the bodies of all the blocks but the last one as canonical bytes
+        :return: Whether the tip of the chain has changed
+        """
+        tip = self.get_last_bloc
+        for index, block_dict in enumerate(data):
+            if lazy_bodies and index < len(data) - 1:
+                header = {key: val for key, val in block_dict.items() if key != "body"}
+                to_add = ACBlock(
+                    **header, raw_body=ACBlockBody.serialize(block_dict["body"])
+                )
+            else:
+                block_dict["body"] = ACBlockBody.from_dict(block_dict["body"])
+                to_add = ACBlock(**block_dict)
+            self.add_block(to_add)
+        return self.get_last_bloc is not tip
+
+    def remove_confirmed_transactions(self, block: ACBlock) -> int:
+        """
+        This function drops from the mem pool the policies that have been committed by the given block
+        :param block:
+        :return:
+        """
+        committed = list(block.policies.resource_policies.values())
+        for policies in block.policies.identity_policies.values():
+            committed += list(policies.values())
+        return self.unconfirmed_transactions.remove_committed(committed)
+
     @staticmethod
     def apply_resource_policy_delta(
         block_resource_policies: dict[str, ACResourcePolicy],
@@ -204,10 +701,18 @@ class ACBlockchain(BlockChain):
     ):
         for block_policy_id, block_policy in block_resource_policies.items():
             if block_policy.action == "add":
-                mem_policies.update({block_policy_id: block_policy})
+                # The cache gets a copy, since updates change its policies in place and the blocks must not change
+                mem_policies.update(
+                    {block_policy_id: block_policy.model_copy(deep=True)}
+                )
             elif block_policy.action == "remove":
                 mem_policies.pop(block_policy_id)
             elif block_policy.action == "update":
+                # The policy is changed on a copy, since the snapshots published to the readers share the policies
+                # of the cache and must never see them change
+                mem_policies[block_policy_id] = mem_policies[
+                    block_policy_id
+                ].model_copy(deep=True)
                 # This is the case that some statements have been removed/added/updated
                 for (
                     block_statement_sid,
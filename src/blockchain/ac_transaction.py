@@ -23,7 +23,7 @@ class ACIdentityStatement(BaseModel):
 
 
 class ACResourceStatement(ACIdentityStatement):
-    principal: str = ""
+    principal: list[str] | str = ""
 
 
 class ACResourcePolicy(BaseModel, ACPolicy):
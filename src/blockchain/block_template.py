@@ -0,0 +1,76 @@
+"""This module contains the block template, which is the block a miner is about to seal along with the transactions it
+has picked from the mem pool and how much work sealing it is expected to take.
+"""
+
+from __future__ import annotations
+
+from pydantic import BaseModel
+
+from .ac_block import ACBlock
+from .mempool import Mempool
+
+
+class BlockTemplate:
+    """
+    A block waiting for its proof of work. On average a proof is found after expected_hashes attempts, each of them
+    hashing the proof digest together with the data the seal covers, which is the header once the block commits to
+    its body by hash: expected_hashed_bytes is what it costs to seal the block.
+    """
+
+    def __init__(
+        self,
+        block: ACBlock,
+        tx_hashes: list[str],
+        tx_bytes: int,
+        left_out: int,
+        expected_hashes: float,
+        attempt_bytes: int,
+    ):
+        self.block = block
+        self.tx_hashes = tx_hashes
+        self.tx_bytes = tx_bytes
+        self.left_out = left_out
+        self.expected_hashes = expected_hashes
+        self.attempt_bytes = attempt_bytes
+
+    @property
+    def expected_hashed_bytes(self) -> float:
+        return self.expected_hashes * self.attempt_bytes
+
+    def to_dict(self) -> dict:
+        return {
+            "index": self.block.index,
+            "transactions": len(self.tx_hashes),
+            "transaction_bytes": self.tx_bytes,
+            "left_out": self.left_out,
+            "attempt_bytes": self.attempt_bytes,
+            "expected_hashes": self.expected_hashes,
+            "expected_hashed_bytes": self.expected_hashed_bytes,
+        }
+
+
+def select_transactions(
+    mempool: Mempool, max_count: int | None = None, max_bytes: int | None = None
+) -> list[tuple[str, BaseModel]]:
+    """
+    This function picks the transactions of the next block, the oldest first so that no transaction waits longer than
+    the ones that arrived after it. The mem pool keeps them in their order of arrival, so they are taken as they are
+    stored rather than sorted each time. A transaction that does not fit in the byte budget is skipped in favour of
+    smaller ones, but the oldest one is always taken, so that a transaction larger than the budget is not left behind
+    forever.
+    :param mempool:
+    :param max_count: The maximum number of transactions, None for no limit
+    :param max_bytes: The maximum size of the transactions, None for no limit
+    :return: The hashes and the transactions picked
+    """
+    selected = []
+    total_bytes = 0
+    for tx_hash, transaction in mempool.items():
+        if max_count is not None and len(selected) >= max_count:
+            break
+        size = mempool.size(tx_hash)
+        if selected and max_bytes is not None and total_bytes + size > max_bytes:
+            continue
+        selected.append((tx_hash, transaction))
+        total_bytes += size
+    return selected
@@ -0,0 +1,83 @@
+"""This module contains the tree of the blocks that compete with the active chain. The active chain is kept by the
+ACBlockchain as a list, while the blocks of the other branches are kept here along with the cumulative work of the
+branch up to each of them, so that a branch can become the active one as soon as it carries more work.
+"""
+
+from __future__ import annotations
+
+from typing import Iterator
+
+from .ac_block import ACBlock
+
+
+class BlockTree:
+    """
+    The blocks off the active chain, by hash. A branch is walked from its tip through the previous hashes until a
+    block of the active chain is reached. Blocks more than max_depth blocks below the tip of the active chain are
+    dropped, since no reorganization that deep is accepted.
+    """
+
+    def __init__(self, max_depth: int = 100):
+        self.max_depth = max_depth
+        self.blocks: dict[str, ACBlock] = {}
+        self.work: dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    def __contains__(self, block_hash: str) -> bool:
+        return block_hash in self.blocks
+
+    def get(self, block_hash: str) -> ACBlock | None:
+        return self.blocks.get(block_hash, None)
+
+    def add(self, block_hash: str, block: ACBlock, work: float) -> None:
+        """
+        Stores a block off the active chain
+        :param block_hash:
+        :param block:
+        :param work: The cumulative work of the branch from the genesis block up to this block
+        :return:
+        """
+        self.blocks[block_hash] = block
+        self.work[block_hash] = work
+
+    def discard(self, block_hash: str) -> None:
+        self.blocks.pop(block_hash, None)
+        self.work.pop(block_hash, None)
+
+    def ancestors(self, block_hash: str) -> Iterator[tuple[str, ACBlock]]:
+        """
+        Yields the block with the given hash and then its ancestors, as long as they are in the tree
+        :param block_hash:
+        :return:
+        """
+        while block_hash in self.blocks:
+            block = self.blocks[block_hash]
+            yield block_hash, block
+            block_hash = block.previous_hash
+
+    def prune(self, tip_height: int) -> int:
+        """
+        Drops the blocks too deep below the tip of the active chain to ever be reorganized to
+        :param tip_height:
+        :return: How many blocks have been dropped
+        """
+        stale = [
+            block_hash
+            for block_hash, block in self.blocks.items()
+            if block.index <= tip_height - self.max_depth
+        ]
+        for block_hash in stale:
+            self.discard(block_hash)
+        return len(stale)
+
+    def stats(self) -> dict:
+        return {
+            "blocks": len(self.blocks),
+            "max_depth": self.max_depth,
+            "tips": len(
+                set(self.blocks)
+                - {block.previous_hash for block in self.blocks.values()}
+            ),
+        }
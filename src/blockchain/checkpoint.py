@@ -0,0 +1,108 @@
+"""This module contains the checkpoints signed by the publishers. A checkpoint vouches for the block at a given height,
+by its hash, and for the state of the access policies once that block has been applied, by its digest. A node that
+trusts the key of the publisher can then import the chain below the checkpoint checking only that the blocks are
+linked by their hashes, and verify in full only the blocks above it.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Callable
+
+from pydantic import BaseModel
+
+from .errors import InvalidChain
+
+
+def policy_state_digest(mem_policies: dict[str, BaseModel]) -> str:
+    """
+    Returns the digest of a cache of policies, which does not depend on the order the policies were inserted in
+    :param mem_policies:
+    :return:
+    """
+    state = {
+        policy_id: policy.model_dump(mode="json")
+        for policy_id, policy in mem_policies.items()
+    }
+    return hashlib.sha256(json.dumps(state, sort_keys=True).encode()).hexdigest()
+
+
+class Checkpoint:
+    def __init__(
+        self,
+        height: int,
+        block_hash: str,
+        policy_digest: str,
+        signer: str,
+        signature: str | None = None,
+    ):
+        """
+        :param height: The height of the block the checkpoint vouches for
+        :param block_hash: The hash of that block
+        :param policy_digest: The digest of the policies once that block has been applied
+        :param signer: The hex encoded public key of the publisher
+        :param signature: The hex encoded signature of the publisher
+        """
+        self.height = height
+        self.block_hash = block_hash
+        self.policy_digest = policy_digest
+        self.signer = signer
+        self.signature = signature
+
+    @property
+    def message(self) -> bytes:
+        return json.dumps(
+            {
+                "height": self.height,
+                "block_hash": self.block_hash,
+                "policy_digest": self.policy_digest,
+                "signer": self.signer,
+            }
+        ).encode()
+
+    @classmethod
+    def create(
+        cls,
+        height: int,
+        block_hash: str,
+        policy_digest: str,
+        signer: str,
+        sign: Callable[[bytes], bytes],
+    ) -> Checkpoint:
+        checkpoint = cls(height, block_hash, policy_digest, signer)
+        checkpoint.signature = sign(checkpoint.message).hex()
+        return checkpoint
+
+    def verify(
+        self, trusted: list[str], verify: Callable[[bytes, bytes, bytes], bool]
+    ) -> None:
+        """
+        Checks that the checkpoint has been signed by one of the trusted publishers, raising InvalidChain otherwise
+        :param trusted: The hex encoded public keys of the trusted publishers
+        :param verify: Verifies a signature given the message, the signature and the public key of the signer
+        :return:
+        """
+        if self.signer not in trusted or self.signature is None:
+            raise InvalidChain("The checkpoint is not signed by a trusted publisher")
+        try:
+            valid = verify(
+                self.message, bytes.fromhex(self.signature), bytes.fromhex(self.signer)
+            )
+        except Exception:
+            valid = False
+        if not valid:
+            raise InvalidChain("The checkpoint signature is not valid")
+
+    def to_dict(self) -> dict:
+        return {
+            "height": self.height,
+            "block_hash": self.block_hash,
+            "policy_digest": self.policy_digest,
+            "signer": self.signer,
+            "signature": self.signature,
+        }
+
+    @classmethod
+    def from_dict(cls, checkpoint_dict: dict) -> Checkpoint:
+        return cls(**checkpoint_dict)
@@ -0,0 +1,149 @@
+"""This module contains the compact representation of a block that is used to announce it to peers. Since peers already
+hold most of the block's policies in their mem pools thanks to gossip, a compact block carries only the header and the
+short ids of the policies, which the receiver uses to rebuild the body from its own mem pool.
+"""
+
+from __future__ import annotations
+
+from .ac_block import ACBlock, ACBlockBody
+from .errors import InvalidChain
+from .mempool import Mempool
+
+
+def _table_delta(parent_table: dict, table: dict) -> dict:
+    """
+    The contract header and the events tables of a block usually are the ones of its parent plus some appended rows,
+    in that case only the appended rows are shipped
+    :param parent_table: The dict representation of the parent's table
+    :param table: The dict representation of the block's table
+    :return:
+    """
+    if list(parent_table) != list(table):
+        return {"full": table}
+    appended = {}
+    for column, rows in table.items():
+        parent_rows = parent_table[column]
+        if list(rows.items())[: len(parent_rows)] != list(parent_rows.items()):
+            return {"full": table}
+        appended[column] = dict(list(rows.items())[len(parent_rows) :])
+    return {"appended": appended}
+
+
+def _apply_table_delta(parent_table: dict, delta: dict) -> dict:
+    if "full" in delta:
+        return delta["full"]
+    return {
+        column: {**rows, **delta["appended"].get(column, {})}
+        for column, rows in parent_table.items()
+    }
+
+
+def short_id(policy) -> str:
+    return Mempool.short_id(Mempool.transaction_hash(policy))
+
+
+def to_compact(block: ACBlock, parent: ACBlock) -> dict:
+    """
+    This function builds the compact announcement of a block, the parent is needed to ship only the rows of the
+    tables that the block has appended
+    :param block:
+    :param parent:
+    :return:
+    """
+    body = block.to_dict()["body"]
+    parent_body = parent.to_dict()["body"]
+    return {
+        **block.header,
+        "hash": block.compute_hash(),
+        "resource_policies": [
+            [policy_key, short_id(policy)]
+            for policy_key, policy in body["resource_policies"].items()
+        ],
+        "identity_policies": [
+            [user_id, policy_key, short_id(policy)]
+            for user_id, policies in body["identity_policies"].items()
+            for policy_key, policy in policies.items()
+        ],
+        "contract_header": _table_delta(
+            parent_body["contract_header"], body["contract_header"]
+        ),
+        "events": _table_delta(parent_body["events"], body["events"]),
+        "transactions": {},
+    }
+
+
+def find_transactions(block: ACBlock, short_ids: list[str]) -> dict[str, dict]:
+    """
+    This function returns the policies of a block whose short ids have been requested by a peer
+    :param block:
+    :param short_ids:
+    :return:
+    """
+    body = block.to_dict()["body"]
+    policies = list(body["resource_policies"].values())
+    for user_policies in body["identity_policies"].values():
+        policies += list(user_policies.values())
+    requested = set(short_ids)
+    return {
+        short_id(policy): policy for policy in policies if short_id(policy) in requested
+    }
+
+
+def reconstruct(
+    compact: dict, mempool: Mempool, parent: ACBlock
+) -> tuple[ACBlock | None, list[str]]:
+    """
+    This function rebuilds a block from its compact announcement, taking the policies from the mem pool or from the
+    transactions shipped along with the announcement
+    :param compact:
+    :param mempool:
+    :param parent:
+    :return: The block and an empty list, or None and the short ids of the policies that are missing
+    """
+    missing = []
+
+    def lookup(policy_short_id: str) -> dict | None:
+        policy = compact["transactions"].get(policy_short_id, None)
+        if policy is not None:
+            return policy
+        policy = mempool.get_by_short_id(policy_short_id)
+        if policy is None:
+            missing.append(policy_short_id)
+            return None
+        return policy.model_dump()
+
+    resource_policies = {
+        policy_key: lookup(policy_short_id)
+        for policy_key, policy_short_id in compact["resource_policies"]
+    }
+    identity_policies = {}
+    for user_id, policy_key, policy_short_id in compact["identity_policies"]:
+        identity_policies.setdefault(user_id, {})[policy_key] = lookup(policy_short_id)
+    if missing:
+        return None, missing
+    parent_body = parent.to_dict()["body"]
+    body = {
+        "resource_policies": resource_policies,
+        "contract_header": _apply_table_delta(
+            parent_body["contract_header"], compact["contract_header"]
+        ),
+        "events": _apply_table_delta(parent_body["events"], compact["events"]),
+        "identity_policies": identity_policies,
+    }
+    block = ACBlock(
+        index=compact["index"],
+        timestamp=compact["timestamp"],
+        previous_hash=compact["previous_hash"],
+        proof=compact["proof"],
+        raw_body=ACBlockBody.serialize(body),
+        target=compact.get("target", None),
+        signer=compact.get("signer", None),
+        merkle_root=compact.get("merkle_root", None),
+        body_hash=compact.get("body_hash", None),
+        signature=compact.get("signature", None),
+    )
+    if block.compute_hash() != compact["hash"]:
+        raise InvalidChain(
+            "The block rebuilt from the compact announcement does not match its hash"
+        )
+    return block, []
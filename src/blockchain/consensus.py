@@ -0,0 +1,343 @@
+"""This module contains the consensus engines an ACBlockchain delegates to: how a new block is sealed, and how the seal
+of a block received from a peer is verified. Proof of work makes sealing expensive for everyone, while proof of
+authority lets a permissioned set of publishers sign the blocks, so that the block time is bound by the network and
+not by the CPU.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import time
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Callable
+
+from .ac_block import ACBlock
+from .errors import InvalidChain
+from .target import (
+    block_time,
+    difficulty_to_target,
+    expected_hashes,
+    header_target,
+    median_time_past,
+    meets_target,
+    next_target,
+    target_to_bytes,
+)
+
+if TYPE_CHECKING:
+    from .ac_blockchain import ACBlockchain
+
+
+def digest_proof_and_transactions(
+    previous_proof: int, next_proof: int, index: int, block_body: bytes
+) -> bytes:
+    """
+    This function ties together two blocks by digesting the previous block's proof with the one
+    of the current one, united with his data
+    :param previous_proof: The proof of the previous block
+    :param next_proof: The proof of the current block
+    :param index: The current index
+    :param block_body: The canonical bytes of the body of the block
+    :return:
+    """
+    math_proof = str(previous_proof**2 - next_proof**2 + index).encode()
+    return math_proof + block_body
+
+
+class ConsensusEngine(ABC):
+    """
+    The engines are shipped to the worker processes that verify a chain in parallel, so they must be picklable
+    """
+
+    name: str
+
+    def prepare(self, chain: ACBlockchain, block: ACBlock) -> None:
+        """
+        Fills in the fields of the header of a block that the engine needs to seal it
+        :param chain:
+        :param block:
+        :return:
+        """
+
+    @abstractmethod
+    def seal(self, chain: ACBlockchain, block: ACBlock) -> None:
+        """
+        Seals a block that is about to be appended to the chain
+        :param chain:
+        :param block:
+        :return:
+        """
+
+    @abstractmethod
+    def verify_seal(
+        self,
+        last_header: dict,
+        last_body: bytes | None,
+        new_header: dict,
+        new_body: bytes | None,
+    ) -> None:
+        """
+        Checks the seal of a block given the block before it, raising InvalidChain if it is not valid. The bodies are
+        None when only the headers are known, which is enough for the blocks that carry the hash of their body.
+        :return:
+        """
+
+    def verify_schedule(
+        self, header_at: Callable[[int], dict], start: int, end: int
+    ) -> None:
+        """
+        Checks the rules that span more than a link, for the blocks from start to end excluded, raising InvalidChain
+        if a block breaks them
+        :param header_at: Returns the header of the block at a given height
+        :param start:
+        :param end:
+        :return:
+        """
+
+    @abstractmethod
+    def expected_hashes(self, header: dict) -> float:
+        """
+        Returns how many hashes sealing the block is expected to take
+        :param header:
+        :return:
+        """
+
+    def work(self, header: dict) -> float:
+        """
+        Returns the work a block adds to its chain, the fork choice picks the chain with the most cumulative work
+        :param header:
+        :return:
+        """
+        return self.expected_hashes(header)
+
+    def to_dict(self) -> dict:
+        return {"name": self.name}
+
+
+class ProofOfWork(ConsensusEngine):
+    """
+    A block is sealed by finding a proof whose digest meets the target of the block, see target.py for how the
+    target is retargeted.
+    When the target is retargeted the timestamps of the blocks decide it, so they are checked as well: a block must
+    be stamped later than the median time of the blocks before it and no more than max_drift_s ahead of the clock of
+    the node, otherwise a miner could date its blocks back or forth to ease the target of the next interval.
+    """
+
+    name = "pow"
+
+    def __init__(
+        self,
+        difficulty: int,
+        retarget_interval: int | None = None,
+        block_interval_s: float = 10.0,
+        max_drift_s: float = 120.0,
+    ):
+        self.difficulty = difficulty
+        self.retarget_interval = retarget_interval
+        self.block_interval_s = block_interval_s
+        self.max_drift_s = max_drift_s
+
+    @property
+    def default_target(self) -> int:
+        return difficulty_to_target(self.difficulty)
+
+    def target_at(self, header_at: Callable[[int], dict], height: int) -> int:
+        """
+        Returns the target the block at the given height must carry
+        :param header_at: Returns the header of the block at a given height
+        :param height:
+        :return:
+        """
+        return next_target(
+            header_at,
+            height,
+            self.default_target,
+            self.retarget_interval,
+            self.block_interval_s,
+        )
+
+    def prepare(self, chain: ACBlockchain, block: ACBlock) -> None:
+        block.target = self.target_at(
+            lambda height: chain.chain[height].header, len(chain.chain)
+        )
+
+    def seal(self, chain: ACBlockchain, block: ACBlock) -> None:
+        current_index = len(chain.chain)
+        if current_index == 0:
+            previous_proof = 0
+        else:
+            previous_proof = chain.get_last_bloc.proof
+        # The data does not change while searching for the proof, so it is serialized only once
+        seal_data = block.seal_data
+        target = target_to_bytes(header_target(block.header, self.default_target))
+        while True:
+            digested_data = digest_proof_and_transactions(
+                previous_proof=previous_proof,
+                next_proof=block.proof,
+                index=current_index,
+                block_body=seal_data,
+            )
+            if hashlib.sha256(digested_data).digest() <= target:
+                break
+            block.proof += 1
+
+    def verify_seal(
+        self, last_header: dict, last_body: bytes, new_header: dict, new_body: bytes
+    ) -> None:
+        digested_data = digest_proof_and_transactions(
+            next_proof=new_header["proof"],
+            previous_proof=last_header["proof"],
+            block_body=ACBlock.seal_bytes(new_header, new_body),
+            index=new_header["index"],
+        )
+        target = header_target(new_header, self.default_target)
+        if not meets_target(hashlib.sha256(digested_data).digest(), target):
+            raise InvalidChain("Block hash is not consistent with the block target")
+
+    def verify_schedule(
+        self, header_at: Callable[[int], dict], start: int, end: int
+    ) -> None:
+        now = time.time()
+        for height in range(max(1, start), end):
+            if self.retarget_interval:
+                self.verify_timestamp(header_at, height, now)
+            # No block can be mined with an easier target than the one it should have
+            if header_target(header_at(height), self.default_target) != self.target_at(
+                header_at, height
+            ):
+                raise InvalidChain(
+                    f"Block #{height} does not carry the target of the retargeting schedule"
+                )
+
+    def verify_timestamp(
+        self, header_at: Callable[[int], dict], height: int, now: float
+    ) -> None:
+        timestamp = block_time(header_at(height)["timestamp"])
+        if timestamp is None:
+            raise InvalidChain(f"Block #{height} does not carry a readable timestamp")
+        median = median_time_past(header_at, height)
+        if median is not None and timestamp <= median:
+            raise InvalidChain(
+                f"Block #{height} is stamped before the median time of the blocks before it"
+            )
+        if timestamp > now + self.max_drift_s:
+            raise InvalidChain(f"Block #{height} is stamped too far in the future")
+
+    def expected_hashes(self, header: dict) -> float:
+        return expected_hashes(header_target(header, self.default_target))
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "difficulty": self.difficulty,
+            "retarget_interval": self.retarget_interval,
+            "block_interval_s": self.block_interval_s,
+            "max_drift_s": self.max_drift_s,
+        }
+
+
+class ProofOfAuthority(ConsensusEngine):
+    """
+    A block is sealed by the signature of one of the authorities, identified by their public keys. The authorities
+    take turns: the block at height h is expected from authorities[h % n], but any authority can seal it as long as
+    it has not sealed one of the last n // 2 blocks, so that the chain goes on when an authority is down while no
+    single authority can take it over.
+    The signing and verification functions are passed in, so that the keys stay where the node keeps them.
+    """
+
+    name = "poa"
+
+    def __init__(
+        self,
+        authorities: list[str],
+        verify: Callable[[bytes, bytes, bytes], bool],
+        signer: str | None = None,
+        sign: Callable[[bytes], bytes] | None = None,
+    ):
+        """
+        :param authorities: The hex encoded public keys of the authorities
+        :param verify: Verifies a signature given the message, the signature and the public key of the signer
+        :param signer: The hex encoded public key of this node, if it is an authority
+        :param sign: Signs a message with the private key of this node
+        """
+        self.authorities = list(authorities)
+        self.verify = verify
+        self.signer = signer
+        self.sign = sign
+
+    def in_turn(self, height: int) -> str:
+        return self.authorities[height % len(self.authorities)]
+
+    @staticmethod
+    def signed_message(header: dict, body: bytes | None) -> bytes:
+        unsigned = {key: value for key, value in header.items() if key != "signature"}
+        return ACBlock.hash_from_parts(unsigned, body).encode()
+
+    def prepare(self, chain: ACBlockchain, block: ACBlock) -> None:
+        if self.signer not in self.authorities:
+            raise InvalidChain("This node is not one of the authorities of the chain")
+        block.signer = self.signer
+
+    def seal(self, chain: ACBlockchain, block: ACBlock) -> None:
+        if not chain.chain:
+            # The genesis block is never checked against a previous one, so every node can create it unsigned
+            return
+        if self.sign is None:
+            raise InvalidChain("This node cannot sign blocks")
+        block.signer = self.signer
+        block.signature = None
+        block.signature = self.sign(
+            ProofOfAuthority.signed_message(block.header, block.body_bytes)
+        ).hex()
+
+    def verify_seal(
+        self, last_header: dict, last_body: bytes, new_header: dict, new_body: bytes
+    ) -> None:
+        signer = new_header.get("signer", None)
+        signature = new_header.get("signature", None)
+        if signer not in self.authorities or signature is None:
+            raise InvalidChain("Block is not signed by an authority")
+        try:
+            valid = self.verify(
+                ProofOfAuthority.signed_message(new_header, new_body),
+                bytes.fromhex(signature),
+                bytes.fromhex(signer),
+            )
+        except Exception:
+            valid = False
+        # The callback may report an invalid signature either by raising or by returning False
+        if not valid:
+            raise InvalidChain("Block signature is not valid")
+
+    def verify_schedule(
+        self, header_at: Callable[[int], dict], start: int, end: int
+    ) -> None:
+        recent = len(self.authorities) // 2
+        for height in range(max(1, start), end):
+            signer = header_at(height).get("signer", None)
+            for previous in range(max(1, height - recent), height):
+                if header_at(previous).get("signer", None) == signer:
+                    raise InvalidChain(
+                        f"Block #{height} is signed by an authority that signed block #{previous}"
+                    )
+
+    def expected_hashes(self, header: dict) -> float:
+        return 0.0
+
+    def work(self, header: dict) -> float:
+        # A block sealed by the authority in turn weighs more, so that the chain it extends wins over the chains
+        # extended by the authorities standing in for it
+        return (
+            2.0 if header.get("signer", None) == self.in_turn(header["index"]) else 1.0
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "authorities": self.authorities,
+            "signer": self.signer,
+        }
+
+    def __getstate__(self) -> dict:
+        # The signing function is not needed to verify a chain, and it is not shipped to the worker processes
+        return {**self.__dict__, "sign": None}
@@ -24,3 +24,8 @@ class ContractNotFound(Exception):
 class ContractError(Exception):
     def __init__(self, message):
         super().__init__(message)
+
+
+class MempoolFull(Exception):
+    def __init__(self, message):
+        super().__init__(message)
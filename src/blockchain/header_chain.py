@@ -0,0 +1,175 @@
+"""This module contains the chain of headers kept by the light nodes. A light node does not download the bodies of the
+blocks: since a header commits to its body through the hash of the body, the links and the seals of the chain can be
+verified from the headers alone, and a policy is then proven to be in a block by an inclusion proof checked against
+the merkle root of its header, see merkle.py.
+"""
+
+from __future__ import annotations
+
+from .ac_block import ACBlock
+from .consensus import ConsensusEngine
+from .errors import InvalidChain
+from .merkle import verify_proof
+
+HASH_SIZE = 32
+NO_ROOT = bytes(HASH_SIZE)
+
+
+class HeaderChain:
+    """
+    The verified headers of a chain, from an anchor block trusted by the light node, such as the genesis block, up to
+    the tip. For each block only its hash and its merkle root are kept, packed in two byte arrays, which is 64 bytes
+    a block; the full headers are kept only for the last window blocks, since verifying the schedule of the consensus
+    engine and switching to a competing branch need them. With proof of work the window must then span at least a
+    retargeting interval, and no reorganization deeper than the window is accepted.
+    """
+
+    def __init__(
+        self,
+        consensus: ConsensusEngine,
+        anchor: dict,
+        anchor_hash: str,
+        window: int = 100,
+    ):
+        """
+        :param consensus: The engine the full nodes seal the blocks with
+        :param anchor: The header of the trusted block the chain starts from
+        :param anchor_hash: The hash of that block, which is taken on trust
+        :param window: How many of the last headers are kept in full
+        """
+        self.consensus = consensus
+        self.window = window
+        self.base = anchor["index"]
+        self.hashes = bytearray(bytes.fromhex(anchor_hash))
+        self.roots = bytearray(HeaderChain._root_bytes(anchor))
+        self.recent: dict[int, dict] = {self.base: anchor}
+        self.work = 0.0
+
+    def __len__(self) -> int:
+        return self.base + len(self.hashes) // HASH_SIZE
+
+    @property
+    def height(self) -> int:
+        return len(self) - 1
+
+    @staticmethod
+    def _root_bytes(header: dict) -> bytes:
+        root = header.get("merkle_root", None)
+        return NO_ROOT if root is None else bytes.fromhex(root)
+
+    def _offset(self, height: int) -> int:
+        if not self.base <= height < len(self):
+            raise IndexError(f"No header is known at height {height}")
+        return (height - self.base) * HASH_SIZE
+
+    def hash_at(self, height: int) -> str:
+        offset = self._offset(height)
+        return self.hashes[offset : offset + HASH_SIZE].hex()
+
+    def root_at(self, height: int) -> str | None:
+        offset = self._offset(height)
+        root = bytes(self.roots[offset : offset + HASH_SIZE])
+        return None if root == NO_ROOT else root.hex()
+
+    def header_at(self, height: int) -> dict:
+        if height not in self.recent:
+            raise InvalidChain(f"The header at height {height} is no longer kept")
+        return self.recent[height]
+
+    def add_headers(self, headers: list[dict]) -> int:
+        """
+        This function extends the chain with consecutive headers received from a full node. The headers may start
+        below the tip, in which case the ones already known are skipped and, if the others fork off the chain, they
+        replace the blocks past the fork only when they carry more work.
+        :param headers: Consecutive headers, in chain order
+        :return: How many headers have been appended
+        """
+        headers = [header for header in headers if header["index"] > self.base]
+        # The headers already in the chain are skipped, the others form the branch
+        fork = 0
+        while (
+            fork < len(headers)
+            and headers[fork]["index"] < len(self)
+            and ACBlock.hash_from_parts(headers[fork], None)
+            == self.hash_at(headers[fork]["index"])
+        ):
+            fork += 1
+        branch = headers[fork:]
+        if not branch:
+            return 0
+        start = branch[0]["index"]
+        if start > len(self):
+            raise InvalidChain(f"The header #{start} does not extend the chain")
+        if start - 1 not in self.recent:
+            raise InvalidChain(f"The fork at height {start} is too deep")
+        self.consensus.verify_schedule(
+            lambda height: (
+                branch[height - start] if height >= start else self.header_at(height)
+            ),
+            start,
+            start + len(branch),
+        )
+        last_header, last_hash = self.header_at(start - 1), self.hash_at(start - 1)
+        branch_hashes = []
+        for index, header in enumerate(branch, start=start):
+            last_hash = HeaderChain.verify_link(last_hash, header, index)
+            self.consensus.verify_seal(last_header, None, header, None)
+            last_header = header
+            branch_hashes.append(last_hash)
+        branch_work = sum(self.consensus.work(header) for header in branch)
+        current_work = sum(
+            self.consensus.work(self.header_at(height))
+            for height in range(start, len(self))
+        )
+        if start < len(self) and branch_work <= current_work:
+            return 0
+        self._truncate(start)
+        for header, block_hash in zip(branch, branch_hashes):
+            self.hashes += bytes.fromhex(block_hash)
+            self.roots += HeaderChain._root_bytes(header)
+            self.recent[header["index"]] = header
+        self.work += branch_work - current_work
+        while len(self.recent) > self.window:
+            del self.recent[min(self.recent)]
+        return len(branch)
+
+    def _truncate(self, height: int) -> None:
+        del self.hashes[self._offset(height - 1) + HASH_SIZE :]
+        del self.roots[self._offset(height - 1) + HASH_SIZE :]
+        for old in [old for old in self.recent if old >= height]:
+            del self.recent[old]
+
+    @staticmethod
+    def verify_link(last_hash: str, new_header: dict, index: int) -> str:
+        """
+        Checks that a header follows the one before it, raising InvalidChain otherwise
+        :return: The hash of the new block
+        """
+        if new_header["index"] != index:
+            raise InvalidChain(f"Header #{new_header['index']} is out of place")
+        if "body_hash" not in new_header:
+            raise InvalidChain(f"Block #{index} cannot be checked without its body")
+        if new_header["previous_hash"] != last_hash:
+            raise InvalidChain(f"Header #{index} is not linked to the header before it")
+        return ACBlock.hash_from_parts(new_header, None)
+
+    def verify_inclusion(self, height: int, leaf: bytes, proof: list) -> bool:
+        """
+        Checks the proof that a leaf, such as a policy, is in the block at the given height
+        :param height:
+        :param leaf: The bytes of the leaf, see merkle.body_leaves
+        :param proof: As returned by merkle.merkle_proof
+        :return:
+        """
+        root = self.root_at(height)
+        return root is not None and verify_proof(leaf, proof, root)
+
+    def stats(self) -> dict:
+        return {
+            "height": self.height,
+            "base": self.base,
+            "tip": self.hash_at(self.height),
+            "work": self.work,
+            "stored_bytes": len(self.hashes) + len(self.roots),
+            "full_headers": len(self.recent),
+        }
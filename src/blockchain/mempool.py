@@ -0,0 +1,246 @@
+"""This module contains the pool of unconfirmed transactions that a node keeps until they are mined into a block"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Iterable, Iterator, Literal
+
+from pydantic import BaseModel
+
+from .errors import MempoolFull
+
+SHORT_ID_LENGTH = 16
+
+
+class Mempool:
+    """
+    The transactions are keyed by the hash of their content, so that the same policy submitted twice is stored once
+    and the ones committed by a block can be dropped without scanning the pool, and they are indexed by policy id.
+    The pool can be bounded both in number of transactions and in bytes; when a bound would be exceeded the oldest
+    transactions are evicted, or the new ones are rejected, depending on the eviction policy.
+    """
+
+    def __init__(
+        self,
+        max_count: int | None = None,
+        max_bytes: int | None = None,
+        eviction: Literal["oldest", "reject"] = "oldest",
+    ):
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        # Insertion ordered, so that the oldest transaction is always the first one
+        self._transactions: OrderedDict[str, BaseModel] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._arrivals: dict[str, float] = {}
+        self._by_policy_id: dict[str, set[str]] = {}
+        self._by_short_id: dict[str, str] = {}
+        self.total_bytes = 0
+        # Changes whenever a transaction is added or removed, so that what is derived from the pool can be cached
+        self.version = 0
+        self._counters = {
+            "added": 0,
+            "duplicates": 0,
+            "evicted": 0,
+            "rejected": 0,
+            "confirmed": 0,
+        }
+
+    @staticmethod
+    def serialize(transaction: BaseModel | dict) -> bytes:
+        # A model and its dump serialize alike, so that policies read back from a block body hash as when submitted
+        if isinstance(transaction, BaseModel):
+            transaction = transaction.model_dump()
+        return json.dumps(transaction, sort_keys=True, default=str).encode()
+
+    @staticmethod
+    def transaction_hash(transaction: BaseModel | dict) -> str:
+        return hashlib.sha256(Mempool.serialize(transaction)).hexdigest()
+
+    @staticmethod
+    def short_id(tx_hash: str) -> str:
+        """
+        Returns the short id of a transaction, used to reference it in compact block announcements
+        :param tx_hash:
+        :return:
+        """
+        return tx_hash[:SHORT_ID_LENGTH]
+
+    def __len__(self) -> int:
+        return len(self._transactions)
+
+    def __iter__(self) -> Iterator[BaseModel]:
+        return iter(list(self._transactions.values()))
+
+    def __contains__(self, transaction: BaseModel | dict | str) -> bool:
+        if not isinstance(transaction, str):
+            transaction = Mempool.transaction_hash(transaction)
+        return transaction in self._transactions
+
+    def items(self) -> list[tuple[str, BaseModel]]:
+        """
+        Returns the transactions along with their hashes, the oldest first
+        :return:
+        """
+        return list(self._transactions.items())
+
+    def get(self, tx_hash: str) -> BaseModel | None:
+        return self._transactions.get(tx_hash, None)
+
+    def size(self, tx_hash: str) -> int:
+        return self._sizes[tx_hash]
+
+    def arrival(self, tx_hash: str) -> float:
+        return self._arrivals[tx_hash]
+
+    def get_by_policy_id(self, policy_id: str) -> list[BaseModel]:
+        return [
+            self._transactions[tx_hash]
+            for tx_hash in self._by_policy_id.get(policy_id, ())
+        ]
+
+    def get_by_short_id(self, short_id: str) -> BaseModel | None:
+        tx_hash = self._by_short_id.get(short_id, None)
+        return self._transactions[tx_hash] if tx_hash is not None else None
+
+    def add(self, transaction: BaseModel) -> bool:
+        """
+        Adds a transaction to the pool
+        :param transaction:
+        :return: False if the transaction was already in the pool
+        """
+        raw = Mempool.serialize(transaction)
+        tx_hash = hashlib.sha256(raw).hexdigest()
+        if tx_hash in self._transactions:
+            self._counters["duplicates"] += 1
+            return False
+        self._make_room(len(raw), 1)
+        self._insert(tx_hash, transaction, len(raw))
+        return True
+
+    def add_many(self, transactions: Iterable[BaseModel]) -> list[BaseModel]:
+        """
+        Adds a batch of transactions to the pool atomically: either all the new transactions fit and are added, or
+        the pool is left untouched
+        :param transactions:
+        :return: The transactions of the batch that were not already in the pool
+        """
+        to_insert: dict[str, tuple[BaseModel, int]] = {}
+        for transaction in transactions:
+            raw = Mempool.serialize(transaction)
+            tx_hash = hashlib.sha256(raw).hexdigest()
+            if tx_hash in self._transactions or tx_hash in to_insert:
+                self._counters["duplicates"] += 1
+                continue
+            to_insert[tx_hash] = (transaction, len(raw))
+        self._make_room(sum(size for _, size in to_insert.values()), len(to_insert))
+        for tx_hash, (transaction, size) in to_insert.items():
+            self._insert(tx_hash, transaction, size)
+        return [transaction for transaction, _ in to_insert.values()]
+
+    def _make_room(self, size: int, count: int) -> None:
+        if (self.max_bytes is not None and size > self.max_bytes) or (
+            self.max_count is not None and count > self.max_count
+        ):
+            self._counters["rejected"] += count
+            raise MempoolFull("The transactions exceed the capacity of the mem pool")
+        while self._is_over(size, count):
+            if self.eviction == "reject":
+                self._counters["rejected"] += count
+                raise MempoolFull("The mem pool is full, try again later")
+            oldest = next(iter(self._transactions))
+            self.remove(oldest)
+            self._counters["evicted"] += 1
+
+    def _is_over(self, size: int, count: int) -> bool:
+        if self.max_count is not None and len(self) + count > self.max_count:
+            return True
+        if self.max_bytes is not None and self.total_bytes + size > self.max_bytes:
+            return True
+        return False
+
+    def _insert(self, tx_hash: str, transaction: BaseModel, size: int) -> None:
+        self._transactions[tx_hash] = transaction
+        self._sizes[tx_hash] = size
+        self._arrivals[tx_hash] = time.time()
+        self.total_bytes += size
+        self.version += 1
+        self._by_short_id[Mempool.short_id(tx_hash)] = tx_hash
+        policy_id = getattr(transaction, "id", None)
+        if policy_id is not None:
+            self._by_policy_id.setdefault(policy_id, set()).add(tx_hash)
+        self._counters["added"] += 1
+
+    def remove(self, tx_hash: str) -> BaseModel | None:
+        transaction = self._transactions.pop(tx_hash, None)
+        if transaction is None:
+            return None
+        self.total_bytes -= self._sizes.pop(tx_hash)
+        self.version += 1
+        del self._arrivals[tx_hash]
+        if self._by_short_id.get(Mempool.short_id(tx_hash), None) == tx_hash:
+            del self._by_short_id[Mempool.short_id(tx_hash)]
+        policy_id = getattr(transaction, "id", None)
+        if policy_id is not None:
+            hashes = self._by_policy_id[policy_id]
+            hashes.discard(tx_hash)
+            if not hashes:
+                del self._by_policy_id[policy_id]
+        return transaction
+
+    def remove_committed(self, policies: Iterable[BaseModel]) -> int:
+        """
+        Removes the transactions that have been committed by a block. The transactions are keyed by the hash of their
+        content, so each committed policy is looked up by its hash, and a pending update of the same policy survives
+        the commit of its previous version.
+        :param policies:
+        :return: The number of transactions removed
+        """
+        removed = sum(
+            self.remove(Mempool.transaction_hash(policy)) is not None
+            for policy in policies
+        )
+        self._counters["confirmed"] += removed
+        return removed
+
+    def remove_mined(self, tx_hashes: Iterable[str]) -> int:
+        """
+        Removes the transactions that have been mined into a block by this node
+        :param tx_hashes:
+        :return: The number of transactions removed
+        """
+        removed = sum(self.remove(tx_hash) is not None for tx_hash in tx_hashes)
+        self._counters["confirmed"] += removed
+        return removed
+
+    def clear(self) -> None:
+        self._transactions.clear()
+        self._sizes.clear()
+        self._arrivals.clear()
+        self._by_policy_id.clear()
+        self._by_short_id.clear()
+        self.total_bytes = 0
+        self.version += 1
+
+    def oldest_age(self) -> float:
+        """
+        Returns how many seconds the oldest transaction has been waiting in the pool
+        :return:
+        """
+        if not self._transactions:
+            return 0.0
+        return time.time() - self._arrivals[next(iter(self._transactions))]
+
+    def stats(self) -> dict:
+        return {
+            "count": len(self),
+            "bytes": self.total_bytes,
+            "max_count": self.max_count,
+            "max_bytes": self.max_bytes,
+            "eviction": self.eviction,
+            "oldest_age_s": self.oldest_age(),
+            **self._counters,
+        }
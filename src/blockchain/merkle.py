@@ -0,0 +1,104 @@
+"""This module contains the Merkle tree a block commits to, whose leaves are the resource policies, the identity
+policies and the events of its body. The root is stored in the header of the block, so that a single policy can be
+proven to be in a block with the header and O(log n) hashes instead of the whole body.
+The leaves are built from the canonical bytes of the body, so that a block parsed lazily and one parsed eagerly give
+the same leaves. As in RFC 6962, leaves and inner nodes are hashed with different prefixes, so that an inner node
+cannot be passed off as a leaf, and a node without a sibling is carried up to the next level unchanged.
+"""
+
+import hashlib
+import json
+
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+def leaf_hash(leaf: bytes) -> bytes:
+    return hashlib.sha256(LEAF_PREFIX + leaf).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+def body_leaves(body_bytes: bytes) -> list[tuple[tuple, bytes]]:
+    """
+    This function returns the leaves of a body: one for each resource policy, keyed by ("resource_policies", policy
+    key), one for each identity policy, keyed by ("identity_policies", user id, policy key), and one for each row of
+    the events table, keyed by ("events", row key)
+    :param body_bytes: The canonical bytes of the body
+    :return: The keys and the bytes of the leaves, in tree order
+    """
+    body = json.loads(body_bytes)
+    keyed = [
+        (("resource_policies", policy_key), policy)
+        for policy_key, policy in body["resource_policies"].items()
+    ]
+    keyed += [
+        (("identity_policies", user_id, policy_key), policy)
+        for user_id, policies in body["identity_policies"].items()
+        for policy_key, policy in policies.items()
+    ]
+    events = body["events"]
+    rows = next(iter(events.values()), {})
+    keyed += [
+        (("events", row), {column: events[column][row] for column in events})
+        for row in rows
+    ]
+    return [(key, json.dumps([*key, value]).encode()) for key, value in keyed]
+
+
+def _levels(leaves: list[bytes]) -> list[list[bytes]]:
+    level = [leaf_hash(leaf) for leaf in leaves]
+    levels = [level]
+    while len(level) > 1:
+        level = [
+            node_hash(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+            for i in range(0, len(level), 2)
+        ]
+        levels.append(level)
+    return levels
+
+
+def merkle_root(leaves: list[bytes]) -> str:
+    """
+    Returns the hex encoded root of the tree over the given leaves, the hash of nothing when there are none
+    :param leaves:
+    :return:
+    """
+    if not leaves:
+        return hashlib.sha256(b"").hexdigest()
+    return _levels(leaves)[-1][0].hex()
+
+
+def merkle_proof(leaves: list[bytes], index: int) -> list[tuple[str, str]]:
+    """
+    Returns the inclusion proof of a leaf, which is the list of the siblings met on the way to the root
+    :param leaves:
+    :param index: The position of the leaf
+    :return: For each sibling, whether it lies on the "left" or on the "right" and its hex encoded hash
+    """
+    proof = []
+    for level in _levels(leaves)[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(("left" if sibling < index else "right", level[sibling].hex()))
+        index //= 2
+    return proof
+
+
+def verify_proof(leaf: bytes, proof: list[tuple[str, str]], root: str) -> bool:
+    """
+    Checks that a leaf is in the tree with the given root
+    :param leaf:
+    :param proof: As returned by merkle_proof
+    :param root:
+    :return:
+    """
+    current = leaf_hash(leaf)
+    for side, sibling in proof:
+        if side == "left":
+            current = node_hash(bytes.fromhex(sibling), current)
+        else:
+            current = node_hash(current, bytes.fromhex(sibling))
+    return current.hex() == root
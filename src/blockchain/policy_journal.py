@@ -0,0 +1,117 @@
+"""This module contains the journal that keeps the local cache of the access policies in step with the active chain.
+For each block applied to the cache it records the values the block overwrote, so that when the chain is reorganized
+only the blocks of the abandoned branch are reverted and only the ones of the new branch are applied.
+"""
+
+from __future__ import annotations
+
+from copy import deepcopy
+from typing import Callable
+
+from .ac_block import ACBlock
+from .ac_blockchain import ACBlockchain
+
+
+class PolicyJournal:
+    """
+    The blocks applied to the cache, in chain order, each with the policies it overwrote (None for the ones it
+    created). Only the last max_depth blocks keep their undo record, since no deeper reorganization is accepted: if one
+    of the older blocks has to be reverted anyway, for instance when the whole chain is replaced, the cache is rebuilt
+    from scratch.
+    """
+
+    def __init__(self, mem_policies: dict, max_depth: int = 100):
+        self.mem_policies = mem_policies
+        self.max_depth = max_depth
+        self.applied: list[tuple[ACBlock, dict | None]] = []
+        # Called with the height of the last block applied whenever a sync changes the cache
+        self.listeners: list[Callable[[int], None]] = []
+
+    def apply(self, block: ACBlock) -> None:
+        policies = block.policies.resource_policies
+        undo = {
+            policy_id: deepcopy(self.mem_policies.get(policy_id, None))
+            for policy_id in policies
+        }
+        ACBlockchain.apply_resource_policy_delta(policies, self.mem_policies)
+        self.applied.append((block, undo))
+        if len(self.applied) > self.max_depth:
+            old_block, _ = self.applied[-self.max_depth - 1]
+            self.applied[-self.max_depth - 1] = (old_block, None)
+
+    def revert(self) -> ACBlock:
+        """
+        Reverts the last block applied to the cache
+        :return: The reverted block
+        """
+        block, undo = self.applied.pop()
+        for policy_id, policy in undo.items():
+            if policy is None:
+                self.mem_policies.pop(policy_id, None)
+            else:
+                self.mem_policies[policy_id] = policy
+        return block
+
+    def rebuild(self, chain: list[ACBlock]) -> None:
+        self.mem_policies.clear()
+        self.applied.clear()
+        for block in chain:
+            self.apply(block)
+
+    def sync(self, chain: list[ACBlock]) -> tuple[int, int]:
+        """
+        This function brings the cache in step with the given chain. The blocks applied to the cache are compared with
+        the chain by identity, the ones past the first difference are reverted and the blocks of the chain past it are
+        applied.
+        :param chain:
+        :return: How many blocks have been reverted and how many have been applied
+        """
+        common = 0
+        while (
+            common < min(len(self.applied), len(chain))
+            and self.applied[common][0] is chain[common]
+        ):
+            common += 1
+        if any(undo is None for _, undo in self.applied[common:]):
+            reverted = len(self.applied)
+            self.rebuild(chain)
+            self._notify()
+            return reverted, len(chain)
+        reverted = len(self.applied) - common
+        for _ in range(reverted):
+            self.revert()
+        for block in chain[common:]:
+            self.apply(block)
+        if reverted or len(chain) > common:
+            self._notify()
+        return reverted, len(chain) - common
+
+    def _notify(self) -> None:
+        for listener in self.listeners:
+            listener(len(self.applied) - 1)
+
+    def policies_at(self, height: int) -> dict:
+        """
+        Returns the policies as they were once the block at the given height had been applied, by undoing the blocks
+        above it on a copy of the cache
+        :param height: At most max_depth blocks below the last block applied
+        :return:
+        """
+        if not 0 <= height < len(self.applied):
+            raise IndexError(f"No block has been applied at height {height}")
+        policies = dict(self.mem_policies)
+        for _, undo in reversed(self.applied[height + 1 :]):
+            if undo is None:
+                raise IndexError(f"The policies at height {height} are too old")
+            for policy_id, policy in undo.items():
+                if policy is None:
+                    policies.pop(policy_id, None)
+                else:
+                    policies[policy_id] = policy
+        return policies
+
+    def stats(self) -> dict:
+        return {
+            "blocks": len(self.applied),
+            "policies": len(self.mem_policies),
+        }
@@ -0,0 +1,128 @@
+"""This module contains the numeric targets of the proof of work. A proof is valid when the sha256 digest of the proof
+data, read as a big-endian number, is not greater than the target of the block. Since the digest and the target have
+the same length, comparing their raw bytes gives the same result as comparing the numbers, with no hex conversion.
+"""
+
+from datetime import datetime
+from typing import Callable
+
+MAX_TARGET = 2**256 - 1
+TARGET_BYTES = 32
+# A retarget never changes the target by more than this factor, so that a few skewed timestamps cannot swing it
+MAX_ADJUSTMENT = 4
+# A block must be stamped later than the median time of this many blocks before it
+MEDIAN_TIME_SPAN = 11
+
+
+def difficulty_to_target(difficulty: int) -> int:
+    """
+    Returns the target equivalent to a difficulty given as a number of leading hex zeros
+    :param difficulty:
+    :return:
+    """
+    return 16 ** (64 - difficulty) - 1
+
+
+def target_to_bytes(target: int) -> bytes:
+    return target.to_bytes(TARGET_BYTES, "big")
+
+
+def meets_target(digest: bytes, target: int | bytes) -> bool:
+    if isinstance(target, int):
+        target = target_to_bytes(target)
+    return digest <= target
+
+
+def expected_hashes(target: int) -> float:
+    """
+    Returns how many attempts are needed on average to find a digest that meets the target
+    :param target:
+    :return:
+    """
+    return 2**256 / (target + 1)
+
+
+def block_time(timestamp) -> float | None:
+    """
+    Returns the timestamp of a block as seconds, blocks are stamped either with time.time() or with a formatted
+    datetime
+    :param timestamp:
+    :return: The seconds, or None if the timestamp cannot be read
+    """
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    try:
+        return float(timestamp)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.strptime(timestamp, "%d/%m/%y %H:%M:%S.%f").timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def median_time_past(header_at: Callable[[int], dict], height: int) -> float | None:
+    """
+    Returns the median time of the MEDIAN_TIME_SPAN blocks before the given height. Unlike the time of the previous
+    block, a single miner cannot move it backwards, so it bounds how far back a block can be dated.
+    :param header_at: Returns the header of the block at a given height, only the heights before height are asked
+    :param height:
+    :return: The median time, or None if none of the blocks carries a readable timestamp
+    """
+    times = sorted(
+        timestamp
+        for timestamp in (
+            block_time(header_at(previous)["timestamp"])
+            for previous in range(max(0, height - MEDIAN_TIME_SPAN), height)
+        )
+        if timestamp is not None
+    )
+    return times[len(times) // 2] if times else None
+
+
+def header_target(header: dict, default_target: int) -> int:
+    """
+    Returns the target a block was mined with, blocks that do not carry one were mined with the chain difficulty
+    :param header:
+    :param default_target:
+    :return:
+    """
+    target = header.get("target", None)
+    return target if target is not None else default_target
+
+
+def next_target(
+    header_at: Callable[[int], dict],
+    height: int,
+    default_target: int,
+    retarget_interval: int | None,
+    block_interval_s: float,
+) -> int:
+    """
+    This function computes the target of the block at the given height from the headers before it. The target is
+    kept from the previous block, except every retarget_interval blocks, where it is scaled by how long the last
+    interval took with respect to retarget_interval * block_interval_s: if blocks came too fast the target shrinks, so
+    that finding a proof takes proportionally more attempts.
+    :param header_at: Returns the header of the block at a given height, only the heights before height are asked
+    :param height: The height of the block whose target is computed
+    :param default_target: The target of the blocks that do not carry one
+    :param retarget_interval: How many blocks there are between two retargets, None for a fixed target
+    :param block_interval_s: The time wanted between two blocks
+    :return:
+    """
+    previous = header_target(header_at(height - 1), default_target)
+    if not retarget_interval or height % retarget_interval != 0:
+        return previous
+    first = max(0, height - 1 - retarget_interval)
+    intervals = height - 1 - first
+    start = block_time(header_at(first)["timestamp"])
+    end = block_time(header_at(height - 1)["timestamp"])
+    if intervals == 0 or start is None or end is None:
+        return previous
+    # The times are taken in milliseconds so that the scaling is done with integers
+    actual_ms = max(1, int((end - start) * 1000))
+    expected_ms = max(1, int(intervals * block_interval_s * 1000))
+    actual_ms = min(
+        max(actual_ms, expected_ms // MAX_ADJUSTMENT), expected_ms * MAX_ADJUSTMENT
+    )
+    return min(MAX_TARGET, max(1, previous * actual_ms // expected_ms))
@@ -138,3 +138,31 @@ def test_eq_blocks(resource_statements, identity_statements):
         resource_policies=[policy],
         identity_policies=identity_pol,
     )
+
+
+def test_lazy_body_parsed_on_first_access(resource_statements, identity_statements):
+    policy = {
+        "principal_id": {
+            "policy_id": ACIdentityPolicy(
+                statements=identity_statements, id="0", action="add"
+            )
+        }
+    }
+    resource = ACResourcePolicy(statements=resource_statements, id="0", action="add")
+    block = ACBlock(
+        index=0,
+        timestamp="10",
+        previous_hash="0",
+        resource_policies=[resource],
+        identity_policies=policy,
+    )
+    lazy_block = ACBlock(
+        index=0, timestamp="10", previous_hash="0", raw_body=block.body_bytes
+    )
+    assert not lazy_block.is_body_loaded
+    assert lazy_block.compute_hash() == block.compute_hash()
+    assert lazy_block == block
+    assert not lazy_block.is_body_loaded
+    assert lazy_block.body.resource_policies["0"] == resource
+    assert lazy_block.is_body_loaded
+    assert lazy_block.compute_hash() == block.compute_hash()
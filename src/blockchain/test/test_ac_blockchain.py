@@ -7,6 +7,7 @@ import pytest
 from ..ac_blockchain import ACBlockchain
 from ..ac_block import ACBlock
 from ..errors import ContractNotFound, InvalidChain
+from ..policy_journal import PolicyJournal
 import pandas as pd
 from copy import deepcopy
 
@@ -591,3 +592,71 @@ def test_create_blockchain_from_request_can_decode_contracts(
     assert local_chain.mine()
     df = local_chain.get_last_bloc.body.events
     assert not df.loc[df["transaction_type"] == "AUTHENTICATION"].empty
+
+
+def test_create_blockchain_from_request_lazy_bodies(chain_with_blocks):
+    str_chain: list[dict] = [block.to_dict() for block in chain_with_blocks.chain]
+    local_chain = ACBlockchain(difficulty=chain_with_blocks.difficulty)
+    assert local_chain.create_blockchain_from_request(str_chain, lazy_bodies=True)
+    assert len(local_chain.chain) == len(chain_with_blocks.chain)
+    assert not any(block.is_body_loaded for block in local_chain.chain[:-1])
+    assert local_chain.get_last_bloc.is_body_loaded
+    for local_block, original_block in zip(local_chain.chain, chain_with_blocks.chain):
+        assert local_block.compute_hash() == original_block.compute_hash()
+        assert local_block.body.to_bytes() == original_block.body_bytes
+    assert all(block.is_body_loaded for block in local_chain.chain)
+
+
+def test_lazy_bodies_are_not_parsed_to_follow_the_policies(chain_with_blocks):
+    str_chain: list[dict] = [block.to_dict() for block in chain_with_blocks.chain]
+    local_chain = ACBlockchain(difficulty=chain_with_blocks.difficulty)
+    assert local_chain.create_blockchain_from_request(str_chain, lazy_bodies=True)
+    journal = PolicyJournal({})
+    journal.sync(local_chain.chain)
+    for block in local_chain.chain:
+        local_chain.remove_confirmed_transactions(block)
+    assert not any(block.is_body_loaded for block in local_chain.chain[:-1])
+    expected = PolicyJournal({})
+    expected.sync(chain_with_blocks.chain)
+    assert journal.mem_policies == expected.mem_policies
+    assert local_chain.chain[1].policies == chain_with_blocks.chain[1].policies
+
+
+def test_create_blockchain_from_request_lazy_bodies_tampered(chain_with_blocks):
+    str_chain: list[dict] = [block.to_dict() for block in chain_with_blocks.chain]
+    str_chain[1]["body"]["resource_policies"] = {}
+    local_chain = ACBlockchain(difficulty=chain_with_blocks.difficulty)
+    with pytest.raises(InvalidChain):
+        local_chain.create_blockchain_from_request(str_chain, lazy_bodies=True)
+
+
+def test_is_chain_valid(chain_with_blocks):
+    assert chain_with_blocks.is_chain_valid()
+    assert chain_with_blocks.verified_height == len(chain_with_blocks.chain) - 1
+
+
+def test_is_chain_valid_only_checks_new_links(chain_with_blocks):
+    assert chain_with_blocks.is_chain_valid()
+    # Tampering below the watermark goes unnoticed by the incremental check
+    chain_with_blocks.chain[1].previous_hash = "a tampered hash"
+    assert chain_with_blocks.is_chain_valid()
+    with pytest.raises(InvalidChain):
+        chain_with_blocks.is_chain_valid(full=True)
+
+
+def test_is_chain_valid_replaced_tip(chain_with_blocks):
+    assert chain_with_blocks.is_chain_valid()
+    last_block = chain_with_blocks.chain.pop(-1)
+    tampered = deepcopy(last_block)
+    tampered.previous_hash = "a tampered hash"
+    chain_with_blocks.chain.append(tampered)
+    with pytest.raises(InvalidChain):
+        chain_with_blocks.is_chain_valid()
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_is_chain_valid_parallel(chain_with_blocks, workers):
+    assert chain_with_blocks.is_chain_valid(full=True, workers=workers)
+    chain_with_blocks.chain[-3].previous_hash = "a tampered hash"
+    with pytest.raises(InvalidChain):
+        chain_with_blocks.is_chain_valid(full=True, workers=workers)
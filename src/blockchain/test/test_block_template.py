@@ -0,0 +1,65 @@
+from ..ac_block import ACBlock
+from ..ac_blockchain import ACBlockchain
+from ..ac_transaction import ACResourcePolicy
+from ..block_template import select_transactions
+from ..mempool import Mempool
+from .test_ac_blockchain import append_to_contract_header
+
+
+def make_policy(policy_id: str, size: int = 0) -> ACResourcePolicy:
+    return ACResourcePolicy(id=policy_id + " " * size, action="add")
+
+
+def make_mempool(policies: list[ACResourcePolicy]) -> Mempool:
+    mempool = Mempool()
+    for policy in policies:
+        mempool.add(policy)
+    return mempool
+
+
+def test_select_oldest_first_up_to_count():
+    mempool = make_mempool([make_policy(str(i)) for i in range(5)])
+    selected = select_transactions(mempool, max_count=3)
+    assert [policy.id for _, policy in selected] == ["0", "1", "2"]
+    assert select_transactions(mempool, max_count=3) == selected
+
+
+def test_select_skips_what_does_not_fit():
+    mempool = make_mempool(
+        [make_policy("0"), make_policy("1", size=100), make_policy("2")]
+    )
+    small = mempool.size(Mempool.transaction_hash(make_policy("0")))
+    selected = select_transactions(mempool, max_bytes=2 * small)
+    assert [policy.id for _, policy in selected] == ["0", "2"]
+
+
+def test_select_always_takes_the_oldest():
+    mempool = make_mempool([make_policy("0", size=100), make_policy("1")])
+    selected = select_transactions(mempool, max_bytes=10)
+    assert [policy.id.strip() for _, policy in selected] == ["0"]
+
+
+def test_prepare_block_leaves_the_rest_for_the_next_block():
+    def MAC(data: dict, block: ACBlock):
+        pass
+
+    header = ACBlock(index=0, timestamp="0", previous_hash="0").body.contract_header
+    genesis = ACBlock(
+        index=0,
+        timestamp="0",
+        previous_hash="0",
+        contract_header=append_to_contract_header(header, MAC),
+    )
+    chain = ACBlockchain(difficulty=1, genesis_block=genesis)
+    chain.add_new_transaction([make_policy(str(i)) for i in range(5)])
+
+    template = chain.prepare_block(max_count=2)
+    assert len(template.tx_hashes) == 2
+    assert template.left_out == 3
+    assert template.expected_hashes == 16
+    assert template.expected_hashed_bytes == 16 * template.attempt_bytes
+
+    chain.proof_of_work(template.block)
+    chain.commit_block(template.block, template.tx_hashes)
+    assert len(chain.unconfirmed_transactions) == 3
+    assert chain.prepare_block().to_dict()["transactions"] == 3
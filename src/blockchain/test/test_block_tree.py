@@ -0,0 +1,138 @@
+import pytest
+
+from ..ac_block import ACBlock
+from ..ac_blockchain import ACBlockchain
+from ..ac_transaction import ACResourcePolicy
+from ..errors import InvalidChain
+from ..policy_journal import PolicyJournal
+
+
+def fork_of(chain: ACBlockchain, height: int) -> ACBlockchain:
+    fork = ACBlockchain(difficulty=chain.difficulty)
+    fork.create_blockchain_from_request(chain.to_dict()["chain"][: height + 1])
+    return fork
+
+
+def seal_next(
+    chain: ACBlockchain, timestamp: str, policies: list[ACResourcePolicy] = None
+) -> ACBlock:
+    block = ACBlock(
+        index=chain.get_last_bloc.index + 1,
+        timestamp=timestamp,
+        previous_hash=chain.get_last_bloc.compute_hash(),
+        resource_policies=policies,
+    )
+    chain.proof_of_work(block)
+    assert chain.add_block(block)
+    return block
+
+
+def test_heavier_branch_reorganizes_the_suffix():
+    chain = ACBlockchain(difficulty=1)
+    genesis = chain.chain[0]
+    a = [seal_next(chain, f"a{i}") for i in range(2)]
+    other = fork_of(chain, 0)
+    b = [seal_next(other, f"b{i}") for i in range(3)]
+
+    # As long as the branch carries no more work than the chain it is only stored
+    assert chain.add_block(b[0]) and chain.add_block(b[1])
+    assert chain.chain == [genesis] + a
+    assert len(chain.tree) == 2
+
+    assert chain.add_block(b[2])
+    assert chain.chain[0] is genesis and chain.chain[1:] == b
+    assert [block.index for block in chain.tree.blocks.values()] == [1, 2]
+    assert chain.cumulative_work() == 3 * 16
+    assert chain.is_chain_valid()
+    assert chain.is_chain_valid(full=True)
+
+    # Blocks already known, on either branch, are refused
+    with pytest.raises(InvalidChain):
+        chain.add_block(a[1])
+    with pytest.raises(InvalidChain):
+        chain.add_block(b[1])
+
+
+def test_reorganization_updates_mem_pool_and_policies():
+    kept = ACResourcePolicy(id="kept", action="add")
+    dropped = ACResourcePolicy(id="dropped", action="add")
+    new = ACResourcePolicy(id="new", action="add")
+    chain = ACBlockchain(difficulty=1)
+    other = fork_of(chain, 0)
+    seal_next(chain, "a0", [kept, dropped])
+    journal = PolicyJournal({})
+    assert journal.sync(chain.chain) == (0, 2)
+    assert set(journal.mem_policies) == {"kept", "dropped"}
+
+    b = [seal_next(other, "b0", [kept]), seal_next(other, "b1", [new])]
+    chain.add_block(b[0])
+    chain.add_block(b[1])
+    assert chain.chain[1:] == b
+    # Only the diverging suffix is reverted and applied again
+    assert journal.sync(chain.chain) == (1, 2)
+    assert set(journal.mem_policies) == {"kept", "new"}
+    assert [policy.id for policy in chain.unconfirmed_transactions] == ["dropped"]
+
+
+def test_tip_is_restored_after_an_invalid_block():
+    chain = ACBlockchain(difficulty=1)
+    a = [seal_next(chain, f"a{i}") for i in range(2)]
+    active = list(chain.chain)
+    seal_next(chain, "a2")
+    chain.restore_tip(a[1], chain.chain[-1])
+    assert chain.chain == active
+
+    other = fork_of(chain, 0)
+    b = [seal_next(other, f"b{i}") for i in range(3)]
+    for block in b:
+        chain.add_block(block)
+    assert chain.chain[1:] == b
+    # The block that reorganized the chain is undone, and the old branch is active again
+    chain.restore_tip(a[1], b[2])
+    assert chain.chain == active
+    assert b[2].compute_hash() not in chain.tree
+    assert chain.is_chain_valid()
+
+    # A block that only joined a side branch leaves the chain as it was
+    chain.restore_tip(a[1], b[1])
+    assert chain.chain == active
+
+
+def test_fork_point_and_branch_work():
+    chain = ACBlockchain(difficulty=1)
+    for i in range(3):
+        seal_next(chain, f"a{i}")
+    longer = fork_of(chain, 3)
+    seal_next(longer, "a3")
+    forked = fork_of(chain, 1)
+    seal_next(forked, "b2")
+
+    headers = [block.header for block in longer.chain[2:]]
+    assert chain.fork_point(headers, 2) == 3
+    assert chain.branch_work(headers, 2, 3) == 4 * 16
+    headers = [block.header for block in forked.chain[1:]]
+    assert chain.fork_point(headers, 1) == 1
+    assert chain.branch_work(headers, 1, 1) == 2 * 16
+    stranger = ACBlockchain(difficulty=1)
+    seal_next(stranger, "c0")
+    assert chain.fork_point([stranger.chain[1].header], 1) is None
+
+
+def test_deep_fork_is_rejected():
+    chain = ACBlockchain(difficulty=1, max_reorg_depth=1)
+    other = fork_of(chain, 0)
+    for i in range(3):
+        seal_next(chain, f"a{i}")
+    with pytest.raises(InvalidChain):
+        chain.add_block(seal_next(other, "b0"))
+
+
+def test_lighter_chain_is_not_swapped():
+    chain = ACBlockchain(difficulty=1)
+    seal_next(chain, "a0")
+    seal_next(chain, "a1")
+    lighter = fork_of(chain, 1).to_dict()["chain"]
+    assert not chain.create_blockchain_from_request(
+        lighter, min_work=chain.cumulative_work()
+    )
+    assert len(chain.chain) == 3
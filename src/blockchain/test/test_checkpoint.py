@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+from ..ac_blockchain import ACBlockchain
+from ..ac_transaction import ACResourcePolicy
+from ..checkpoint import Checkpoint, policy_state_digest
+from ..consensus import ProofOfWork
+from ..errors import InvalidChain
+from ..policy_journal import PolicyJournal
+from .test_block_tree import seal_next
+from .test_consensus import Authority, verify
+
+
+class CountingProofOfWork(ProofOfWork):
+    def __init__(self, difficulty: int):
+        super().__init__(difficulty)
+        self.verified = []
+
+    def verify_seal(self, last_header, last_body, new_header, new_body) -> None:
+        self.verified.append(new_header["index"])
+        super().verify_seal(last_header, last_body, new_header, new_body)
+
+
+@pytest.fixture(scope="module")
+def publisher() -> Authority:
+    return Authority()
+
+
+@pytest.fixture
+def chain() -> ACBlockchain:
+    chain = ACBlockchain(difficulty=1)
+    for i in range(5):
+        seal_next(chain, f"a{i}", [ACResourcePolicy(id=f"p{i}", action="add")])
+    return chain
+
+
+def make_checkpoint(chain: ACBlockchain, height: int, publisher: Authority):
+    journal = PolicyJournal({})
+    journal.sync(chain.chain)
+    return Checkpoint.create(
+        height=height,
+        block_hash=chain.chain[height].compute_hash(),
+        policy_digest=policy_state_digest(journal.policies_at(height)),
+        signer=publisher.public_key,
+        sign=publisher.sign,
+    )
+
+
+def test_blocks_below_checkpoint_are_not_sealed_again(chain, publisher):
+    checkpoint = Checkpoint.from_dict(
+        json.loads(json.dumps(make_checkpoint(chain, 3, publisher).to_dict()))
+    )
+    checkpoint.verify([publisher.public_key], verify)
+
+    engine = CountingProofOfWork(1)
+    syncing = ACBlockchain(difficulty=1, consensus=engine)
+    assert syncing.create_blockchain_from_request(
+        chain.to_dict()["chain"], lazy_bodies=True, checkpoint=checkpoint
+    )
+    assert engine.verified == [4, 5]
+    journal = PolicyJournal({})
+    journal.sync(syncing.chain)
+    assert policy_state_digest(journal.policies_at(3)) == checkpoint.policy_digest
+    assert set(journal.policies_at(3)) == {"p0", "p1", "p2"}
+
+
+def test_tampered_chain_does_not_match_checkpoint(chain, publisher):
+    checkpoint = make_checkpoint(chain, 3, publisher)
+    data = chain.to_dict()["chain"]
+    data[2]["body"]["resource_policies"] = {}
+    with pytest.raises(InvalidChain):
+        ACBlockchain(difficulty=1).create_blockchain_from_request(
+            data, checkpoint=checkpoint
+        )
+
+
+def test_chain_with_other_policies_is_not_swapped(chain, publisher):
+    honest = make_checkpoint(chain, 3, publisher)
+    checkpoint = Checkpoint.create(
+        height=3,
+        block_hash=honest.block_hash,
+        policy_digest=policy_state_digest({}),
+        signer=publisher.public_key,
+        sign=publisher.sign,
+    )
+    local = ACBlockchain(difficulty=1)
+    genesis = local.chain[0]
+    with pytest.raises(InvalidChain):
+        local.create_blockchain_from_request(
+            chain.to_dict()["chain"], lazy_bodies=True, checkpoint=checkpoint
+        )
+    assert local.chain == [genesis]
+
+
+def test_untrusted_checkpoint_is_rejected(chain, publisher):
+    checkpoint = make_checkpoint(chain, 3, Authority())
+    with pytest.raises(InvalidChain):
+        checkpoint.verify([publisher.public_key], verify)
+    checkpoint = make_checkpoint(chain, 3, publisher)
+    checkpoint.height = 2
+    with pytest.raises(InvalidChain):
+        checkpoint.verify([publisher.public_key], verify)
+    checkpoint = make_checkpoint(chain, 3, publisher)
+    with pytest.raises(InvalidChain):
+        checkpoint.verify([publisher.public_key], lambda *args: False)
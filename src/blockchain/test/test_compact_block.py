@@ -0,0 +1,106 @@
+import pytest
+
+from .. import compact_block
+from ..ac_block import ACBlock
+from ..ac_transaction import (
+    ACIdentityPolicy,
+    ACIdentityStatement,
+    ACResourcePolicy,
+    ACResourceStatement,
+)
+from ..errors import InvalidChain
+from ..mempool import Mempool
+
+
+def make_resource_policy(policy_id: str) -> ACResourcePolicy:
+    return ACResourcePolicy(
+        id=policy_id,
+        action="add",
+        statements={
+            "0": ACResourceStatement(
+                version="A version",
+                sid="0",
+                effect="Allow",
+                resource="A resource",
+                principal="A principal",
+            )
+        },
+    )
+
+
+def make_identity_policy(policy_id: str) -> ACIdentityPolicy:
+    return ACIdentityPolicy(
+        id=policy_id,
+        action="add",
+        statements={
+            "0": ACIdentityStatement(
+                version="A version", sid="0", effect="Deny", resource="A resource"
+            )
+        },
+    )
+
+
+def make_blocks() -> tuple[ACBlock, ACBlock]:
+    parent = ACBlock(index=0, timestamp="10", previous_hash="0")
+    block = ACBlock(
+        index=1,
+        timestamp="11",
+        previous_hash=parent.compute_hash(),
+        proof=7,
+        resource_policies=[make_resource_policy("0"), make_resource_policy("1")],
+        identity_policies={"user": {"2": make_identity_policy("2")}},
+    )
+    return block, parent
+
+
+def test_reconstruct_from_mempool():
+    block, parent = make_blocks()
+    mempool = Mempool()
+    mempool.add_many(
+        [
+            make_resource_policy("0"),
+            make_resource_policy("1"),
+            make_identity_policy("2"),
+        ]
+    )
+    compact = compact_block.to_compact(block, parent)
+    assert len(compact["resource_policies"]) == 2
+    assert len(compact["identity_policies"]) == 1
+
+    rebuilt, missing = compact_block.reconstruct(compact, mempool, parent)
+    assert not missing
+    assert rebuilt.compute_hash() == block.compute_hash()
+    assert rebuilt.body_bytes == block.body_bytes
+
+
+def test_reconstruct_reports_missing_transactions():
+    block, parent = make_blocks()
+    mempool = Mempool()
+    mempool.add(make_resource_policy("0"))
+    compact = compact_block.to_compact(block, parent)
+
+    rebuilt, missing = compact_block.reconstruct(compact, mempool, parent)
+    assert rebuilt is None
+    assert len(missing) == 2
+
+    compact["transactions"] = compact_block.find_transactions(block, missing)
+    assert sorted(compact["transactions"]) == sorted(missing)
+    rebuilt, missing = compact_block.reconstruct(compact, mempool, parent)
+    assert not missing
+    assert rebuilt.compute_hash() == block.compute_hash()
+
+
+def test_reconstruct_rejects_hash_mismatch():
+    block, parent = make_blocks()
+    mempool = Mempool()
+    mempool.add_many(
+        [
+            make_resource_policy("0"),
+            make_resource_policy("1"),
+            make_identity_policy("2"),
+        ]
+    )
+    compact = compact_block.to_compact(block, parent)
+    compact["proof"] += 1
+    with pytest.raises(InvalidChain):
+        compact_block.reconstruct(compact, mempool, parent)
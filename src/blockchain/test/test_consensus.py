@@ -0,0 +1,118 @@
+import pytest
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.hazmat.primitives.serialization import load_ssh_public_key
+
+from ..ac_block import ACBlock
+from ..ac_blockchain import ACBlockchain
+from ..consensus import ProofOfAuthority, ProofOfWork
+from ..errors import InvalidChain
+
+PSS = padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH)
+
+
+def verify(message: bytes, signature: bytes, public_key: bytes) -> bool:
+    load_ssh_public_key(public_key).verify(signature, message, PSS, hashes.SHA256())
+    return True
+
+
+class Authority:
+    def __init__(self):
+        self.private_key = rsa.generate_private_key(
+            public_exponent=65537, key_size=2048
+        )
+        self.public_key = (
+            self.private_key.public_key()
+            .public_bytes(
+                encoding=serialization.Encoding.OpenSSH,
+                format=serialization.PublicFormat.OpenSSH,
+            )
+            .hex()
+        )
+
+    def sign(self, message: bytes) -> bytes:
+        return self.private_key.sign(message, PSS, hashes.SHA256())
+
+    def engine(self, authorities: list[str]) -> ProofOfAuthority:
+        return ProofOfAuthority(
+            authorities, verify, signer=self.public_key, sign=self.sign
+        )
+
+
+@pytest.fixture(scope="module")
+def authorities() -> list[Authority]:
+    return [Authority(), Authority()]
+
+
+def seal_next(chain: ACBlockchain, engine: ProofOfAuthority) -> ACBlock:
+    block = ACBlock(
+        index=chain.get_last_bloc.index + 1,
+        timestamp=str(float(chain.get_last_bloc.index + 1)),
+        previous_hash=chain.get_last_bloc.compute_hash(),
+    )
+    engine.prepare(chain, block)
+    engine.seal(chain, block)
+    return block
+
+
+def test_authorities_seal_in_rotation(authorities):
+    keys = [authority.public_key for authority in authorities]
+    chain = ACBlockchain(difficulty=5, consensus=authorities[0].engine(keys))
+    for i in range(4):
+        block = seal_next(chain, authorities[i % 2].engine(keys))
+        # No proof of work has been computed, despite the difficulty
+        assert block.proof == 0
+        assert chain.add_block(block)
+    assert chain.is_chain_valid(full=True)
+
+    # A node that is not an authority can still validate the chain
+    validator = ACBlockchain(
+        difficulty=5, consensus=ProofOfAuthority(keys, verify=verify)
+    )
+    assert validator.create_blockchain_from_request(chain.to_dict()["chain"])
+
+
+def test_same_authority_cannot_seal_twice_in_a_row(authorities):
+    keys = [authority.public_key for authority in authorities]
+    engine = authorities[0].engine(keys)
+    chain = ACBlockchain(difficulty=1, consensus=engine)
+    assert chain.add_block(seal_next(chain, engine))
+    with pytest.raises(InvalidChain):
+        chain.add_block(seal_next(chain, engine))
+
+
+def test_invalid_seals_are_rejected(authorities):
+    keys = [authority.public_key for authority in authorities]
+    chain = ACBlockchain(difficulty=1, consensus=authorities[0].engine(keys))
+
+    tampered = seal_next(chain, authorities[0].engine(keys))
+    tampered.timestamp = "42.0"
+    with pytest.raises(InvalidChain):
+        chain.add_block(tampered)
+
+    outsider = Authority()
+    with pytest.raises(InvalidChain):
+        seal_next(chain, outsider.engine(keys))
+    forged = seal_next(chain, outsider.engine([outsider.public_key]))
+    with pytest.raises(InvalidChain):
+        chain.add_block(forged)
+
+    # A callback that reports an invalid signature by returning False is heeded too
+    block = seal_next(chain, authorities[0].engine(keys))
+    last = chain.get_last_bloc
+    arguments = (last.header, last.body_bytes, block.header, block.body_bytes)
+    ProofOfAuthority(keys, verify=verify).verify_seal(*arguments)
+    with pytest.raises(InvalidChain):
+        ProofOfAuthority(keys, verify=lambda *args: False).verify_seal(*arguments)
+
+
+def test_bare_difficulty_is_proof_of_work():
+    chain = ACBlockchain(difficulty=2)
+    assert isinstance(chain.consensus, ProofOfWork)
+    block = ACBlock(
+        index=1, timestamp="1", previous_hash=chain.get_last_bloc.compute_hash()
+    )
+    chain.proof_of_work(block)
+    assert chain.add_block(block)
+    assert ACBlockchain.is_block_valid(chain.chain[0], block, 2)
+    assert chain.consensus.expected_hashes(block.header) == 16**2
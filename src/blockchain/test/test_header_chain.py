@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from ..ac_blockchain import ACBlockchain
+from ..ac_transaction import ACResourcePolicy
+from ..consensus import ProofOfWork
+from ..errors import InvalidChain
+from ..header_chain import HeaderChain
+from .test_block_tree import fork_of, seal_next
+
+
+def headers_of(chain: ACBlockchain, start: int = 1) -> list[dict]:
+    # Headers go through JSON as they do between the nodes
+    return json.loads(json.dumps([block.header for block in chain.chain[start:]]))
+
+
+def light_chain(chain: ACBlockchain, window: int = 100) -> HeaderChain:
+    genesis = chain.chain[0]
+    return HeaderChain(
+        ProofOfWork(chain.difficulty), genesis.header, genesis.compute_hash(), window
+    )
+
+
+@pytest.fixture
+def chain() -> ACBlockchain:
+    chain = ACBlockchain(difficulty=1)
+    for i in range(5):
+        seal_next(chain, f"a{i}", [ACResourcePolicy(id=f"p{i}", action="add")])
+    return chain
+
+
+def test_headers_are_verified_without_bodies(chain):
+    headers = light_chain(chain, window=2)
+    assert headers.add_headers(headers_of(chain)) == 5
+    assert headers.height == 5
+    assert [headers.hash_at(i) for i in range(6)] == [
+        block.compute_hash() for block in chain.chain
+    ]
+    assert headers.stats()["stored_bytes"] == 6 * 64
+    assert sorted(headers.recent) == [4, 5]
+    # The headers already known are skipped
+    assert headers.add_headers(headers_of(chain, start=4)) == 0
+
+    proof = chain.chain[3].inclusion_proof(("resource_policies", "p2"))
+    assert headers.verify_inclusion(3, proof["leaf"].encode(), proof["proof"])
+    assert not headers.verify_inclusion(2, proof["leaf"].encode(), proof["proof"])
+
+
+def test_tampered_headers_are_rejected(chain):
+    tampered = headers_of(chain)
+    tampered[2]["body_hash"] = tampered[1]["body_hash"]
+    with pytest.raises(InvalidChain):
+        light_chain(chain).add_headers(tampered)
+
+    tampered = headers_of(chain)
+    tampered[1]["merkle_root"] = tampered[0]["merkle_root"]
+    with pytest.raises(InvalidChain):
+        light_chain(chain).add_headers(tampered)
+    with pytest.raises(InvalidChain):
+        light_chain(chain).add_headers(headers_of(chain, start=2))
+
+
+def test_heavier_branch_replaces_the_suffix(chain):
+    headers = light_chain(chain)
+    headers.add_headers(headers_of(chain))
+    other = fork_of(chain, 3)
+    for i in range(3):
+        seal_next(other, f"b{i}")
+
+    assert headers.add_headers(headers_of(chain, start=4)[:1]) == 0
+    assert headers.add_headers(headers_of(other, start=2)) == 3
+    assert headers.height == 6
+    assert headers.hash_at(6) == other.get_last_bloc.compute_hash()
+    assert headers.work == other.cumulative_work()
+
+    # The lighter branch is not taken back
+    assert headers.add_headers(headers_of(chain, start=4)) == 0
+    assert headers.hash_at(4) == other.chain[4].compute_hash()
+
+
+def test_fork_deeper_than_window_is_rejected(chain):
+    headers = light_chain(chain, window=2)
+    headers.add_headers(headers_of(chain))
+    other = fork_of(chain, 1)
+    for i in range(6):
+        seal_next(other, f"b{i}")
+    with pytest.raises(InvalidChain):
+        headers.add_headers(headers_of(other))
@@ -0,0 +1,122 @@
+import time
+
+import pytest
+
+from ..ac_block import ACBlock
+from ..ac_blockchain import ACBlockchain
+from ..ac_transaction import ACResourcePolicy, ACResourceStatement
+from ..errors import MempoolFull
+from ..mempool import Mempool
+
+
+def make_policy(policy_id: str, effect: str = "Allow") -> ACResourcePolicy:
+    return ACResourcePolicy(
+        id=policy_id,
+        action="add",
+        statements={
+            "0": ACResourceStatement(
+                version="A version",
+                sid="0",
+                effect=effect,
+                resource="A resource",
+                principal="A principal",
+            )
+        },
+    )
+
+
+def test_add_deduplicates_by_content():
+    mempool = Mempool()
+    assert mempool.add(make_policy("0"))
+    assert not mempool.add(make_policy("0"))
+    assert mempool.add(make_policy("0", effect="Deny"))
+    assert len(mempool) == 2
+    assert make_policy("0") in mempool
+    assert make_policy("1") not in mempool
+    assert len(mempool.get_by_policy_id("0")) == 2
+    assert mempool.stats()["duplicates"] == 1
+    # A duplicate leaves the pool as it was
+    assert mempool.version == 2
+    mempool.remove(Mempool.transaction_hash(make_policy("0")))
+    assert mempool.version == 3
+
+
+def test_count_limit_evicts_oldest():
+    mempool = Mempool(max_count=3)
+    for i in range(5):
+        mempool.add(make_policy(str(i)))
+    assert len(mempool) == 3
+    assert [policy.id for policy in mempool] == ["2", "3", "4"]
+    assert mempool.stats()["evicted"] == 2
+
+
+def test_byte_limit_rejects():
+    size = len(Mempool.serialize(make_policy("0")))
+    mempool = Mempool(max_bytes=size * 2, eviction="reject")
+    mempool.add(make_policy("0"))
+    mempool.add(make_policy("1"))
+    with pytest.raises(MempoolFull):
+        mempool.add(make_policy("2"))
+    assert len(mempool) == 2
+    assert mempool.total_bytes == size * 2
+    assert mempool.stats()["rejected"] == 1
+
+
+def test_transaction_bigger_than_pool_is_rejected():
+    mempool = Mempool(max_bytes=10)
+    with pytest.raises(MempoolFull):
+        mempool.add(make_policy("0"))
+    assert len(mempool) == 0
+
+
+def test_remove_committed_keeps_other_versions():
+    mempool = Mempool()
+    mempool.add(make_policy("0"))
+    mempool.add(make_policy("0", effect="Deny"))
+    mempool.add(make_policy("1"))
+    assert mempool.remove_committed([make_policy("0")]) == 1
+    assert len(mempool) == 2
+    assert make_policy("0", effect="Deny") in mempool
+    assert mempool.total_bytes == sum(len(Mempool.serialize(p)) for p in mempool)
+
+
+def test_oldest_age():
+    mempool = Mempool()
+    assert mempool.oldest_age() == 0.0
+    mempool.add(make_policy("0"))
+    time.sleep(0.01)
+    assert mempool.oldest_age() > 0
+
+
+def test_blockchain_removes_confirmed_transactions():
+    chain = ACBlockchain(
+        difficulty=1, transactions=[make_policy("0"), make_policy("1")]
+    )
+    block = ACBlock(
+        index=1,
+        timestamp="10",
+        previous_hash=chain.get_last_bloc.compute_hash(),
+        resource_policies=[make_policy("0")],
+    )
+    chain.proof_of_work(block)
+    assert chain.add_block(block)
+    assert chain.remove_confirmed_transactions(block) == 1
+    assert [policy.id for policy in chain.unconfirmed_transactions] == ["1"]
+
+
+def test_add_many_is_atomic():
+    mempool = Mempool(max_count=3, eviction="reject")
+    mempool.add(make_policy("0"))
+    with pytest.raises(MempoolFull):
+        mempool.add_many([make_policy(str(i)) for i in range(1, 4)])
+    assert len(mempool) == 1
+    added = mempool.add_many([make_policy("0"), make_policy("1"), make_policy("1")])
+    assert [policy.id for policy in added] == ["1"]
+    assert len(mempool) == 2
+
+
+def test_add_many_evicts_to_fit():
+    mempool = Mempool(max_count=3)
+    mempool.add_many([make_policy(str(i)) for i in range(3)])
+    mempool.add_many([make_policy(str(i)) for i in range(3, 5)])
+    assert [policy.id for policy in mempool] == ["2", "3", "4"]
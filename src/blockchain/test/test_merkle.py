@@ -0,0 +1,63 @@
+import pytest
+
+from ..ac_block import ACBlock, ACBlockBody
+from ..ac_blockchain import ACBlockchain
+from ..ac_transaction import ACIdentityPolicy, ACResourcePolicy
+from ..errors import InvalidChain
+from ..merkle import body_leaves, merkle_proof, merkle_root, verify_proof
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 5, 8, 13])
+def test_every_leaf_has_a_valid_proof(count):
+    leaves = [str(i).encode() for i in range(count)]
+    root = merkle_root(leaves)
+    for index, leaf in enumerate(leaves):
+        proof = merkle_proof(leaves, index)
+        assert len(proof) <= count.bit_length()
+        assert verify_proof(leaf, proof, root)
+        assert not verify_proof(b"other", proof, root)
+
+
+def test_block_commits_to_its_policies():
+    chain = ACBlockchain(difficulty=1)
+    block = ACBlock(
+        index=1,
+        timestamp="1",
+        previous_hash=chain.get_last_bloc.compute_hash(),
+        resource_policies=[
+            ACResourcePolicy(id=f"p{i}", action="add") for i in range(5)
+        ],
+        identity_policies={"user": {"i0": ACIdentityPolicy(id="i0", action="add")}},
+    )
+    chain.proof_of_work(block)
+    assert chain.add_block(block)
+
+    proof = block.inclusion_proof(("resource_policies", "p3"))
+    assert proof["root"] == block.header["merkle_root"]
+    assert verify_proof(proof["leaf"].encode(), proof["proof"], proof["root"])
+    proof = block.inclusion_proof(("identity_policies", "user", "i0"))
+    assert verify_proof(proof["leaf"].encode(), proof["proof"], proof["root"])
+    assert block.inclusion_proof(("resource_policies", "missing")) is None
+
+    # The leaves do not depend on whether the body has been parsed
+    data = block.to_dict()
+    lazy = ACBlock(
+        **{key: val for key, val in data.items() if key != "body"},
+        raw_body=ACBlockBody.serialize(data["body"]),
+    )
+    assert lazy.compute_merkle_root() == block.merkle_root
+    assert len(body_leaves(lazy.body_bytes)) == 6
+
+
+def test_wrong_root_is_rejected():
+    chain = ACBlockchain(difficulty=1)
+    block = ACBlock(
+        index=1,
+        timestamp="1",
+        previous_hash=chain.get_last_bloc.compute_hash(),
+        resource_policies=[ACResourcePolicy(id="p0", action="add")],
+    )
+    chain.proof_of_work(block)
+    block.body.resource_policies = {}
+    with pytest.raises(InvalidChain):
+        chain.add_block(block)
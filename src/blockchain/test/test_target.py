@@ -0,0 +1,98 @@
+import hashlib
+import time
+
+import pytest
+
+from ..ac_block import ACBlock
+from ..ac_blockchain import ACBlockchain
+from ..errors import InvalidChain
+from ..target import (
+    MAX_ADJUSTMENT,
+    difficulty_to_target,
+    expected_hashes,
+    meets_target,
+    next_target,
+)
+
+
+def test_difficulty_target_matches_leading_zeros():
+    target = difficulty_to_target(3)
+    for i in range(2000):
+        digest = hashlib.sha256(str(i).encode()).digest()
+        assert meets_target(digest, target) == digest.hex().startswith("000")
+    assert expected_hashes(target) == 16**3
+
+
+def make_headers(times: list[float], target: int) -> list[dict]:
+    return [
+        {"index": i, "timestamp": timestamp, "target": target}
+        for i, timestamp in enumerate(times)
+    ]
+
+
+def test_target_is_kept_between_retargets():
+    headers = make_headers([0, 1, 2, 3], target=1000)
+    assert next_target(headers.__getitem__, 3, 5, 4, 10.0) == 1000
+    assert next_target(headers.__getitem__, 3, 5, None, 10.0) == 1000
+
+
+def test_retarget_follows_block_interval():
+    target = 2**200
+    # Blocks came twice as fast as wanted, the target halves
+    headers = make_headers([0, 5, 10, 15, 20], target)
+    assert next_target(headers.__getitem__, 4, 0, 4, 10.0) == target // 2
+    # Blocks came twice as slow, the target doubles
+    headers = make_headers([0, 20, 40, 60, 80], target)
+    assert next_target(headers.__getitem__, 4, 0, 4, 10.0) == target * 2
+    # The adjustment is clamped
+    headers = make_headers([0, 0, 0, 0, 0], target)
+    assert next_target(headers.__getitem__, 4, 0, 4, 10.0) == target // MAX_ADJUSTMENT
+
+
+def stamp_next(chain: ACBlockchain, timestamp: float) -> ACBlock:
+    block = ACBlock(
+        index=chain.get_last_bloc.index + 1,
+        timestamp=str(timestamp),
+        previous_hash=chain.get_last_bloc.compute_hash(),
+        target=chain.next_target(),
+    )
+    chain.proof_of_work(block)
+    return block
+
+
+def test_mined_chain_follows_schedule():
+    chain = ACBlockchain(difficulty=1, retarget_interval=2, block_interval_s=1000.0)
+    now = time.time()
+    for i in range(4):
+        assert chain.add_block(stamp_next(chain, now + i + 1))
+    # Blocks were stamped one second apart instead of a thousand, so the target has shrunk
+    assert chain.chain[-1].target < difficulty_to_target(1)
+    assert chain.is_chain_valid(full=True)
+
+    copy = ACBlockchain(difficulty=1, retarget_interval=2, block_interval_s=1000.0)
+    assert copy.create_blockchain_from_request(chain.to_dict()["chain"])
+
+
+def test_easier_target_is_rejected():
+    chain = ACBlockchain(difficulty=2)
+    block = ACBlock(
+        index=1,
+        timestamp="1",
+        previous_hash=chain.get_last_bloc.compute_hash(),
+        target=difficulty_to_target(0),
+    )
+    chain.proof_of_work(block)
+    with pytest.raises(InvalidChain):
+        chain.add_block(block)
+
+
+@pytest.mark.parametrize("offset_s", [-3600.0, 3600.0])
+def test_timewarped_block_is_rejected(offset_s):
+    chain = ACBlockchain(difficulty=1, retarget_interval=2, block_interval_s=1000.0)
+    now = time.time()
+    for i in range(3):
+        assert chain.add_block(stamp_next(chain, now + i + 1))
+    # Back-dated before the median time of the blocks before it, or stamped past the allowed drift
+    with pytest.raises(InvalidChain):
+        chain.add_block(stamp_next(chain, now + offset_s))
+    assert chain.add_block(stamp_next(chain, now + 4))
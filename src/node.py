@@ -1,6 +1,12 @@
 from abc import ABC
+import json
+from blockchain.ac_block import ACBlock, ACBlockBody
 from blockchain.blockchain import BlockChain
+from blockchain.consensus import ConsensusEngine
+from blockchain.errors import InvalidChain
+from blockchain.header_chain import HeaderChain
 from typing import Callable
+import requests
 
 """
 Much of the theory behind the implementation and design choices has been taken by the following paper: https://nvlpubs.nist.gov/nistpubs/ir/2022/NIST.IR.8403.pdf
@@ -13,10 +19,138 @@ class ACNode(ABC):
 
 class LightNode(ACNode):
     """a node that does not store or maintain a copy of the
-    blockchain. Lightweight nodes must pass their transactions to full nodes."""
+    blockchain. Lightweight nodes must pass their transactions to full nodes.
+    It keeps only the headers of the chain, verified against the consensus engine of the full nodes, so that the
+    proofs the full nodes give that a policy is in a block can be checked locally."""
 
-    def pass_transactions(self):
-        pass
+    def __init__(
+        self,
+        peers: set[str],
+        consensus: ConsensusEngine,
+        window: int = 100,
+        timeout_s: float = 2.0,
+    ):
+        """
+        :param peers: The addresses of the full nodes
+        :param consensus: The engine the full nodes seal the blocks with
+        :param window: How many of the last headers are kept in full, see HeaderChain
+        :param timeout_s: How long a full node is waited for
+        """
+        self.peers = peers
+        self.consensus = consensus
+        self.window = window
+        self.timeout_s = timeout_s
+        self.headers: HeaderChain | None = None
+
+    def _get(self, peer: str, path: str, **params) -> dict:
+        response = requests.get(
+            f"http://{peer}{path}", params=params, timeout=self.timeout_s
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def sync(self) -> int:
+        """
+        This function downloads the new headers from the first full node that answers and verifies them
+        :return: How many headers have been appended
+        """
+        errors = []
+        for peer in self.peers:
+            try:
+                return self.sync_from(peer)
+            except (requests.exceptions.RequestException, InvalidChain) as e:
+                errors.append(f"{peer}: {e}")
+        raise ConnectionError(f"No full node could be synced from: {errors}")
+
+    def sync_from(self, peer: str) -> int:
+        if self.headers is None:
+            # The genesis block is the anchor of the chain, it is the only block downloaded with its body
+            genesis = self._get(peer, "/blocks", start=0, end=1)["blocks"][0]
+            header = {key: val for key, val in genesis.items() if key != "body"}
+            block = ACBlock(**header, raw_body=ACBlockBody.serialize(genesis["body"]))
+            self.headers = HeaderChain(
+                self.consensus, header, block.compute_hash(), self.window
+            )
+        height = self.headers.height
+        new_headers = self._get(peer, "/headers", start=height + 1)["headers"]
+        if new_headers and new_headers[0]["previous_hash"] != self.headers.hash_at(
+            height
+        ):
+            # The chain of the full node forks off ours, the headers are downloaded again from the oldest block
+            # that could still be reorganized
+            start = max(self.headers.base + 1, height - self.window + 2)
+            new_headers = self._get(peer, "/headers", start=start)["headers"]
+        return self.headers.add_headers(new_headers)
+
+    def pass_transactions(self, policies: list[dict]) -> dict:
+        """
+        This function hands a batch of policies to the first full node that accepts it, straight away. The routes of
+        the light node batch the policies of their clients with the TransactionForwarder instead.
+        :param policies: The policies, as accepted by /add-policies
+        :return: The answer of the full node
+        """
+        errors = []
+        for peer in self.peers:
+            try:
+                response = requests.post(
+                    f"http://{peer}/add-policies",
+                    json=policies,
+                    timeout=self.timeout_s,
+                )
+            except requests.exceptions.RequestException as e:
+                errors.append(f"{peer}: {e}")
+                continue
+            if response.status_code == 201:
+                return response.json()
+            errors.append(f"{peer}: {response.status_code}")
+        raise ConnectionError(f"No full node accepted the transactions: {errors}")
+
+    def verify_policy(
+        self, height: int, policy_id: str, user_id: str | None = None
+    ) -> dict:
+        """
+        This function asks a full node for the proof that a policy is in the block at the given height, and checks it
+        against the merkle root of the header of that block
+        :param height:
+        :param policy_id:
+        :param user_id: The user the identity policy belongs to, None for a resource policy
+        :return: The policy as stored in the block
+        """
+        if self.headers is None or height > self.headers.height:
+            self.sync()
+        params = {"height": height, "policy_id": policy_id}
+        if user_id is not None:
+            params["user_id"] = user_id
+        # The leaf must be the one asked for, a peer could otherwise prove another policy of the same block
+        if user_id is not None:
+            key = ["identity_policies", user_id, policy_id]
+        else:
+            key = ["resource_policies", policy_id]
+        errors = []
+        for peer in self.peers:
+            try:
+                proof = self._get(peer, "/merkle-proof", **params)
+            except requests.exceptions.HTTPError as e:
+                if e.response.status_code == 404:
+                    raise LookupError(f"Block #{height} holds no policy {policy_id}")
+                errors.append(f"{peer}: {e}")
+                continue
+            except requests.exceptions.RequestException as e:
+                errors.append(f"{peer}: {e}")
+                continue
+            if not self.headers.verify_inclusion(
+                height, proof["leaf"].encode(), proof["proof"]
+            ):
+                raise InvalidChain(
+                    f"The proof of {peer} does not match header #{height}"
+                )
+            leaf = json.loads(proof["leaf"])
+            if leaf[:-1] != key:
+                raise InvalidChain(
+                    f"The proof of {peer} is not for the policy {policy_id}"
+                )
+            return leaf[-1]
+        raise ConnectionError(f"No full node proved the policy: {errors}")
 
 
 class PublishingNode(ACNode):
@@ -0,0 +1,82 @@
+"""This script measures how many tokens per second a node issues and verifies, and how many challenge signatures it
+verifies, with each of the key algorithms it supports. Tokens are verified through the path the routes use:
+verify_token, which checks the issuer and the signature, and decode_and_verify_jwt_signature, which answers from the
+verified-token cache once the token has been verified. It is run from the src directory with
+
+    python -m scripts.bench_tokens [iterations]
+"""
+
+import sys
+import time
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+
+from app.security import (
+    decode_and_verify_jwt_signature,
+    generate_private_key,
+    get_issuers,
+    sign_with,
+    verify_token,
+    verify_with,
+)
+
+ALGORITHMS = ("RS256", "ES256", "EdDSA")
+
+
+def throughput(operation, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        operation()
+    return iterations / (time.perf_counter() - started)
+
+
+def bench(algorithm: str, iterations: int) -> dict:
+    private_key = generate_private_key(algorithm)
+    public_key = private_key.public_key()
+    key_hex = public_key.public_bytes(
+        encoding=serialization.Encoding.OpenSSH,
+        format=serialization.PublicFormat.OpenSSH,
+    ).hex()
+    # The tokens are issued by another node, which the node verifying them trusts
+    get_issuers().add(key_hex)
+    claims = {
+        "sub": key_hex,
+        "client_id": "bench",
+        "iss": key_hex,
+        "iat": time.time(),
+        "exp": time.time() + 3600,
+    }
+    token = jwt.encode(claims, private_key, algorithm=algorithm)
+    challenge = b'{"nonce":"0","domain":"bench","expire":0}'
+    signature = sign_with(private_key, challenge)
+    decode_and_verify_jwt_signature(token)
+    return {
+        "algorithm": algorithm,
+        "issue/s": throughput(
+            lambda: jwt.encode(claims, private_key, algorithm=algorithm), iterations
+        ),
+        "verify/s": throughput(lambda: verify_token(token), iterations),
+        "cached/s": throughput(
+            lambda: decode_and_verify_jwt_signature(token), iterations
+        ),
+        "challenge/s": throughput(
+            lambda: verify_with(public_key, challenge, signature), iterations
+        ),
+        "key bytes": len(key_hex) // 2,
+        "token bytes": len(token),
+    }
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    results = [bench(algorithm, iterations) for algorithm in ALGORITHMS]
+    columns = list(results[0])
+    print("".join(f"{column:>14}" for column in columns))
+    for result in results:
+        print(
+            "".join(
+                f"{value:>14.0f}" if isinstance(value, float) else f"{value:>14}"
+                for value in result.values()
+            )
+        )